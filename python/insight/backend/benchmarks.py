@@ -0,0 +1,285 @@
+import argparse
+import contextlib
+import itertools
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+import uuid
+from typing import Callable, List, Mapping, Sequence
+
+import h5py
+import numpy as np
+
+import modeling.assembled_models as am
+from experiments import write_batch_result
+from modeling.common.serializers import serialize
+from modeling.layers import LinearLayer, QuadraticLayer
+from modeling.precision import policies
+from modeling.trainers import ClosedFormFunctionTrainer
+
+layer_types = {
+    LinearLayer.__name__: LinearLayer,
+    QuadraticLayer.__name__: QuadraticLayer
+}
+
+updaters = {updater.name: updater for updater in
+            (am.simple_updater, am.adaptive_updater, am.error_regularized_updater)}
+
+TARGET_FUNCTION = "lambda x: x[0] * math.sin(x[0])"
+
+
+class BenchmarkConfig:
+    """
+    The network and batch a benchmark runs on. The network has one input, one output and depth
+    hidden layers of width nodes.
+    """
+
+    def __init__(self, layer: str, depth: int, width: int, batch_size: int,
+                 updater: str = am.simple_updater.name, dtype: str = "float64"):
+        if layer not in layer_types:
+            raise ValueError(layer + " is not a known layer type")
+        if updater not in updaters:
+            raise ValueError(updater + " is not a known updater")
+        if dtype not in policies:
+            raise ValueError(dtype + " is not a known dtype policy")
+        self.layer = layer
+        self.depth = depth
+        self.width = width
+        self.batch_size = batch_size
+        self.updater = updater
+        self.dtype = dtype
+
+    @property
+    def nodes(self) -> List[int]:
+        return [1] + [self.width] * self.depth + [1]
+
+    def to_dict(self) -> dict:
+        return {
+            'layer': self.layer,
+            'depth': self.depth,
+            'width': self.width,
+            'batchSize': self.batch_size,
+            'updater': self.updater,
+            'dtype': self.dtype
+        }
+
+
+def create_trainer(config: BenchmarkConfig) -> ClosedFormFunctionTrainer:
+    np.random.seed(0)
+    network = am.feed_forward_network(layer_types[config.layer], config.nodes,
+                                      updaters[config.updater], policies[config.dtype])
+    return ClosedFormFunctionTrainer(network, TARGET_FUNCTION, (-5, 5), config.batch_size)
+
+
+def sample_batch(trainer: ClosedFormFunctionTrainer, batch_size: int):
+    inputs = np.random.uniform(trainer.domain[0], trainer.domain[1], (batch_size, 1))
+    return inputs, trainer.expected_outputs(inputs)
+
+
+# Each benchmark prepares a trainer and returns the call to time. Calls are repeated on the same
+# trainer, so they must be safe to run any number of times. Whatever a benchmark opens is
+# registered with resources, which are closed once the call has been timed.
+
+def forward_pass_benchmark(trainer: ClosedFormFunctionTrainer,
+                           resources: contextlib.ExitStack) -> Callable[[], object]:
+    inputs, _ = sample_batch(trainer, trainer.batch_size)
+    return lambda: trainer.network.forward_pass(inputs)
+
+
+def backward_pass_benchmark(trainer: ClosedFormFunctionTrainer,
+                            resources: contextlib.ExitStack) -> Callable[[], object]:
+    inputs, expected = sample_batch(trainer, trainer.batch_size)
+    trainer.network.forward_pass(inputs)
+    return lambda: trainer.network.backward_pass(expected)
+
+
+def adjust_benchmark(trainer: ClosedFormFunctionTrainer,
+                     resources: contextlib.ExitStack) -> Callable[[], object]:
+    inputs, expected = sample_batch(trainer, trainer.batch_size)
+    trainer.network.forward_pass(inputs)
+    trainer.network.backward_pass(expected)
+    return trainer.network.adjust_parameters
+
+
+def batch_train_benchmark(trainer: ClosedFormFunctionTrainer,
+                          resources: contextlib.ExitStack) -> Callable[[], object]:
+    return lambda: trainer.batch_train(trainer.batch_size, 1)
+
+
+def serialize_benchmark(trainer: ClosedFormFunctionTrainer,
+                        resources: contextlib.ExitStack) -> Callable[[], object]:
+    result = trainer.batch_train(trainer.batch_size, 1)
+    return lambda: serialize(result)
+
+
+def write_batch_result_benchmark(trainer: ClosedFormFunctionTrainer,
+                                 resources: contextlib.ExitStack) -> Callable[[], object]:
+    result = trainer.batch_train(trainer.batch_size, 1)
+    # An in-memory file, so the benchmark measures h5py rather than the disk.
+    file = resources.enter_context(
+        h5py.File(str(uuid.uuid4()) + '.h5', 'w', driver='core', backing_store=False))
+    return lambda: write_batch_result(file, result.batch_number, result)
+
+
+benchmarks = {
+    'forward_pass': forward_pass_benchmark,
+    'backward_pass': backward_pass_benchmark,
+    'adjust': adjust_benchmark,
+    'batch_train': batch_train_benchmark,
+    'serialize': serialize_benchmark,
+    'write_batch_result': write_batch_result_benchmark
+}
+
+# The benchmarks whose cost depends on the updater. The others only run with the first updater.
+UPDATER_BENCHMARKS = ('adjust', 'batch_train')
+
+
+class BenchmarkCase:
+    def __init__(self, benchmark: str, config: BenchmarkConfig):
+        self.benchmark = benchmark
+        self.config = config
+
+    @property
+    def key(self) -> str:
+        """
+        A name that identifies the case across result files, used to compare them.
+        """
+        config = self.config
+        key = '{0}/{1}/depth={2}/width={3}/batch={4}'.format(
+            self.benchmark, config.layer, config.depth, config.width, config.batch_size)
+        if self.benchmark in UPDATER_BENCHMARKS:
+            key += '/' + config.updater
+        if config.dtype != "float64":
+            key += '/' + config.dtype
+        return key
+
+    def run(self, repeat: int = 3, min_time: float = .05) -> dict:
+        """
+        Times the benchmark's call. Each of the repeat measurements calls it enough times to take
+        at least min_time seconds.
+        """
+        with contextlib.ExitStack() as resources:
+            call = benchmarks[self.benchmark](create_trainer(self.config), resources)
+            timer = timeit.Timer(call)
+            number = 1
+            while True:
+                elapsed = timer.timeit(number)
+                if elapsed >= min_time:
+                    break
+                number = max(number * 2, int(number * min_time / max(elapsed, 1e-9)))
+            totals = [elapsed] + timer.repeat(repeat - 1, number)
+        seconds = [total / number for total in totals]
+        best = min(seconds)
+        return {
+            'benchmark': self.benchmark,
+            'config': self.config.to_dict(),
+            'number': number,
+            'best': best,
+            'median': statistics.median(seconds),
+            'samplesPerSecond': self.config.batch_size / best
+        }
+
+
+def cases(names: Sequence[str] = tuple(benchmarks.keys()),
+          layers: Sequence[str] = tuple(layer_types.keys()),
+          depths: Sequence[int] = (1, 3),
+          widths: Sequence[int] = (4, 16, 64),
+          batch_sizes: Sequence[int] = (1, 16, 256),
+          updater_names: Sequence[str] = tuple(updaters.keys()),
+          dtypes: Sequence[str] = ("float64",)) -> List[BenchmarkCase]:
+    result = []
+    for name in names:
+        if name not in benchmarks:
+            raise ValueError(name + " is not a known benchmark")
+        names_for_case = updater_names if name in UPDATER_BENCHMARKS else updater_names[:1]
+        for layer, depth, width, batch_size, updater, dtype in itertools.product(
+                layers, depths, widths, batch_sizes, names_for_case, dtypes):
+            result.append(BenchmarkCase(
+                name, BenchmarkConfig(layer, depth, width, batch_size, updater, dtype)))
+    return result
+
+
+def metadata() -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor()
+    }
+
+
+def run(benchmark_cases: Sequence[BenchmarkCase], repeat: int = 3, min_time: float = .05,
+        log: Callable[[str], None] = print) -> dict:
+    results = {}
+    for case in benchmark_cases:
+        results[case.key] = case.run(repeat, min_time)
+        log('{0:<76} {1:>12.1f} us {2:>14.0f} samples/s'.format(
+            case.key, results[case.key]['best'] * 1e6, results[case.key]['samplesPerSecond']))
+    return {'metadata': metadata(), 'results': results}
+
+
+def compare(baseline: Mapping, current: Mapping, threshold: float = .1) -> List[dict]:
+    """
+    The cases in both result files, with the ratio of their current to their baseline best time.
+    A case regressed when the ratio is above 1 + threshold.
+    """
+    comparison = []
+    for key, result in current['results'].items():
+        base = baseline['results'].get(key)
+        if base is None:
+            continue
+        ratio = result['best'] / base['best']
+        comparison.append({'key': key, 'baseline': base['best'], 'current': result['best'],
+                           'ratio': ratio, 'regressed': ratio > 1 + threshold})
+    return comparison
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark the modeling hot paths.')
+    parser.add_argument('--benchmarks', nargs='+', default=list(benchmarks.keys()))
+    parser.add_argument('--layers', nargs='+', default=list(layer_types.keys()))
+    parser.add_argument('--depths', nargs='+', type=int, default=[1, 3])
+    parser.add_argument('--widths', nargs='+', type=int, default=[4, 16, 64])
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=[1, 16, 256])
+    parser.add_argument('--updaters', nargs='+', default=list(updaters.keys()))
+    parser.add_argument('--dtypes', nargs='+', default=['float64'])
+    parser.add_argument('--filter', default=None, help='Only run cases whose key contains this.')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--min-time', type=float, default=.05,
+                        help='Seconds each measurement runs for at least.')
+    parser.add_argument('--output', default=None, help='Write the results to this JSON file.')
+    parser.add_argument('--compare', default=None,
+                        help='A results file to compare against. Exits with 1 on regressions.')
+    parser.add_argument('--threshold', type=float, default=.1,
+                        help='Slowdown ratio above 1 that counts as a regression.')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    selected = [case for case in cases(args.benchmarks, args.layers, args.depths, args.widths,
+                                       args.batch_sizes, args.updaters, args.dtypes)
+                if args.filter is None or args.filter in case.key]
+    results = run(selected, args.repeat, args.min_time)
+    if args.output is not None:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+
+    if args.compare is not None:
+        with open(args.compare) as baseline_file:
+            comparison = compare(json.load(baseline_file), results, args.threshold)
+        for row in comparison:
+            print('{0:<76} {1:>6.2f}x{2}'.format(row['key'], row['ratio'],
+                                                 '  REGRESSED' if row['regressed'] else ''))
+        sys.exit(1 if any(row['regressed'] for row in comparison) else 0)
@@ -0,0 +1,58 @@
+import contextlib
+import unittest
+
+import h5py
+
+import benchmarks
+from benchmarks import BenchmarkCase, BenchmarkConfig, cases, compare
+
+
+class BenchmarksTest(unittest.TestCase):
+    def test_cases_only_sweep_updaters_where_they_matter(self):
+        selected = cases(depths=(1,), widths=(4,), batch_sizes=(2,))
+        keys = [case.key for case in selected]
+        self.assertEqual(len(keys), len(set(keys)))
+        adjust = [key for key in keys if key.startswith('adjust/LinearLayer')]
+        self.assertEqual(len(adjust), len(benchmarks.updaters))
+        forward = [key for key in keys if key.startswith('forward_pass/')]
+        self.assertEqual(forward, ['forward_pass/LinearLayer/depth=1/width=4/batch=2',
+                                   'forward_pass/QuadraticLayer/depth=1/width=4/batch=2'])
+
+    def test_unknown_names(self):
+        with self.assertRaises(ValueError):
+            cases(names=('nothing',))
+        with self.assertRaises(ValueError):
+            BenchmarkConfig('DenseLayer', 1, 4, 2)
+
+    def test_every_benchmark_runs(self):
+        for name in benchmarks.benchmarks:
+            for dtype in ('float64', 'float32'):
+                case = BenchmarkCase(name, BenchmarkConfig('QuadraticLayer', 2, 3, 4, dtype=dtype))
+                result = case.run(repeat=2, min_time=0)
+                self.assertGreater(result['best'], 0)
+                self.assertLessEqual(result['best'], result['median'])
+
+    def test_resources_are_closed(self):
+        def open_files():
+            return h5py.h5f.get_obj_count(h5py.h5f.OBJ_ALL, h5py.h5f.OBJ_FILE)
+
+        before = open_files()
+        trainer = benchmarks.create_trainer(BenchmarkConfig('LinearLayer', 1, 3, 4))
+        with contextlib.ExitStack() as resources:
+            call = benchmarks.write_batch_result_benchmark(trainer, resources)
+            call()
+            self.assertEqual(open_files(), before + 1)
+        self.assertEqual(open_files(), before)
+
+    def test_compare(self):
+        baseline = {'results': {'a': {'best': 1.}, 'b': {'best': 2.}}}
+        current = {'results': {'a': {'best': 1.05}, 'b': {'best': 3.}, 'c': {'best': 1.}}}
+        comparison = {row['key']: row for row in compare(baseline, current, threshold=.1)}
+        self.assertEqual(set(comparison), {'a', 'b'})
+        self.assertFalse(comparison['a']['regressed'])
+        self.assertTrue(comparison['b']['regressed'])
+        self.assertAlmostEqual(comparison['b']['ratio'], 1.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,6 @@
 import random
 from typing import Sequence, Mapping, Tuple, Callable
 
-import multiprocessing
 import numpy as np
 import h5py
 import time
@@ -14,8 +13,9 @@ from modeling.parameter_generators import RandomParameterGenerator, SequencePara
     ConstantParameterGenerator
 from modeling.parameter_updaters import ParameterUpdater, LargestGradientsOnly, \
     DeltaParameterUpdateStep, FlatGradient, LogScaledDelta, DecreasingLearningRate, Momentum, \
-    FlatLearningRate, ClampedDelta
-from modeling.trainers import ClosedFormFunctionTrainer, BatchResult
+    FlatLearningRate, ClampedDelta, DeltaTracer
+from modeling.precision import DTypePolicy, FLOAT64
+from modeling.trainers import ClosedFormFunctionTrainer, BatchResult, ValidationResult
 
 
 class Group:
@@ -33,6 +33,7 @@ class Dataset:
     EPOCHS = 'epochs'
     LAYERS = 'layers'
     BATCH_SIZE = 'batch_size'
+    RECORDING_STRIDE = 'recording_stride'
 
 
 def close_file(file: h5py.File):
@@ -56,10 +57,8 @@ def write_parameters(file: h5py.File, rows: int, epoch: int,
             get_dataset(param_group.require_group(params.name), "gradients", rows,
                         np.shape(params.gradients))[epoch] = params.gradients
 
-            delta_values = np.reshape([delta.value for delta in params.deltas.flatten()],
-                                      params.deltas.shape)
             get_dataset(param_group.require_group(params.name), "delta_values", rows,
-                        np.shape(delta_values))[epoch] = delta_values
+                        np.shape(params.delta_values))[epoch] = params.delta_values
 
             # TODO: Record the delta steps.
 
@@ -74,6 +73,156 @@ def write_batch_result(file: h5py.File, rows: int, result: BatchResult):
     get_dataset(file, Group.ACTUAL, rows, np.shape(result.actual))[epoch] = result.actual
 
 
+def write_validation(file: h5py.File, validation: ValidationResult):
+    group = file.require_group(Group.VALIDATION)
+    group.create_dataset('error', data=validation.error)
+    group.create_dataset('sample_count', data=validation.sample_count)
+    group.create_dataset('inputs', data=validation.inputs)
+    group.create_dataset('expected', data=validation.expected)
+    group.create_dataset('actual', data=validation.actual)
+
+
+# HDF5 rejects chunks of 4 GiB or more, and reads and writes whole chunks, so chunks are kept to a
+# size that is cheap to read back a row range from.
+MAX_CHUNK_BYTES = 2 ** 20
+
+
+class DatasetOptions:
+    """
+    HDF5 storage options for a dataset written by ExperimentRecorder.
+    """
+
+    def __init__(self, chunk_rows: int = None, compression: str = None, compression_opts=None):
+        """
+        :param chunk_rows: Rows per HDF5 chunk. Defaults to the recorder's buffer size, so each
+            flush writes whole chunks. Chunks are capped at MAX_CHUNK_BYTES either way.
+        :param compression: An h5py compression filter, eg. 'gzip' or 'lzf'.
+        """
+        self.chunk_rows = chunk_rows
+        self.compression = compression
+        self.compression_opts = compression_opts
+
+
+class ExperimentRecorder:
+    """
+    Records batch results into an HDF5 file. Datasets are created once, on the first recorded
+    result, and rows are buffered in memory and written in contiguous slabs.
+    """
+
+    def __init__(self,
+                 file: h5py.File,
+                 epochs: int,
+                 buffer_size: int = 1000,
+                 stride: int = 1,
+                 options: Mapping[str, DatasetOptions] = None,
+                 default_options: DatasetOptions = None,
+                 dtype: np.dtype = np.dtype(float),
+                 max_buffer_bytes: int = 256 * 2 ** 20):
+        """
+        :param epochs: Number of epochs that will be trained.
+        :param buffer_size: Number of recorded epochs to keep in memory between writes. Fewer are
+            kept when buffer_size epochs would take more than max_buffer_bytes.
+        :param stride: Only every stride-th epoch is recorded. Row i holds epoch i * stride.
+        :param options: Storage options keyed by dataset path, eg. 'parameters/level_0_fx_weights/
+            values'. Datasets that are not in the mapping use default_options.
+        :param dtype: The type values are stored as, eg. np.float32 for a float32 network.
+        """
+        if buffer_size < 1 or stride < 1:
+            raise ValueError("buffer_size and stride must be at least 1")
+        self.file = file
+        self.epochs = epochs
+        self.rows = (epochs + stride - 1) // stride
+        self.buffer_size = buffer_size
+        self.stride = stride
+        self.options = options or {}
+        self.default_options = default_options or DatasetOptions()
+        self.dtype = np.dtype(dtype)
+        self.max_buffer_bytes = max_buffer_bytes
+        self._datasets = None
+        self._buffers = None
+        self._buffer_rows = 0
+        self._buffer_start = 0
+        self._buffered_rows = 0
+        file.require_group(Group.CONFIGURATION).create_dataset(Dataset.RECORDING_STRIDE,
+                                                               data=stride)
+
+    def record(self, result: BatchResult):
+        epoch = result.batch_number - 1
+        if epoch >= self.epochs:
+            raise ValueError("Batch {0} is past the {1} epochs the recorder was created for".format(
+                result.batch_number, self.epochs))
+        if epoch % self.stride != 0:
+            return
+        row = epoch // self.stride
+
+        values = self._result_values(result)
+        if self._datasets is None:
+            self._create_datasets(values)
+        if self._buffered_rows > 0 and row != self._buffer_start + self._buffered_rows:
+            self.flush()
+        if self._buffered_rows == 0:
+            self._buffer_start = row
+
+        for path, value in values:
+            self._buffers[path][self._buffered_rows] = value
+        self._buffered_rows += 1
+
+        if self._buffered_rows == self._buffer_rows or row == self.rows - 1:
+            self.flush()
+
+    def flush(self):
+        if self._buffered_rows == 0:
+            return
+        start = self._buffer_start
+        stop = start + self._buffered_rows
+        for path, dataset in self._datasets.items():
+            dataset[start:stop] = self._buffers[path][:self._buffered_rows]
+        self._buffered_rows = 0
+
+    def close(self):
+        self.flush()
+        close_file(self.file)
+
+    @staticmethod
+    def _result_values(result: BatchResult) -> Sequence[Tuple[str, np.ndarray]]:
+        values = [(Group.TOTAL_ERROR, result.total_error),
+                  (Group.AVERAGE_ERROR, result.avg_error)]
+        for param_set_map in result.parameters:
+            for params in param_set_map.values():
+                path = Group.PARAMETERS + '/' + params.name + '/'
+                values.append((path + 'values', params.values))
+                values.append((path + 'gradients', params.gradients))
+                values.append((path + 'delta_values', params.delta_values))
+        values.append((Group.INPUTS, result.inputs))
+        values.append((Group.EXPECTED, result.expected))
+        values.append((Group.ACTUAL, result.actual))
+        return values
+
+    def _create_datasets(self, values: Sequence[Tuple[str, np.ndarray]]):
+        self._datasets = {}
+        self._buffers = {}
+        row_bytes = sum(int(np.prod(np.shape(value), dtype=int)) for _, value in values) * \
+            self.dtype.itemsize
+        self._buffer_rows = max(1, min(self.buffer_size, self.rows,
+                                       self.max_buffer_bytes // max(row_bytes, 1)))
+        for path, value in values:
+            shape = np.shape(value)
+            options = self.options.get(path, self.default_options)
+            self._datasets[path] = self.file.require_dataset(
+                path, (self.rows,) + shape, self.dtype,
+                chunks=self._chunks(shape, options.chunk_rows or self._buffer_rows),
+                compression=options.compression,
+                compression_opts=options.compression_opts)
+            self._buffers[path] = np.empty((self._buffer_rows,) + shape, dtype=self.dtype)
+
+    def _chunks(self, shape: Tuple[int, ...], chunk_rows: int):
+        value_bytes = int(np.prod(shape, dtype=int)) * self.dtype.itemsize
+        if value_bytes > MAX_CHUNK_BYTES:
+            # A single row doesn't fit a chunk, so let h5py split the rows as well.
+            return True
+        return (max(1, min(chunk_rows, self.rows, MAX_CHUNK_BYTES // max(value_bytes, 1))),) + shape
+
+
 def simple_updater(epochs: int, learning_rate: float, epoch_getter: Callable[[], int]):
     keep_rate = 1
 
@@ -88,12 +237,14 @@ def simple_updater(epochs: int, learning_rate: float, epoch_getter: Callable[[],
 
     # Only update the parameters that contributed most to the error.
     steps.append(LargestGradientsOnly(keep_rate=keep_rate))
-    return ParameterUpdater(steps)
+    # Delta steps are not written to the output file, so don't record them.
+    return ParameterUpdater(steps, tracer=DeltaTracer.off())
 
 
 def create_network(layer: Callable[..., Layer],
                    nodes: Sequence[int],
-                   updater: Callable[[FeedForward], ParameterUpdater]):
+                   updater: Callable[[FeedForward], ParameterUpdater],
+                   dtype_policy: DTypePolicy = FLOAT64):
     layers = []
     network = FeedForward(layers)
 
@@ -109,8 +260,9 @@ def create_network(layer: Callable[..., Layer],
                   activation=activation,
                   parameter_updater=updater(network),
                   # parameter_generator=ConstantParameterGenerator())
-                  parameter_generator=RandomParameterGenerator())
-                  # parameter_generator=SequenceParameterGenerator())
+                  parameter_generator=RandomParameterGenerator(),
+                  # parameter_generator=SequenceParameterGenerator(),
+                  dtype_policy=dtype_policy)
         )
     return network
 
@@ -132,6 +284,7 @@ def quad(run: int):
     file.require_group(Group.CONFIGURATION).create_dataset(Dataset.EPOCHS, data=epochs)
     file.require_group(Group.CONFIGURATION).create_dataset(Dataset.BATCH_SIZE, data=batch_size)
     file.require_group(Group.CONFIGURATION).create_dataset(Dataset.LAYERS, data=nodes)
+    recorder = ExperimentRecorder(file, epochs)
     stop_time = time.time()
     print("setup:", stop_time - start_time)
 
@@ -139,27 +292,18 @@ def quad(run: int):
     # Train the model.
     for i in range(epochs):
         epoch = i
-        result = trainer.batch_train(batch_size)
-        write_batch_result(file, epochs, result)
+        result = trainer.batch_train(batch_size, 1)
+        recorder.record(result)
         if epoch % 100 == 0:
             print("run_" + str(run) + ":", epoch)
 
     # Validate the final model.
-    validation = trainer.validate()
-    file.require_group(Group.VALIDATION).create_dataset('error', data=validation.error)
-    file.require_group(Group.VALIDATION).create_dataset('inputs', data=validation.inputs)
-    file.require_group(Group.VALIDATION).create_dataset('expected', data=validation.expected)
-    file.require_group(Group.VALIDATION).create_dataset('actual', data=validation.actual)
+    write_validation(file, trainer.validate())
 
     stop_time = time.time()
     print("experiment", stop_time - start_time)
 
     start_time = time.time()
-    close_file(file)
+    recorder.close()
     stop_time = time.time()
     print("output:", stop_time - start_time)
-
-
-if __name__ == "__main__":
-    pool = multiprocessing.Pool(7)
-    pool.map(quad, range(7))
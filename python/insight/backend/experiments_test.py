@@ -0,0 +1,91 @@
+import unittest
+import uuid
+
+import h5py
+import numpy as np
+
+from experiments import ExperimentRecorder, DatasetOptions, Group, MAX_CHUNK_BYTES, \
+    create_network, simple_updater
+from modeling.layers import LinearLayer
+from modeling.trainers import ClosedFormFunctionTrainer
+
+
+def in_memory_file() -> h5py.File:
+    return h5py.File(str(uuid.uuid4()) + '.h5', 'w', driver='core', backing_store=False)
+
+
+class ExperimentRecorderTest(unittest.TestCase):
+    def setUp(self):
+        network = create_network(LinearLayer, [1, 3, 1], lambda net: simple_updater(10, .01, None))
+        self.trainer = ClosedFormFunctionTrainer(network, "lambda x: x[0] * 2", (-1, 1), 2)
+        self.file = in_memory_file()
+
+    def tearDown(self):
+        self.file.close()
+
+    def train(self, recorder: ExperimentRecorder, epochs: int):
+        """
+        Trains and records epochs batches, and returns the total error and first layer weights of
+        every batch, copied when they were recorded.
+        """
+        errors = []
+        weights = []
+        for _ in range(epochs):
+            result = self.trainer.batch_train(2, 1)
+            errors.append(result.total_error)
+            weights.append(np.copy(result.parameters[0]["level_0_fx_weights"].values))
+            recorder.record(result)
+        return errors, weights
+
+    def test_records_every_epoch(self):
+        recorder = ExperimentRecorder(self.file, 7, buffer_size=3)
+        errors, weights = self.train(recorder, 7)
+
+        np.testing.assert_allclose(self.file[Group.TOTAL_ERROR], errors)
+        np.testing.assert_allclose(self.file["parameters/level_0_fx_weights/values"], weights)
+        self.assertEqual(self.file[Group.INPUTS].shape, (7, 2, 1))
+
+    def test_flushes_full_buffers_only(self):
+        recorder = ExperimentRecorder(self.file, 10, buffer_size=4)
+        errors, _ = self.train(recorder, 5)
+
+        np.testing.assert_allclose(self.file[Group.TOTAL_ERROR][:4], errors[:4])
+        np.testing.assert_array_equal(self.file[Group.TOTAL_ERROR][4:], 0)
+        recorder.flush()
+        np.testing.assert_allclose(self.file[Group.TOTAL_ERROR][:5], errors)
+
+    def test_stride(self):
+        recorder = ExperimentRecorder(self.file, 8, buffer_size=2, stride=3)
+        errors, _ = self.train(recorder, 8)
+
+        self.assertEqual(self.file[Group.TOTAL_ERROR].shape, (3,))
+        np.testing.assert_allclose(self.file[Group.TOTAL_ERROR], errors[::3])
+        self.assertEqual(self.file["configuration/recording_stride"][()], 3)
+
+    def test_record_past_epochs(self):
+        recorder = ExperimentRecorder(self.file, 2)
+        self.train(recorder, 2)
+        with self.assertRaises(ValueError):
+            self.train(recorder, 1)
+
+    def test_caps_buffer_and_chunk_bytes(self):
+        recorder = ExperimentRecorder(self.file, 1000, buffer_size=1000,
+                                      default_options=DatasetOptions(chunk_rows=10 ** 6),
+                                      max_buffer_bytes=1000)
+        self.train(recorder, 1)
+
+        self.assertLessEqual(sum(buffer.nbytes for buffer in recorder._buffers.values()), 1000)
+        for dataset in recorder._datasets.values():
+            self.assertLessEqual(np.prod(dataset.chunks) * dataset.dtype.itemsize,
+                                 MAX_CHUNK_BYTES)
+
+    def test_default_options_are_not_shared(self):
+        other_file = in_memory_file()
+        first = ExperimentRecorder(self.file, 1)
+        second = ExperimentRecorder(other_file, 1)
+        self.assertIsNot(first.default_options, second.default_options)
+        other_file.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
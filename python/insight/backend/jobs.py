@@ -0,0 +1,248 @@
+import queue
+import threading
+import time
+import uuid
+from typing import Callable, Iterator, List, Mapping
+
+from modeling.trainers import Trainer, BatchResult
+
+
+class JobState:
+    PENDING = "PENDING"
+    RUNNING = "RUNNING"
+    PAUSED = "PAUSED"
+    CANCELLED = "CANCELLED"
+    COMPLETE = "COMPLETE"
+    FAILED = "FAILED"
+
+    FINISHED = (CANCELLED, COMPLETE, FAILED)
+
+
+class NetworkBusyError(Exception):
+    """
+    Raised when a job is added for a network that another unfinished job is already training.
+    """
+
+
+class TrainingJob:
+    """
+    Calls trainer.batch_train(batch_size, epochs) batch_count times on a worker thread and
+    publishes a progress event after each call to every subscriber. Parameters are included in
+    the progress of every parameter_stride-th batch when a stride is set.
+    """
+
+    def __init__(self, trainer: Trainer, batch_count: int, batch_size: int = 0, epochs: int = 1,
+                 parameter_stride: int = 0,
+                 serialize_parameters: Callable[[BatchResult], object] = None):
+        if batch_count < 1:
+            raise ValueError("batch_count must be at least 1")
+        self.id = str(uuid.uuid4())
+        self.trainer = trainer
+        self.batch_count = batch_count
+        self.batch_size = batch_size
+        self.epochs = epochs
+        self.parameter_stride = parameter_stride
+        self.serialize_parameters = serialize_parameters
+
+        self.state = JobState.PENDING
+        self.batches_run = 0
+        self.error = None
+        self.latest = None
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._resumed = threading.Event()
+        self._resumed.set()
+        self._cancelled = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="job-" + self.id, daemon=True)
+
+    @property
+    def finished(self) -> bool:
+        return self.state in JobState.FINISHED
+
+    def start(self):
+        self._set_state(JobState.RUNNING)
+        self._thread.start()
+
+    def pause(self):
+        with self._lock:
+            if self._transition(JobState.PAUSED):
+                self._resumed.clear()
+
+    def resume(self):
+        with self._lock:
+            if self._transition(JobState.RUNNING):
+                self._resumed.set()
+
+    def cancel(self):
+        self._cancelled.set()
+        # A paused job has to wake up to see that it was cancelled.
+        self._resumed.set()
+
+    def join(self, timeout: float = None):
+        self._thread.join(timeout)
+
+    def status(self) -> dict:
+        return {
+            "id": self.id,
+            "trainerId": self.trainer.id,
+            "state": self.state,
+            "batchesRun": self.batches_run,
+            "batchCount": self.batch_count,
+            "error": self.error,
+            "latest": self.latest
+        }
+
+    def subscribe(self) -> "queue.Queue":
+        """
+        Returns a queue that receives every event published from now on, starting with the
+        current status.
+        """
+        subscriber = queue.Queue()
+        with self._lock:
+            subscriber.put(("status", self.status()))
+            if self.finished:
+                subscriber.put(None)
+            else:
+                self._subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: "queue.Queue"):
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+
+    def events(self, heartbeat: float = 15.) -> Iterator[tuple]:
+        """
+        Yields (event, data) pairs until the job finishes. (None, None) is yielded when nothing
+        was published for heartbeat seconds, so streaming callers can keep the connection alive.
+        """
+        subscriber = self.subscribe()
+        try:
+            while True:
+                try:
+                    event = subscriber.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield None, None
+                    continue
+                if event is None:
+                    return
+                yield event
+        finally:
+            self.unsubscribe(subscriber)
+
+    def _publish(self, event: str, data: dict, last: bool = False):
+        with self._lock:
+            self._publish_locked(event, data, last)
+
+    def _publish_locked(self, event: str, data: dict, last: bool = False):
+        for subscriber in self._subscribers:
+            subscriber.put((event, data))
+            if last:
+                subscriber.put(None)
+        if last:
+            self._subscribers = []
+
+    def _set_state(self, state: str):
+        with self._lock:
+            self._transition(state)
+
+    def _transition(self, state: str) -> bool:
+        """
+        Moves to state and publishes the new status, unless the job already finished. Finished
+        states are final, so eg. pausing a job as it completes can't make it look active again.
+        Must be called holding the lock.
+        """
+        if self.finished:
+            return False
+        self.state = state
+        self._publish_locked("status", self.status(), last=self.finished)
+        return True
+
+    def _run(self):
+        try:
+            for batch in range(self.batch_count):
+                self._resumed.wait()
+                if self._cancelled.is_set():
+                    self._set_state(JobState.CANCELLED)
+                    return
+                start_time = time.time()
+                result = self.trainer.batch_train(self.batch_size, self.epochs)
+                progress = self._progress(batch + 1, result, time.time() - start_time)
+                with self._lock:
+                    # Updated together, so statuses never pair a new batch count with old progress.
+                    self.batches_run = batch + 1
+                    self.latest = progress
+                    self._publish_locked("progress", progress)
+            self._set_state(JobState.COMPLETE)
+        except Exception as e:
+            self.error = repr(e)
+            self._set_state(JobState.FAILED)
+
+    def _progress(self, batches_run: int, result: BatchResult, seconds: float) -> dict:
+        progress = {
+            "batchesRun": batches_run,
+            "batchNumber": result.batch_number,
+            "batchSize": result.batch_size,
+            "avgError": float(result.avg_error),
+            "seconds": seconds
+        }
+        if self.parameter_stride > 0 and self.serialize_parameters is not None and \
+                batches_run % self.parameter_stride == 0:
+            progress["parameters"] = self.serialize_parameters(result)
+        return progress
+
+
+class JobRegistry:
+    """
+    The jobs started on the server. Only the most recent max_finished finished jobs are kept, so
+    old jobs do not keep their trainers alive. on_remove is called with every job that is dropped.
+
+    A network is trained by at most one job at a time, since the trainers of a network share its
+    layers' buffers and gradients.
+    """
+
+    def __init__(self, max_finished: int = 100,
+                 on_remove: Callable[[TrainingJob], None] = None):
+        self.max_finished = max_finished
+        self.on_remove = on_remove or (lambda job: None)
+        self.jobs = {}
+        # Requests are served on several threads, which add jobs while others list them.
+        self._lock = threading.Lock()
+
+    def add(self, job: TrainingJob) -> TrainingJob:
+        """
+        Adds job, or raises NetworkBusyError if an unfinished job is training its network.
+        """
+        with self._lock:
+            network_id = job.trainer.network.id
+            if any(not other.finished and other.trainer.network.id == network_id
+                   for other in self.jobs.values()):
+                raise NetworkBusyError(network_id + " is already being trained")
+            finished = [job_id for job_id, old_job in self.jobs.items() if old_job.finished]
+            removed = [self.jobs.pop(job_id)
+                       for job_id in finished[:max(0, len(finished) - self.max_finished)]]
+            self.jobs[job.id] = job
+        for removed_job in removed:
+            self.on_remove(removed_job)
+        return job
+
+    def get(self, job_id: str) -> TrainingJob:
+        with self._lock:
+            job = self.jobs.get(job_id)
+        if job is None:
+            raise KeyError("No job found with id " + job_id)
+        return job
+
+    def active(self, target_id: str) -> List[TrainingJob]:
+        """
+        The unfinished jobs training target_id, which may be a trainer or its network.
+        """
+        return [job for job in self._jobs() if not job.finished and
+                target_id in (job.trainer.id, job.trainer.network.id)]
+
+    def statuses(self) -> List[Mapping]:
+        return [job.status() for job in self._jobs()]
+
+    def _jobs(self) -> List[TrainingJob]:
+        with self._lock:
+            return list(self.jobs.values())
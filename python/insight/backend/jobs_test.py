@@ -0,0 +1,131 @@
+import threading
+import unittest
+
+from jobs import TrainingJob, JobState, JobRegistry, NetworkBusyError
+
+
+class FakeResult:
+    def __init__(self, batch_number: int):
+        self.batch_number = batch_number
+        self.batch_size = 2
+        self.avg_error = 1. / batch_number
+
+
+class FakeNetwork:
+    id = "network"
+
+
+class FakeTrainer:
+    id = "trainer"
+    network = FakeNetwork()
+
+    def __init__(self, gate: threading.Event = None):
+        self.batch_tally = 0
+        self.gate = gate
+        self.entered = threading.Event()
+
+    def batch_train(self, batch_size: int, epochs: int):
+        self.entered.set()
+        if self.gate is not None:
+            self.gate.wait()
+        self.batch_tally += 1
+        return FakeResult(self.batch_tally)
+
+
+class TrainingJobTest(unittest.TestCase):
+    def test_runs_to_completion(self):
+        gate = threading.Event()
+        job = TrainingJob(FakeTrainer(gate), 5, parameter_stride=2,
+                          serialize_parameters=lambda result: result.batch_number)
+        job.start()
+        stream = job.events()
+        events = [next(stream)]
+        gate.set()
+        events.extend(stream)
+        job.join()
+
+        self.assertEqual(job.state, JobState.COMPLETE)
+        progress = [data for event, data in events if event == "progress"]
+        self.assertEqual([p["batchNumber"] for p in progress], [1, 2, 3, 4, 5])
+        self.assertEqual([p.get("parameters") for p in progress], [None, 2, None, 4, None])
+        self.assertEqual(events[-1][1]["state"], JobState.COMPLETE)
+
+    def test_pause_resume_and_cancel(self):
+        gate = threading.Event()
+        trainer = FakeTrainer(gate)
+        job = TrainingJob(trainer, 100)
+        job.start()
+        trainer.entered.wait()
+        job.pause()
+        gate.set()
+        job.join(.2)
+        self.assertEqual(job.state, JobState.PAUSED)
+        self.assertEqual(job.batches_run, 1)
+
+        job.cancel()
+        job.join()
+        self.assertEqual(job.state, JobState.CANCELLED)
+        self.assertEqual(job.batches_run, 1)
+
+    def test_finished_states_are_final(self):
+        job = TrainingJob(FakeTrainer(), 1)
+        job.start()
+        job.join()
+        job.pause()
+        self.assertEqual(job.state, JobState.COMPLETE)
+        job.resume()
+        self.assertEqual(job.state, JobState.COMPLETE)
+
+        registry = JobRegistry()
+        registry.add(job)
+        self.assertEqual(registry.active("trainer"), [])
+
+    def test_failure_is_reported(self):
+        trainer = FakeTrainer()
+        trainer.batch_train = lambda batch_size, epochs: 1 / 0
+        job = TrainingJob(trainer, 3)
+        job.start()
+        job.join()
+        self.assertEqual(job.state, JobState.FAILED)
+        self.assertIn("ZeroDivisionError", job.error)
+
+    def test_registry_active(self):
+        gate = threading.Event()
+        registry = JobRegistry()
+        job = registry.add(TrainingJob(FakeTrainer(gate), 1))
+        job.start()
+        self.assertEqual(registry.active("network"), [job])
+        gate.set()
+        job.join()
+        self.assertEqual(registry.active("trainer"), [])
+
+    def test_one_job_per_network(self):
+        gate = threading.Event()
+        registry = JobRegistry()
+        other_trainer = FakeTrainer()
+        other_trainer.id = "other trainer"
+        job = registry.add(TrainingJob(FakeTrainer(gate), 1))
+        job.start()
+        with self.assertRaises(NetworkBusyError):
+            registry.add(TrainingJob(other_trainer, 1))
+        self.assertEqual(registry.active("network"), [job])
+
+        gate.set()
+        job.join()
+        registry.add(TrainingJob(other_trainer, 1))
+
+    def test_registry_drops_old_finished_jobs(self):
+        removed = []
+        registry = JobRegistry(max_finished=1, on_remove=removed.append)
+        jobs = []
+        for _ in range(2):
+            jobs.append(registry.add(TrainingJob(FakeTrainer(), 1)))
+            jobs[-1].start()
+            jobs[-1].join()
+        registry.add(TrainingJob(FakeTrainer(), 1))
+        self.assertEqual(removed, jobs[:1])
+        self.assertNotIn(jobs[0].id, registry.jobs)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,17 +1,86 @@
 from flask import Flask, send_from_directory, request, Response, json
 from flask_cors import CORS
+from typing import Any, Callable
 
+from jobs import TrainingJob, JobRegistry, NetworkBusyError
+from object_cache import ObjectCache
 import modeling.assembled_models as am
-from modeling.common.serializers import serialize
+from modeling.common.serializers import serialize, SerializationOptions, LIST_ENCODING, \
+    BASE64_ENCODING, BYTES_ENCODING
+from modeling.common.parameter_changes import ParameterChangeTracker
 from modeling.layers import QuadraticLayer, LinearLayer
-from modeling.trainers import ClosedFormFunctionTrainer
-import math
+from modeling.networks import NeuralNetwork
+from modeling.precision import get_policy, FLOAT64
+from modeling.profiling import Profiler, NULL_PROFILER
+from modeling.trainers import Trainer, ClosedFormFunctionTrainer, BatchResult
+import os
+import threading
 import numpy as np
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 app = Flask(__name__)
 CORS(app)
 
-global_cache = {}
+# ParameterChangeTrackers by network id, for clients polling with a clientId.
+change_trackers = {}
+# Ids of the objects dropped for good since the last response, reported to a routing proxy.
+dropped_ids = []
+dropped_ids_lock = threading.Lock()
+
+
+def drop(object_id: str):
+    change_trackers.pop(object_id, None)
+    with dropped_ids_lock:
+        dropped_ids.append(object_id)
+
+
+jobs = JobRegistry(on_remove=lambda job: drop(job.id))
+
+
+def optional_env(name: str, parse: Callable[[str], Any]):
+    value = os.environ.get(name)
+    return None if value is None else parse(value)
+
+
+# Seconds after which a polling client that stopped polling is forgotten.
+CLIENT_TTL = optional_env('INSIGHT_CLIENT_TTL', float) or 600.
+
+global_cache = ObjectCache(
+    max_entries=optional_env('INSIGHT_CACHE_MAX_ENTRIES', int) or 256,
+    max_bytes=optional_env('INSIGHT_CACHE_MAX_BYTES', int),
+    ttl=optional_env('INSIGHT_CACHE_TTL', float),
+    spill_directory=os.environ.get('INSIGHT_CACHE_SPILL_DIRECTORY'),
+    is_pinned=lambda key: len(jobs.active(key)) > 0,
+    on_evict=drop,
+    # A trainer is spilled and reloaded with its network, so both stay the same objects.
+    references=lambda value: [value.network.id] if isinstance(value, Trainer) else [])
+
+JSON_MIMETYPE = 'application/json'
+BASE64_MIMETYPE = 'application/vnd.insight.base64+json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+# Names the object a request created, so a routing proxy can send later requests for it here.
+OBJECT_ID_HEADER = 'X-Insight-Object-Id'
+# Comma separated ids of the objects dropped since the previous response, so a routing proxy can
+# forget them.
+DROPPED_IDS_HEADER = 'X-Insight-Dropped-Ids'
+
+# Response formats in order of preference when the client accepts several equally.
+array_encodings = [(JSON_MIMETYPE, LIST_ENCODING), (BASE64_MIMETYPE, BASE64_ENCODING)]
+if msgpack is not None:
+    array_encodings.append((MSGPACK_MIMETYPE, BYTES_ENCODING))
+
+
+@app.after_request
+def report_dropped_ids(response: Response) -> Response:
+    with dropped_ids_lock:
+        if len(dropped_ids) > 0:
+            response.headers[DROPPED_IDS_HEADER] = ','.join(dropped_ids)
+            dropped_ids.clear()
+    return response
 
 
 @app.route('/updater_keys', methods=["GET"])
@@ -25,15 +94,17 @@ def create_network():
     network_type = request.json["type"]
     options = request.json["options"]
 
+    dtype_policy = get_policy(options.get("dtype", FLOAT64.name))
+
     if network_type == "QUADRATIC_FEED_FORWARD":
-        network = am.feed_forward_network(QuadraticLayer, layers, options["updater"])
+        network = am.feed_forward_network(QuadraticLayer, layers, options["updater"], dtype_policy)
     elif network_type == "STANDARD_FEED_FORWARD":
-        network = am.feed_forward_network(LinearLayer, layers, options["updater"])
+        network = am.feed_forward_network(LinearLayer, layers, options["updater"], dtype_policy)
     else:
         raise ValueError(network_type + " is not implemented")
 
     global_cache[network.id] = network
-    return create_response(serialize(network))
+    return created_response(serialize_response(network), network.id)
 
 
 @app.route('/create_trainer', methods=["POST"])
@@ -45,24 +116,122 @@ def create_trainer():
     if trainer_type == "CLOSED_FORM_FUNCTION":
         trainer = ClosedFormFunctionTrainer(
             global_cache[network_id],
-            eval(options["function"]),
+            options["function"],
             options["domain"],
             options["batchSize"])
     else:
         raise ValueError(trainer_type + " is not implemented")
 
     global_cache[trainer.id] = trainer
-    return create_response(serialize(trainer))
+    return created_response(serialize_response(trainer), trainer.id)
 
 
 @app.route('/remote_command/<target_id>/<command>', methods=["POST"])
 def remote_command(target_id: str, command: str):
     target = global_cache[target_id]
-    if target is None:
-        raise ValueError("No object found with id " + target_id)
+    if not isinstance(target, NeuralNetwork):
+        # Keep a trainer's network at least as recently used as the trainer itself.
+        global_cache.get(target.network.id)
+
+    # Every trainer of a network trains the same layers, so any job on the network conflicts.
+    network = target if isinstance(target, NeuralNetwork) else target.network
+    if len(jobs.active(network.id)) > 0:
+        return create_response({"error": network.id + " is being trained by a job"}, status=409)
 
     args = request.json["args"]
-    return create_response(serialize(getattr(target, command)(*args)))
+    return serialize_response(getattr(target, command)(*args), network.id)
+
+
+@app.route('/cache/stats', methods=["GET"])
+def cache_stats():
+    return create_response(global_cache.stats())
+
+
+@app.route('/profiling/<target_id>', methods=["GET"])
+def profiling_stats(target_id: str):
+    return create_response(global_cache[target_id].profiler.stats())
+
+
+@app.route('/profiling/<target_id>', methods=["POST"])
+def configure_profiling(target_id: str):
+    """
+    Turns profiling of a cached network or trainer on or off. A trainer shares its profiler with
+    its network, and takes over the network's when the network is already profiled. The body may
+    set "enabled" (default true) and "reset" to clear the recorded phases.
+    """
+    target = global_cache[target_id]
+    options = request.get_json(silent=True) or {}
+    enabled = options.get("enabled", True)
+    if target.profiler is NULL_PROFILER:
+        if enabled:
+            network = target if isinstance(target, NeuralNetwork) else target.network
+            profiler = Profiler() if network.profiler is NULL_PROFILER else network.profiler
+            profiler.enabled = True
+            target.set_profiler(profiler)
+    else:
+        target.profiler.enabled = enabled
+        if options.get("reset", False):
+            target.profiler.reset()
+    return create_response(target.profiler.stats())
+
+
+@app.route('/jobs', methods=["GET"])
+def list_jobs():
+    return create_response(jobs.statuses())
+
+
+@app.route('/jobs', methods=["POST"])
+def start_job():
+    """
+    Starts training a cached trainer on a worker thread. The job calls batch_train(batchSize,
+    epochs) batchCount times; every parameterStride-th progress event includes the parameters.
+    """
+    trainer = global_cache[request.json["trainerId"]]
+    options = SerializationOptions(include_delta_steps=False)
+    try:
+        job = jobs.add(TrainingJob(
+            trainer,
+            int(request.json["batchCount"]),
+            int(request.json.get("batchSize", 0)),
+            int(request.json.get("epochs", 1)),
+            int(request.json.get("parameterStride", 0)),
+            lambda result: serialize(result, options)["parameters"]))
+    except NetworkBusyError as e:
+        return create_response({"error": str(e)}, status=409)
+    job.start()
+    return created_response(create_response(job.status()), job.id)
+
+
+@app.route('/jobs/<job_id>', methods=["GET"])
+def job_status(job_id: str):
+    return create_response(jobs.get(job_id).status())
+
+
+@app.route('/jobs/<job_id>/<command>', methods=["POST"])
+def job_command(job_id: str, command: str):
+    job = jobs.get(job_id)
+    if command not in ("cancel", "pause", "resume"):
+        raise ValueError(command + " is not a job command")
+    getattr(job, command)()
+    return create_response(job.status())
+
+
+@app.route('/jobs/<job_id>/events', methods=["GET"])
+def job_events(job_id: str):
+    """
+    Streams the job's status and progress as Server-Sent Events until it finishes.
+    """
+    job = jobs.get(job_id)
+
+    def stream():
+        for event, data in job.events():
+            if event is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield "event: {0}\ndata: {1}\n\n".format(event, json.dumps(data))
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 @app.route('/<path:path>', methods=["GET"])
@@ -70,9 +239,62 @@ def static_files(path):
     return send_from_directory('../frontend', path)
 
 
-def create_response(data):
-    return Response(json.dumps(data), status=200, mimetype='application/json')
+def create_response(data, mimetype: str = JSON_MIMETYPE, status: int = 200):
+    return Response(json.dumps(data), status=status, mimetype=mimetype)
+
+
+def query_flag(name: str, default: bool) -> bool:
+    return request.args.get(name, str(default)).lower() != 'false'
+
+
+def parameters_of(target):
+    if isinstance(target, BatchResult):
+        return target.parameters
+    if isinstance(target, NeuralNetwork):
+        return target.get_parameters()
+    return None
+
+
+def created_response(response: Response, object_id: str) -> Response:
+    response.headers[OBJECT_ID_HEADER] = object_id
+    return response
+
+
+def serialize_response(target, network_id: str = None):
+    """
+    Serializes target in the format picked from the request's Accept header. Plain JSON keeps the
+    nested list layout; the base64 and msgpack formats send arrays as dtype, shape and raw bytes.
+    The deltaSteps query argument turns the per-parameter update step history off.
+
+    When the request names a clientId, parameters are sent as parameterChanges: only the sets
+    that changed by more than the tolerance argument since the version the client acknowledged
+    with ack. full=true asks for a complete snapshot.
+    """
+    encodings = dict(array_encodings)
+    mimetype = request.accept_mimetypes.best_match(
+        [mimetype for mimetype, _ in array_encodings], default=JSON_MIMETYPE)
+    client_id = request.args.get('clientId')
+    parameters = parameters_of(target)
+    incremental = client_id is not None and network_id is not None and parameters is not None
+    options = SerializationOptions(
+        include_delta_steps=query_flag('deltaSteps', True),
+        array_encoding=encodings[mimetype],
+        include_parameters=not incremental)
+    data = serialize(target, options)
+
+    if incremental:
+        tracker = change_trackers.setdefault(network_id,
+                                             ParameterChangeTracker(client_ttl=CLIENT_TTL))
+        client = tracker.client(client_id)
+        if 'ack' in request.args:
+            client.acknowledge(int(request.args['ack']))
+        data["parameterChanges"] = client.changes(
+            parameters, float(request.args.get('tolerance', 0)), query_flag('full', False), options)
+
+    if mimetype == MSGPACK_MIMETYPE:
+        return Response(msgpack.packb(data, use_bin_type=True), status=200, mimetype=mimetype)
+    return create_response(data, mimetype)
 
 
 if __name__ == "__main__":
-    app.run(host='0.0.0.0')
+    app.run(host='0.0.0.0', threaded=True)
@@ -1,10 +1,11 @@
 from abc import abstractmethod, ABCMeta
-from typing import Sequence, Callable
+from typing import Sequence, Callable, Union
 
 from modeling.function.activation import RectifiedLinearUnitActivation, IdentityActivation
 from modeling.layers import QuadraticLayer, LinearLayer, Layer
 from modeling.networks import FeedForward
 from modeling.parameter_generators import RandomParameterGenerator, SequenceParameterGenerator
+from modeling.precision import DTypePolicy, FLOAT64
 from modeling.parameter_updaters import ParameterUpdater, \
     LargestGradientsOnly, DeltaParameterUpdateStep, \
     ErrorRegularizedGradient, LogScaledDelta, FlatGradient, FlatLearningRate, Momentum, \
@@ -81,8 +82,13 @@ error_regularized_updater = ErrorRegularizedUpdater()
 
 
 def feed_forward_network(layer: Callable[..., Layer], nodes: Sequence[int],
-                         updater_key: str) -> FeedForward:
-    updater = updaters[updater_key]
+                         updater: Union[str, FeedForwardUpdater],
+                         dtype_policy: DTypePolicy = FLOAT64) -> FeedForward:
+    """
+    :param updater: A FeedForwardUpdater, or the key of one in updaters.
+    """
+    if isinstance(updater, str):
+        updater = updaters[updater]
     layers = []
     network = FeedForward(layers)
 
@@ -93,5 +99,6 @@ def feed_forward_network(layer: Callable[..., Layer], nodes: Sequence[int],
                   level=i,
                   activation=IdentityActivation(),
                   parameter_updater=updater.create(network),
-                  parameter_generator=RandomParameterGenerator()))
+                  parameter_generator=RandomParameterGenerator(),
+                  dtype_policy=dtype_policy))
     return network
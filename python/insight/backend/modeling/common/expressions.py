@@ -0,0 +1,193 @@
+import ast
+import functools
+import math
+from typing import Callable, Sequence
+
+import numpy as np
+
+# Functions a target expression may call as math.<name>, np.<name> or numpy.<name>, and the
+# numpy ufuncs they compile to.
+FUNCTIONS = {
+    "sin": np.sin, "cos": np.cos, "tan": np.tan,
+    "asin": np.arcsin, "acos": np.arccos, "atan": np.arctan, "atan2": np.arctan2,
+    "arcsin": np.arcsin, "arccos": np.arccos, "arctan": np.arctan, "arctan2": np.arctan2,
+    "sinh": np.sinh, "cosh": np.cosh, "tanh": np.tanh,
+    "exp": np.exp, "log": np.log, "log10": np.log10, "log2": np.log2, "sqrt": np.sqrt,
+    "abs": np.abs, "fabs": np.abs, "floor": np.floor, "ceil": np.ceil,
+    "pow": np.power, "power": np.power, "hypot": np.hypot,
+    "minimum": np.minimum, "maximum": np.maximum
+}
+
+
+
+def _variadic(ufunc: np.ufunc) -> Callable:
+    """
+    Applies a binary ufunc across any number of arguments, like the builtin min and max.
+    """
+    def function(*args):
+        return functools.reduce(ufunc, args)
+    # Takes two or more arguments rather than a fixed number, see _Compiler.visit_Call.
+    function.nin = None
+    return function
+
+
+# Functions that may be called without a module prefix.
+BUILTIN_FUNCTIONS = {"abs": np.abs, "pow": np.power,
+                     "min": _variadic(np.minimum), "max": _variadic(np.maximum)}
+
+CONSTANTS = {"pi": math.pi, "e": math.e, "tau": math.tau}
+
+MODULES = ("math", "np", "numpy")
+
+_BINARY_OPERATORS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow)
+_UNARY_OPERATORS = (ast.UAdd, ast.USub)
+
+
+class CompiledExpression:
+    """
+    A target function compiled from an expression such as "lambda x: x * math.sin(x)" into a
+    numpy callable that evaluates a whole (batch, input_count) array of inputs at once.
+
+    A lambda with one parameter receives each input vector, so x[i] is its i-th component. A
+    lambda with one parameter per input receives the components separately.
+    """
+
+    def __init__(self, text: str, parameters: Sequence[str], function: Callable):
+        self.text = text
+        self.parameters = parameters
+        self._function = function
+
+    def __call__(self, inputs: np.ndarray) -> np.ndarray:
+        inputs = np.atleast_2d(np.asarray(inputs, dtype=float))
+        if len(self.parameters) == 1:
+            outputs = self._function(inputs)
+        elif len(self.parameters) == inputs.shape[1]:
+            outputs = self._function(*inputs.T)
+        else:
+            raise ValueError("{0} takes {1} inputs but was given {2}".format(
+                self.text, len(self.parameters), inputs.shape[1]))
+
+        outputs = np.asarray(outputs, dtype=float)
+        if outputs.ndim == 0:
+            return np.full((len(inputs), 1), outputs)
+        return np.reshape(outputs, (len(inputs), -1))
+
+    def __reduce__(self):
+        return compile_expression, (self.text,)
+
+
+class _Compiler(ast.NodeTransformer):
+    """
+    Checks that an expression only uses arithmetic, its parameters, constants and FUNCTIONS, and
+    rewrites it to call the numpy functions directly.
+    """
+
+    def __init__(self, text: str, parameters: Sequence[str]):
+        self.text = text
+        self.parameters = parameters
+
+    def reject(self, node: ast.AST, what: str = None):
+        raise ValueError("{0} is not allowed in a target function: {1}".format(
+            what or type(node).__name__, self.text))
+
+    def generic_visit(self, node: ast.AST):
+        self.reject(node)
+
+    def visit_BinOp(self, node: ast.BinOp):
+        if not isinstance(node.op, _BINARY_OPERATORS):
+            self.reject(node.op)
+        return ast.BinOp(self.visit(node.left), node.op, self.visit(node.right))
+
+    def visit_UnaryOp(self, node: ast.UnaryOp):
+        if not isinstance(node.op, _UNARY_OPERATORS):
+            self.reject(node.op)
+        return ast.UnaryOp(node.op, self.visit(node.operand))
+
+    def visit_Constant(self, node: ast.Constant):
+        if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+            self.reject(node, repr(node.value))
+        # Float constants overflow instead of building huge integers, eg. for 9 ** 9 ** 9.
+        return ast.Constant(float(node.value))
+
+    def visit_Name(self, node: ast.Name):
+        if node.id in self.parameters:
+            return node
+        if node.id in CONSTANTS:
+            return ast.Constant(CONSTANTS[node.id])
+        self.reject(node, node.id)
+
+    def visit_Attribute(self, node: ast.Attribute):
+        if not isinstance(node.value, ast.Name) or node.value.id not in MODULES:
+            self.reject(node, ast.unparse(node))
+        if node.attr in CONSTANTS:
+            return ast.Constant(CONSTANTS[node.attr])
+        self.reject(node, ast.unparse(node))
+
+    def visit_Call(self, node: ast.Call):
+        if len(node.keywords) > 0:
+            self.reject(node, "Keyword arguments")
+        function = node.func
+        if isinstance(function, ast.Attribute) and isinstance(function.value, ast.Name) and \
+                function.value.id in MODULES and function.attr in FUNCTIONS:
+            name = "_np_" + function.attr
+            nin = FUNCTIONS[function.attr].nin
+        elif isinstance(function, ast.Name) and function.id in BUILTIN_FUNCTIONS:
+            name = "_builtin_" + function.id
+            nin = BUILTIN_FUNCTIONS[function.id].nin
+        else:
+            self.reject(node, ast.unparse(function))
+        # Extra arguments would be passed to the ufunc as out and overwrite the inputs.
+        count = len(node.args)
+        if (count < 2) if nin is None else (count != nin):
+            self.reject(node, "{0} with {1} arguments".format(ast.unparse(function), count))
+        return ast.Call(ast.Name(name, ast.Load()), [self.visit(arg) for arg in node.args], [])
+
+    def visit_Subscript(self, node: ast.Subscript):
+        # x[i] selects component i of every input vector in the batch.
+        component = node.slice
+        if isinstance(component, ast.UnaryOp) and isinstance(component.op, ast.USub) and \
+                isinstance(component.operand, ast.Constant):
+            component = ast.Constant(-component.operand.value)
+        if not isinstance(node.value, ast.Name) or node.value.id not in self.parameters or \
+                not isinstance(component, ast.Constant) or type(component.value) is not int:
+            self.reject(node, ast.unparse(node))
+        index = ast.Tuple([ast.Constant(Ellipsis), component], ast.Load())
+        return ast.Subscript(node.value, index, ast.Load())
+
+
+@functools.lru_cache(maxsize=256)
+def compile_expression(text: str) -> CompiledExpression:
+    """
+    Compiles a "lambda x: ..." string, or a bare expression in x, into a CompiledExpression.
+    Raises ValueError if it uses anything other than arithmetic and the allowed math functions.
+    """
+    try:
+        tree = ast.parse(text.strip(), mode='eval').body
+    except SyntaxError as e:
+        raise ValueError("Invalid target function: " + text) from e
+
+    if isinstance(tree, ast.Lambda):
+        arguments = tree.args
+        if arguments.vararg or arguments.kwarg or arguments.kwonlyargs or arguments.defaults or \
+                arguments.posonlyargs:
+            raise ValueError("Target functions only take positional parameters: " + text)
+        parameters = [arg.arg for arg in arguments.args]
+        body = tree.body
+    else:
+        parameters = ["x"]
+        body = tree
+    if len(parameters) == 0:
+        raise ValueError("Target functions take at least one parameter: " + text)
+    if any(name.startswith("_") for name in parameters):
+        raise ValueError("Parameter names may not start with an underscore: " + text)
+
+    body = _Compiler(text, parameters).visit(body)
+    function = ast.Expression(ast.Lambda(
+        ast.arguments([], [ast.arg(name) for name in parameters], None, [], [], None, []), body))
+    ast.fix_missing_locations(function)
+
+    namespace = {"__builtins__": {}}
+    namespace.update({"_np_" + name: value for name, value in FUNCTIONS.items()})
+    namespace.update({"_builtin_" + name: value for name, value in BUILTIN_FUNCTIONS.items()})
+    code = compile(function, "<target>", "eval")
+    return CompiledExpression(text, parameters, eval(code, namespace))
@@ -0,0 +1,74 @@
+import math
+import pickle
+import unittest
+
+import numpy as np
+
+from modeling.common.expressions import compile_expression
+
+
+class CompileExpressionTest(unittest.TestCase):
+    def test_matches_lambda(self):
+        text = "lambda x: x * math.sin(x)"
+        inputs = np.random.uniform(-5, 5, (20, 1))
+        expected = [eval(text)(x[0]) for x in inputs]
+        np.testing.assert_allclose(compile_expression(text)(inputs), np.reshape(expected, (20, 1)))
+
+    def test_components(self):
+        inputs = np.array([[1., 2.], [3., 4.]])
+        np.testing.assert_allclose(compile_expression("lambda x: x[0] * x[1] + pi")(inputs),
+                                   [[2 + math.pi], [12 + math.pi]])
+        expression = compile_expression("lambda a, b: np.hypot(a, b) - abs(a)")
+        np.testing.assert_allclose(expression(inputs), [[math.hypot(1, 2) - 1], [5 - 3]])
+
+    def test_bare_expression_and_constants(self):
+        inputs = np.array([[1.], [2.]])
+        np.testing.assert_allclose(compile_expression("x ** 2")(inputs), [[1.], [4.]])
+        np.testing.assert_allclose(compile_expression("lambda x: 3")(inputs), [[3.], [3.]])
+
+    def test_cached(self):
+        self.assertIs(compile_expression("lambda x: x + 1"), compile_expression("lambda x: x + 1"))
+
+    def test_pickles_by_text(self):
+        expression = pickle.loads(pickle.dumps(compile_expression("lambda x: 2 * x")))
+        np.testing.assert_allclose(expression(np.array([[2.]])), [[4.]])
+
+    def test_rejects_code(self):
+        for text in ["lambda x: __import__('os').system('ls')",
+                     "lambda x: x.__class__",
+                     "lambda x: math.os",
+                     "lambda x: open('file')",
+                     "lambda x: [y for y in x]",
+                     "lambda x: 'a' * 10",
+                     "lambda x: x[x]",
+                     "lambda x, *rest: x",
+                     "lambda _x: _x",
+                     "lambda x: (lambda: 1)()",
+                     "lambda x: x if x else 1",
+                     "import os"]:
+            with self.assertRaises(ValueError, msg=text):
+                compile_expression(text)
+
+    def test_argument_counts(self):
+        inputs = np.array([[1., 5., 3.], [4., 2., 6.]])
+        np.testing.assert_allclose(compile_expression("lambda x: max(x[0], x[1], x[2])")(inputs),
+                                   [[5.], [6.]])
+        np.testing.assert_allclose(compile_expression("lambda x: min(x[0], 2, x[2])")(inputs),
+                                   [[1.], [2.]])
+        np.testing.assert_array_equal(inputs, [[1., 5., 3.], [4., 2., 6.]])
+        for text in ["lambda x: math.sin(x[0], x[1])",
+                     "lambda x: np.hypot(x[0])",
+                     "lambda x: max(x)",
+                     "lambda x: abs(x, x)",
+                     "lambda x: np.maximum(x, x, x)",
+                     "lambda x: np.sin(x, out=x)"]:
+            with self.assertRaises(ValueError, msg=text):
+                compile_expression(text)
+
+    def test_wrong_input_count(self):
+        with self.assertRaises(ValueError):
+            compile_expression("lambda a, b: a + b")(np.ones((2, 3)))
+
+
+if __name__ == '__main__':
+    unittest.main()
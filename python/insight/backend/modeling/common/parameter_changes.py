@@ -0,0 +1,151 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Mapping, Sequence
+
+import numpy as np
+
+from modeling.common.serializers import SerializationOptions, DEFAULT_OPTIONS, \
+    serialize_parameter_set
+from modeling.domain_objects import ParameterSet
+
+LayerParameters = Sequence[Mapping[str, ParameterSet]]
+
+
+class ParameterSnapshot:
+    """
+    The parameter values a client holds after applying the response with the given version.
+    """
+
+    def __init__(self, version: int, values: List[Mapping[str, np.ndarray]]):
+        self.version = version
+        self.values = values
+
+
+class ClientParameterState:
+    """
+    The parameter versions sent to one client. Changes are computed against the last snapshot the
+    client acknowledged, so a client that misses a response can still apply the next one.
+    """
+
+    def __init__(self, max_pending: int = 8):
+        self.max_pending = max_pending
+        self.version = 0
+        self.acknowledged = None
+        self.pending = OrderedDict()
+
+    def acknowledge(self, version: int):
+        if self.acknowledged is not None and self.acknowledged.version == version:
+            return
+        snapshot = self.pending.get(version)
+        if snapshot is None:
+            # An unknown version means the client lost track; it gets a full snapshot next.
+            self.acknowledged = None
+            return
+        self.acknowledged = snapshot
+        for pending_version in list(self.pending.keys()):
+            if pending_version <= version:
+                del self.pending[pending_version]
+
+    def changes(self, parameters: LayerParameters, tolerance: float = 0., full: bool = False,
+                options: SerializationOptions = DEFAULT_OPTIONS) -> dict:
+        """
+        Serializes the parameter sets that differ from the acknowledged snapshot by more than
+        tolerance. Sets where most elements changed are sent whole; the rest are sent as the flat
+        indices of their changed elements and the values at those indices.
+        """
+        base = None if full else self.acknowledged
+        self.version += 1
+        layers = []
+        values = []
+        for layer_index, set_map in enumerate(parameters):
+            layer = {}
+            layer_values = {}
+            for key, parameter_set in set_map.items():
+                base_values = None if base is None else base.values[layer_index].get(key)
+                serialized, sent_values = _set_changes(
+                    parameter_set, base_values, tolerance, options)
+                if serialized is not None:
+                    layer[key] = serialized
+                layer_values[key] = sent_values
+            layers.append(layer)
+            values.append(layer_values)
+
+        self.pending[self.version] = ParameterSnapshot(self.version, values)
+        while len(self.pending) > self.max_pending:
+            self.pending.popitem(last=False)
+
+        return {
+            "version": self.version,
+            "baseVersion": None if base is None else base.version,
+            "layers": layers
+        }
+
+
+def _set_changes(parameter_set: ParameterSet, base_values: np.ndarray, tolerance: float,
+                 options: SerializationOptions):
+    """
+    Returns the serialized changes of one set, or None when nothing changed, together with the
+    values the client holds after applying them.
+    """
+    if base_values is None or base_values.shape != parameter_set.shape:
+        return dict(serialize_parameter_set(parameter_set, options), full=True), \
+               parameter_set.values.copy()
+
+    changed = np.flatnonzero(np.abs(parameter_set.values - base_values) > tolerance)
+    if len(changed) == 0:
+        return None, base_values
+    if 2 * len(changed) > parameter_set.size:
+        return dict(serialize_parameter_set(parameter_set, options), full=True), \
+               parameter_set.values.copy()
+
+    sent_values = base_values.copy()
+    sent_values.flat[changed] = parameter_set.values.flat[changed]
+    return {
+        "name": parameter_set.name,
+        "full": False,
+        "shape": list(parameter_set.shape),
+        "indices": options.array(changed),
+        "values": options.array(parameter_set.values.flat[changed]),
+        "gradients": options.array(parameter_set.gradients.flat[changed]),
+        "deltaValues": options.array(parameter_set.delta_values.flat[changed])
+    }, sent_values
+
+
+class ParameterChangeTracker:
+    """
+    The ClientParameterStates of every client polling one network. Clients that have not polled
+    for client_ttl seconds are dropped, and so are the least recently polling ones beyond
+    max_clients, so clients that went away don't keep their snapshots. A dropped client that polls
+    again gets a full snapshot.
+    """
+
+    def __init__(self, max_clients: int = 64, client_ttl: float = 600.):
+        self.max_clients = max_clients
+        self.client_ttl = client_ttl
+        # In the order the clients last polled, least recent first.
+        self.clients = OrderedDict()
+        self._polled = {}
+        self._lock = threading.Lock()
+
+    def client(self, client_id: str) -> ClientParameterState:
+        with self._lock:
+            now = time.time()
+            state = self.clients.get(client_id)
+            if state is None:
+                state = self.clients[client_id] = ClientParameterState()
+            else:
+                self.clients.move_to_end(client_id)
+            self._polled[client_id] = now
+            self._expire(now)
+            return state
+
+    def _expire(self, now: float):
+        while len(self.clients) > 0:
+            client_id = next(iter(self.clients))
+            expired = self.client_ttl is not None and \
+                now - self._polled[client_id] > self.client_ttl
+            if len(self.clients) <= self.max_clients and not expired:
+                break
+            del self.clients[client_id]
+            del self._polled[client_id]
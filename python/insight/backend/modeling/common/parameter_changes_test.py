@@ -0,0 +1,86 @@
+import unittest
+
+import numpy as np
+
+from modeling.common.parameter_changes import ClientParameterState, ParameterChangeTracker
+from modeling.domain_objects import ParameterSet
+
+
+def parameters(values):
+    return [{"weights": ParameterSet("weights", values, np.zeros(np.shape(values)))}]
+
+
+class ClientParameterStateTest(unittest.TestCase):
+    def test_first_response_is_full(self):
+        changes = ClientParameterState().changes(parameters([1, 2, 3, 4]))
+        self.assertEqual(changes["version"], 1)
+        self.assertIsNone(changes["baseVersion"])
+        self.assertTrue(changes["layers"][0]["weights"]["full"])
+
+    def test_changes_since_acknowledged(self):
+        client = ClientParameterState()
+        client.changes(parameters([1, 2, 3, 4]))
+        client.acknowledge(1)
+
+        changes = client.changes(parameters([1, 2.5, 3, 4.001]), tolerance=.01)
+        self.assertEqual(changes["baseVersion"], 1)
+        weights = changes["layers"][0]["weights"]
+        self.assertFalse(weights["full"])
+        self.assertEqual(weights["indices"], [1])
+        self.assertEqual(weights["values"], [2.5])
+
+    def test_unchanged_sets_are_omitted(self):
+        client = ClientParameterState()
+        client.changes(parameters([1, 2, 3, 4]))
+        client.acknowledge(1)
+        self.assertEqual(client.changes(parameters([1, 2, 3, 4]))["layers"], [{}])
+
+    def test_changes_below_tolerance_accumulate(self):
+        client = ClientParameterState()
+        client.changes(parameters([1, 2, 3, 4]))
+        client.acknowledge(1)
+        self.assertEqual(client.changes(parameters([1.006, 2, 3, 4]), .01)["layers"], [{}])
+        client.acknowledge(2)
+        weights = client.changes(parameters([1.012, 2, 3, 4]), .01)["layers"][0]["weights"]
+        self.assertEqual(weights["indices"], [0])
+
+    def test_unacknowledged_responses_share_a_base(self):
+        client = ClientParameterState()
+        client.changes(parameters([1, 2, 3, 4]))
+        client.acknowledge(1)
+        client.changes(parameters([5, 2, 3, 4]))
+        changes = client.changes(parameters([5, 2, 3, 6]))
+        self.assertEqual(changes["baseVersion"], 1)
+        self.assertEqual(changes["layers"][0]["weights"]["indices"], [0, 3])
+
+    def test_full_and_unknown_versions(self):
+        client = ClientParameterState()
+        client.changes(parameters([1, 2, 3, 4]))
+        client.acknowledge(1)
+        self.assertTrue(client.changes(parameters([1, 2, 3, 4]), full=True)
+                        ["layers"][0]["weights"]["full"])
+
+        client.acknowledge(99)
+        self.assertIsNone(client.changes(parameters([1, 2, 3, 4]))["baseVersion"])
+
+
+class ParameterChangeTrackerTest(unittest.TestCase):
+    def test_drops_least_recent_clients(self):
+        tracker = ParameterChangeTracker(max_clients=2)
+        first = tracker.client("a")
+        tracker.client("b")
+        self.assertIs(tracker.client("a"), first)
+        tracker.client("c")
+        self.assertEqual(list(tracker.clients), ["a", "c"])
+
+    def test_drops_idle_clients(self):
+        tracker = ParameterChangeTracker(client_ttl=60)
+        idle = tracker.client("idle")
+        tracker._polled["idle"] -= 120
+        tracker.client("active")
+        self.assertEqual(list(tracker.clients), ["active"])
+        self.assertIsNot(tracker.client("idle"), idle)
+
+
+if __name__ == '__main__':
+    unittest.main()
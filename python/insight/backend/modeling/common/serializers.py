@@ -1,6 +1,7 @@
-from typing import Any, Mapping
+import base64
+from typing import Any, Callable, Mapping, Sequence
 import numpy as np
-import collections
+import collections.abc
 
 from modeling.domain_objects import ParameterSet, DeltaStep, Delta
 from modeling.networks import NeuralNetwork
@@ -9,20 +10,66 @@ from modeling.trainers import BatchResult, Trainer, ValidationResult
 serialize_map = {}
 
 
+class ArrayEncoding:
+    """
+    How ndarrays are represented in serialized output. Typed encodings ship each array as its
+    dtype, shape and raw data instead of as nested lists.
+    """
+
+    def __init__(self, name: str, encode: Callable[[np.ndarray], Any], typed: bool):
+        self.name = name
+        self.encode = encode
+        self.typed = typed
+
+
+def _typed_array(array: np.ndarray, data: Callable[[np.ndarray], Any]) -> dict:
+    array = np.ascontiguousarray(array)
+    return {
+        "dtype": array.dtype.str,
+        "shape": list(array.shape),
+        "data": data(array)
+    }
+
+
+LIST_ENCODING = ArrayEncoding("list", lambda array: array.tolist(), typed=False)
+BASE64_ENCODING = ArrayEncoding(
+    "base64",
+    lambda array: _typed_array(array, lambda a: base64.b64encode(a.tobytes()).decode('ascii')),
+    typed=True)
+BYTES_ENCODING = ArrayEncoding(
+    "bytes", lambda array: _typed_array(array, lambda a: a.tobytes()), typed=True)
+
+
+class SerializationOptions:
+    def __init__(self, include_delta_steps: bool = True,
+                 array_encoding: ArrayEncoding = LIST_ENCODING, include_parameters: bool = True):
+        self.include_delta_steps = include_delta_steps
+        self.include_parameters = include_parameters
+        self.array_encoding = array_encoding
+
+    def array(self, target: Any):
+        if isinstance(target, np.ndarray):
+            return self.array_encoding.encode(target)
+        return tolist(target)
+
+
+DEFAULT_OPTIONS = SerializationOptions()
+
+
 def tolist(target: Any):
-    if isinstance(target, collections.Iterable) and not isinstance(target, str):
-        return [tolist(item) for item in target]
+    if isinstance(target, np.ndarray):
+        return target.tolist()
 
-    if isinstance(target, (np.float32, np.float64)):
-        return float(target)
+    if isinstance(target, np.generic):
+        return target.item()
 
-    if isinstance(target, (np.int32, np.int64)):
-        return int(target)
+    if isinstance(target, collections.abc.Iterable) and not isinstance(target, str):
+        return [tolist(item) for item in target]
 
     return target
 
 
-def serialize_delta_step(delta_step: DeltaStep):
+def serialize_delta_step(delta_step: DeltaStep, options: SerializationOptions = DEFAULT_OPTIONS):
     return {
         "name": delta_step.name,
         "input": float(delta_step.input_value),
@@ -33,75 +80,129 @@ def serialize_delta_step(delta_step: DeltaStep):
 serialize_map[DeltaStep] = serialize_delta_step
 
 
-def serialize_delta(delta: Delta):
+def serialize_delta(delta: Delta, options: SerializationOptions = DEFAULT_OPTIONS):
     return {
         "value": delta.value,
-        "steps": [serialize(step) for step in delta.steps]
+        "steps": [serialize(step, options) for step in delta.steps]
     }
 
 
 serialize_map[Delta] = serialize_delta
 
 
-def serialize_parameter_set(parameter_set: ParameterSet) -> dict:
+def _nest(flat: Sequence[Any], shape: Sequence[int]) -> list:
+    """
+    Splits a flat list into nested lists of the given shape.
+    """
+    if len(shape) <= 1:
+        return list(flat)
+    stride = len(flat) // shape[0]
+    return [_nest(flat[i * stride:(i + 1) * stride], shape[1:]) for i in range(shape[0])]
+
+
+def _serialize_deltas(parameter_set: ParameterSet, options: SerializationOptions) -> list:
+    values = parameter_set.delta_values.ravel().tolist()
+    if options.include_delta_steps:
+        deltas = [{"value": value,
+                   "steps": [serialize_delta_step(step, options)
+                             for step in parameter_set.delta_steps(index)]}
+                  for index, value in enumerate(values)]
+    else:
+        deltas = [{"value": value, "steps": []} for value in values]
+    return _nest(deltas, parameter_set.shape)
+
+
+def _serialize_delta_trace(parameter_set: ParameterSet, options: SerializationOptions):
+    trace = parameter_set.trace
+    if trace is None:
+        return None
+    step_count = len(trace.names)
     return {
+        "names": trace.names,
+        "indices": None if trace.indices is None else options.array(trace.indices),
+        "inputs": options.array(trace.input_values[:step_count]),
+        "outputs": options.array(trace.output_values[:step_count])
+    }
+
+
+def serialize_parameter_set(parameter_set: ParameterSet,
+                            options: SerializationOptions = DEFAULT_OPTIONS) -> dict:
+    result = {
         "name": parameter_set.name,
         "dimensionDepth": len(parameter_set.shape),
-        "values": tolist(parameter_set.values),
-        "gradients": tolist(parameter_set.gradients),
-        "deltas": np.reshape([serialize(delta) for delta in parameter_set.deltas.flatten()],
-                             parameter_set.deltas.shape).tolist()
+        "values": options.array(parameter_set.values),
+        "gradients": options.array(parameter_set.gradients)
     }
+    if options.array_encoding.typed:
+        # Typed clients get the delta values and the step trace as arrays rather than one
+        # object per parameter.
+        result["deltaValues"] = options.array(parameter_set.delta_values)
+        if options.include_delta_steps:
+            result["deltaTrace"] = _serialize_delta_trace(parameter_set, options)
+    else:
+        result["deltas"] = _serialize_deltas(parameter_set, options)
+    return result
 
 
 serialize_map[ParameterSet] = serialize_parameter_set
 
 
-def _serialize_parameter_set_map(set_map: Mapping[str, ParameterSet]) -> dict:
-    return {key: serialize(value) for key, value in set_map.items()}
+def _serialize_parameter_set_map(set_map: Mapping[str, ParameterSet],
+                                 options: SerializationOptions = DEFAULT_OPTIONS) -> dict:
+    return {key: serialize(value, options) for key, value in set_map.items()}
 
 
-def serialize_batch_result(result: BatchResult):
-    return {
+def serialize_batch_result(result: BatchResult, options: SerializationOptions = DEFAULT_OPTIONS):
+    serialized = {
         "batchNumber": result.batch_number,
         "batchSize": result.batch_size,
-        "totalError": result.total_error,
-        "avgError": result.avg_error,
-        "parameters": [_serialize_parameter_set_map(param_set) for param_set in result.parameters],
-        "inputs": tolist(result.inputs),
-        "expected": tolist(result.expected),
-        "actual": tolist(result.actual)
+        "totalError": float(result.total_error),
+        "avgError": float(result.avg_error),
+        "inputs": options.array(result.inputs),
+        "expected": options.array(result.expected),
+        "actual": options.array(result.actual)
     }
+    if options.include_parameters:
+        serialized["parameters"] = [_serialize_parameter_set_map(param_set, options)
+                                    for param_set in result.parameters]
+    return serialized
 
 
 serialize_map[BatchResult] = serialize_batch_result
 
 
-def serialize_validation_result(result: ValidationResult):
+def serialize_validation_result(result: ValidationResult,
+                                options: SerializationOptions = DEFAULT_OPTIONS):
     return {
-        "inputs": tolist(result.inputs),
-        "expected": tolist(result.expected),
-        "actual": tolist(result.actual),
-        "error": result.error
+        "inputs": options.array(result.inputs),
+        "expected": options.array(result.expected),
+        "actual": options.array(result.actual),
+        "error": float(result.error),
+        "avgError": float(result.avg_error),
+        "sampleCount": result.sample_count
     }
 
 
 serialize_map[ValidationResult] = serialize_validation_result
 
 
-def serialize_neural_network(network: NeuralNetwork):
-    return {
+def serialize_neural_network(network: NeuralNetwork,
+                             options: SerializationOptions = DEFAULT_OPTIONS):
+    serialized = {
         "id": network.id,
-        "totalError": network.total_error,
+        "totalError": float(network.total_error),
         "inputCount": network.input_count,
         "outputCount": network.output_count,
         "layerCount": network.layer_count,
-        "outputs": tolist(network.outputs),
-        "parameters": [_serialize_parameter_set_map(param) for param in network.get_parameters()]
+        "outputs": options.array(network.outputs)
     }
+    if options.include_parameters:
+        serialized["parameters"] = [_serialize_parameter_set_map(param, options)
+                                    for param in network.get_parameters()]
+    return serialized
 
 
-def serialize_trainer(trainer: Trainer):
+def serialize_trainer(trainer: Trainer, options: SerializationOptions = DEFAULT_OPTIONS):
     return {
         "id": trainer.id,
         "networkId": trainer.network.id,
@@ -111,13 +212,13 @@ def serialize_trainer(trainer: Trainer):
     }
 
 
-def serialize(target):
+def serialize(target, options: SerializationOptions = DEFAULT_OPTIONS):
     if isinstance(target, Trainer):
-        return serialize_trainer(target)
+        return serialize_trainer(target, options)
     elif isinstance(target, NeuralNetwork):
-        return serialize_neural_network(target)
+        return serialize_neural_network(target, options)
 
     serializer = serialize_map.get(target.__class__)
     if serializer is None:
         raise ValueError("Serialization not implemented for " + type(target).__name__)
-    return serializer(target)
+    return serializer(target, options)
@@ -0,0 +1,45 @@
+import base64
+import unittest
+
+import numpy as np
+
+from modeling.common.serializers import serialize, SerializationOptions, BASE64_ENCODING
+from modeling.domain_objects import ParameterSet, DeltaTrace
+
+
+def traced_parameter_set() -> ParameterSet:
+    parameter_set = ParameterSet("param_1", [[1, 2], [3, 4]], [[5, 6], [7, 8]])
+    parameter_set.trace = DeltaTrace(parameter_set.size, 2)
+    parameter_set.update_delta_values("Gradient", parameter_set.gradients)
+    parameter_set.update_delta_values("Rate", parameter_set.delta_values * .5)
+    return parameter_set
+
+
+class ParameterSetSerializerTest(unittest.TestCase):
+    def test_list_encoding(self):
+        result = serialize(traced_parameter_set())
+        self.assertEqual(result["values"], [[1, 2], [3, 4]])
+        self.assertEqual(result["dimensionDepth"], 2)
+        self.assertEqual(result["deltas"][1][0]["value"], 3.5)
+        self.assertEqual(result["deltas"][1][0]["steps"], [
+            {"name": "Gradient", "input": 0., "output": 7.},
+            {"name": "Rate", "input": 7., "output": 3.5}])
+
+    def test_without_delta_steps(self):
+        result = serialize(traced_parameter_set(), SerializationOptions(include_delta_steps=False))
+        self.assertEqual(result["deltas"][0][1], {"value": 3., "steps": []})
+
+    def test_base64_encoding(self):
+        result = serialize(traced_parameter_set(),
+                           SerializationOptions(array_encoding=BASE64_ENCODING))
+        delta_values = result["deltaValues"]
+        decoded = np.frombuffer(base64.b64decode(delta_values["data"]), delta_values["dtype"])
+        np.testing.assert_array_equal(np.reshape(decoded, delta_values["shape"]),
+                                      [[2.5, 3], [3.5, 4]])
+        self.assertEqual(result["deltaTrace"]["names"], ["Gradient", "Rate"])
+        self.assertEqual(result["deltaTrace"]["outputs"]["shape"], [2, 4])
+        self.assertNotIn("deltas", result)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import threading
+import types
+import weakref
+from multiprocessing import shared_memory
+from typing import Iterator, Mapping, Tuple
+
+import numpy as np
+
+# Arrays start on cache line boundaries, so processes writing neighbouring arrays don't contend.
+ALIGNMENT = 64
+
+# Held while shared_memory's resource tracker is swapped out to attach without registering.
+_tracker_lock = threading.Lock()
+
+
+class SharedArrays:
+    """
+    Named numpy arrays packed into one multiprocessing.shared_memory block. The process that
+    creates the block owns it and unlinks it when closed. Pickling sends the block's name and
+    layout, and unpickling attaches to the same memory, so what one process writes into an array
+    the others read in place.
+    """
+
+    def __init__(self, shapes: Mapping[str, Tuple[int, ...]], dtypes: Mapping[str, np.dtype] = None,
+                 name: str = None):
+        """
+        :param dtypes: The dtype of each array, float64 for those that are not in the mapping.
+        :param name: Attach to an existing block instead of creating one.
+        """
+        self.shapes = {key: tuple(shape) for key, shape in shapes.items()}
+        self.dtypes = {key: np.dtype((dtypes or {}).get(key, np.float64)) for key in self.shapes}
+        self.offsets = {}
+        size = 0
+        for key, shape in self.shapes.items():
+            self.offsets[key] = size
+            nbytes = int(np.prod(shape, dtype=int)) * self.dtypes[key].itemsize
+            size += -(-nbytes // ALIGNMENT) * ALIGNMENT
+
+        self.owner = name is None
+        if self.owner:
+            with _tracker_lock:
+                self.memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+            self._finalizer = weakref.finalize(self, _unlink, self.memory)
+        else:
+            self.memory = _attach(name)
+            self._finalizer = weakref.finalize(self, _close, self.memory)
+        # frombuffer keeps the block's buffer exported while any array, or view of one, is alive,
+        # so the block can't be unmapped from under them.
+        self.arrays = {key: np.frombuffer(self.memory.buf, self.dtypes[key],
+                                          int(np.prod(shape, dtype=int)),
+                                          self.offsets[key]).reshape(shape)
+                       for key, shape in self.shapes.items()}
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    def __getitem__(self, key: str) -> np.ndarray:
+        return self.arrays[key]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.arrays
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.arrays)
+
+    def close(self):
+        """
+        Detaches from the block, and unlinks it if this process created it. Arrays that are still
+        referenced keep the mapping until they are dropped.
+        """
+        self.arrays = {}
+        self._finalizer()
+
+    def __reduce__(self):
+        return SharedArrays, (self.shapes, {key: dtype.str for key, dtype in self.dtypes.items()},
+                              self.name)
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    # Only the creating process should unlink the block, so attaching must not register it with
+    # this process's resource tracker, which unlinks what is still registered when the process
+    # exits.
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    # Before Python 3.13 attaching always registers the block. Unregistering it afterwards would
+    # also drop the creator's registration from a tracker shared with it, eg. by a process started
+    # with multiprocessing, so registration is skipped instead.
+    with _tracker_lock:
+        tracker = shared_memory.resource_tracker
+        shared_memory.resource_tracker = types.SimpleNamespace(register=lambda *args: None)
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            shared_memory.resource_tracker = tracker
+
+
+def _close(memory: shared_memory.SharedMemory):
+    try:
+        memory.close()
+    except BufferError:
+        # Arrays of the block are still referenced. They keep the mapping alive through its buffer,
+        # so it is handed over to them and released with the last of them.
+        memory._buf = None
+        memory._mmap = None
+        memory.close()
+
+
+def _unlink(memory: shared_memory.SharedMemory):
+    _close(memory)
+    try:
+        memory.unlink()
+    except FileNotFoundError:
+        # Already unlinked, eg. by a resource tracker.
+        pass
@@ -0,0 +1,30 @@
+import pickle
+import unittest
+
+import numpy as np
+
+from modeling.common.shared_arrays import SharedArrays
+
+
+class SharedArraysTest(unittest.TestCase):
+    def test_arrays_share_memory_across_attachments(self):
+        shared = SharedArrays({"values": (3, 2), "errors": (5,)}, dtypes={"errors": np.float32})
+        try:
+            self.assertEqual(shared["values"].shape, (3, 2))
+            self.assertEqual(shared["errors"].dtype, np.float32)
+            self.assertEqual(shared.offsets["errors"] % 64, 0)
+
+            attached = pickle.loads(pickle.dumps(shared))
+            self.assertFalse(attached.owner)
+            shared["values"][1] = [4, 5]
+            attached["errors"][:] = 2
+            np.testing.assert_array_equal(attached["values"][1], [4, 5])
+            np.testing.assert_array_equal(shared["errors"], [2] * 5)
+            attached.close()
+            np.testing.assert_array_equal(shared["values"][1], [4, 5])
+        finally:
+            shared.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,4 @@
-import collections
+import collections.abc
 from typing import List, Union, Sequence, Any
 
 import numpy as np
@@ -8,12 +8,12 @@ def same_size(*args: List[Sequence]):
     if len(args) == 0:
         return True
 
-    if not isinstance(args[0], collections.Sized):
+    if not isinstance(args[0], collections.abc.Sized):
         return False
 
     size = len(args[0])
     for l in args:
-        if not isinstance(l, collections.Sized):
+        if not isinstance(l, collections.abc.Sized):
             return False
 
         if len(l) != size:
@@ -1,4 +1,4 @@
-from typing import Callable, Iterable, Mapping
+from typing import Iterable, List, Mapping, Sequence
 
 import numpy as np
 
@@ -19,6 +19,55 @@ class Delta:
         self.steps.append(step)
 
 
+class DeltaTrace:
+    """
+    The DeltaSteps applied to some or all elements of a ParameterSet, stored in preallocated
+    (step, element) arrays rather than as DeltaStep objects.
+    """
+
+    def __init__(self, size: int, step_count: int, indices: Sequence[int] = None):
+        self.size = size
+        self.indices = None if indices is None else np.unique(indices)
+        width = size if self.indices is None else len(self.indices)
+        self.names = []
+        self.input_values = np.empty((step_count, width))
+        self.output_values = np.empty((step_count, width))
+
+    def record(self, name: str, delta_values: np.ndarray, updated_values: np.ndarray,
+               mask: np.ndarray = None):
+        row = len(self.names)
+        if row == len(self.input_values):
+            self.input_values = np.concatenate([self.input_values, np.empty_like(self.input_values)])
+            self.output_values = np.concatenate(
+                [self.output_values, np.empty_like(self.output_values)])
+        self.names.append(name)
+
+        self.input_values[row] = self._select(delta_values)
+        self.output_values[row] = self._select(updated_values)
+        if mask is not None:
+            np.copyto(self.output_values[row], self.input_values[row],
+                      where=np.logical_not(self._select(mask)))
+
+    def steps(self, index: int) -> List[DeltaStep]:
+        column = self._column(index)
+        if column is None:
+            return []
+        return [DeltaStep(name, self.input_values[row, column], self.output_values[row, column])
+                for row, name in enumerate(self.names)]
+
+    def _select(self, values: np.ndarray) -> np.ndarray:
+        values = np.ravel(values)
+        return values if self.indices is None else values[self.indices]
+
+    def _column(self, index: int):
+        if self.indices is None:
+            return index
+        column = np.searchsorted(self.indices, index)
+        if column < len(self.indices) and self.indices[column] == index:
+            return column
+        return None
+
+
 class Parameter:
     def __init__(self, set_name: str, index: int, value: float, gradient: float, delta: Delta):
         self.name = set_name + "_" + str(index)
@@ -28,34 +77,133 @@ class Parameter:
 
 
 class ParameterSet:
+    """
+    A named group of parameters, eg. the weights of one layer. Values, gradients and delta values
+    are kept as arrays; per-element Parameter objects are only created when they are asked for.
+    """
+
     def __init__(self, name: str, values: np.ndarray, gradients: np.ndarray):
-        values = np.asarray(values)
-        gradients = np.asarray(gradients)
+        values = np.array(values, dtype=float)
+        gradients = np.array(gradients, dtype=float)
         if values.shape != gradients.shape:
             raise ValueError("Parameter values and gradients must be the same shape")
         self.shape = values.shape
         self.name = name
 
-        self.parameters = [Parameter(self.name, idx, value, gradient, Delta())
-                           for idx, value, gradient in
-                           zip(range(values.size), values.flatten(), gradients.flatten())]
+        self.values = values
+        self.gradients = gradients
+        self.delta_values = np.zeros(self.shape)
+        # Elements that update steps still apply to. None means all of them.
+        self.mask = None
+        # Record of the update steps applied to this set. None when tracing is off.
+        self.trace = None
+
+        self._parameters = None
+        self._parameter_map = None
+        self._delta_steps = {}
+
+    @property
+    def size(self) -> int:
+        return self.values.size
+
+    @property
+    def parameters(self) -> List[Parameter]:
+        if self._parameters is None:
+            self._parameters = [_ParameterView(self, idx) for idx in range(self.size)]
+        return self._parameters
+
+    @property
+    def parameter_map(self) -> Mapping[str, Parameter]:
+        if self._parameter_map is None:
+            self._parameter_map = {p.name: p for p in self.parameters}
+        return self._parameter_map
+
+    @property
+    def active_parameters(self) -> List[Parameter]:
+        if self.mask is None:
+            return self.parameters
+        return [self.parameters[idx] for idx in np.flatnonzero(self.mask)]
+
+    @property
+    def deltas(self) -> np.ndarray:
+        deltas = np.empty(self.size, dtype=object)
+        deltas[:] = [p.delta for p in self.parameters]
+        return np.reshape(deltas, self.shape)
+
+    def delta_steps(self, index: int) -> List[DeltaStep]:
+        """
+        The steps that produced the delta of the element at the flat index.
+        """
+        steps = [] if self.trace is None else self.trace.steps(index)
+        return steps + self._delta_steps.get(index, [])
+
+    def update_delta_values(self, step_name: str, updated_values: np.ndarray):
+        """
+        Sets the delta values of the active elements and records the change in the trace.
+        """
+        if self.trace is not None:
+            self.trace.record(step_name, self.delta_values, updated_values, self.mask)
+        np.copyto(self.delta_values, updated_values, where=True if self.mask is None else self.mask)
+
+
+class _DeltaView(Delta):
+    """
+    A Delta whose value is stored in the delta array of its ParameterSet.
+    """
+
+    def __init__(self, parameter_set: ParameterSet, index: int):
+        self._parameter_set = parameter_set
+        self._index = index
+
+    @property
+    def value(self) -> float:
+        return self._parameter_set.delta_values.flat[self._index]
 
-        self.parameter_map = {p.name: p for p in self.parameters}
+    @value.setter
+    def value(self, value: float):
+        self._parameter_set.delta_values.flat[self._index] = value
 
     @property
-    def values(self):
-        return self.__param_value(lambda p: p.value)
+    def steps(self) -> List[DeltaStep]:
+        return self._parameter_set.delta_steps(self._index)
+
+    def add_step(self, step: DeltaStep):
+        self._parameter_set._delta_steps.setdefault(self._index, []).append(step)
+
+
+class _ParameterView(Parameter):
+    """
+    A Parameter whose value and gradient are stored in the arrays of its ParameterSet.
+    """
+
+    def __init__(self, parameter_set: ParameterSet, index: int):
+        self._parameter_set = parameter_set
+        self._index = index
+        self.delta = _DeltaView(parameter_set, index)
+
+    @property
+    def index(self) -> int:
+        return self._index
 
     @property
-    def gradients(self):
-        return self.__param_value(lambda p: p.gradient)
+    def name(self) -> str:
+        return self._parameter_set.name + "_" + str(self._index)
+
+    @property
+    def value(self) -> float:
+        return self._parameter_set.values.flat[self._index]
+
+    @value.setter
+    def value(self, value: float):
+        self._parameter_set.values.flat[self._index] = value
 
     @property
-    def deltas(self):
-        return self.__param_value(lambda p: p.delta)
+    def gradient(self) -> float:
+        return self._parameter_set.gradients.flat[self._index]
 
-    def __param_value(self, select: Callable[[Parameter], float]) -> np.ndarray:
-        return np.reshape(list(map(select, self.parameters)), self.shape)
+    @gradient.setter
+    def gradient(self, gradient: float):
+        self._parameter_set.gradients.flat[self._index] = gradient
 
 
 def parameter_set_map(parameter_sets: Iterable[ParameterSet]) -> Mapping[str, ParameterSet]:
@@ -0,0 +1,49 @@
+import unittest
+
+import numpy as np
+
+from modeling.domain_objects import ParameterSet, DeltaStep
+
+
+class ParameterSetTest(unittest.TestCase):
+    def test_arrays(self):
+        parameter_set = ParameterSet("param_1", [[1, 2, 3], [4, 5, 6]], [[5, 10, -5], [0, 100, -50]])
+        self.assertEqual(parameter_set.shape, (2, 3))
+        self.assertEqual(parameter_set.size, 6)
+        np.testing.assert_array_equal(parameter_set.values, [[1, 2, 3], [4, 5, 6]])
+        np.testing.assert_array_equal(parameter_set.gradients, [[5, 10, -5], [0, 100, -50]])
+        np.testing.assert_array_equal(parameter_set.delta_values, np.zeros((2, 3)))
+
+    def test_values_are_copied(self):
+        values = np.ones(3)
+        parameter_set = ParameterSet("param_1", values, np.zeros(3))
+        parameter_set.values += 1
+        np.testing.assert_array_equal(values, np.ones(3))
+
+    def test_shape_mismatch(self):
+        with self.assertRaises(ValueError):
+            ParameterSet("param_1", [1, 2, 3], [1, 2])
+
+    def test_parameters_are_lazy(self):
+        parameter_set = ParameterSet("param_1", np.zeros((100, 100)), np.zeros((100, 100)))
+        self.assertIsNone(parameter_set._parameters)
+        self.assertEqual(len(parameter_set.parameters), 10000)
+        self.assertIs(parameter_set.parameters, parameter_set.parameters)
+
+    def test_parameters_write_through(self):
+        parameter_set = ParameterSet("param_1", [[1, 2], [3, 4]], [[5, 6], [7, 8]])
+        parameter = parameter_set.parameter_map["param_1_2"]
+        self.assertEqual(parameter.value, 3)
+        self.assertEqual(parameter.gradient, 7)
+
+        parameter.value += 10
+        parameter.gradient = -1
+        parameter.delta.value = .5
+        parameter.delta.add_step(DeltaStep("step", 0, .5))
+
+        np.testing.assert_array_equal(parameter_set.values, [[1, 2], [13, 4]])
+        np.testing.assert_array_equal(parameter_set.gradients, [[5, 6], [-1, 8]])
+        np.testing.assert_array_equal(parameter_set.delta_values, [[0, 0], [.5, 0]])
+        self.assertEqual(parameter_set.deltas[1][0].value, .5)
+        self.assertEqual(len(parameter_set.deltas[1][0].steps), 1)
+        self.assertEqual(len(parameter_set.deltas[0][0].steps), 0)
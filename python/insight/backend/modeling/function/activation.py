@@ -1,3 +1,5 @@
+import numpy as np
+
 from modeling.function.base import Func
 
 
@@ -12,9 +14,30 @@ class RectifiedLinearUnitActivation(Func):
     def _apply_derivative(self, value: float):
         return 1 if value > 0 else self.leak
 
+    def _apply_array(self, value: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+        out = np.multiply(value, self.leak, out=out)
+        return np.maximum(out, value, out=out)
+
+    def _apply_derivative_array(self, value: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+        out = np.greater(value, 0, out=np.empty(value.shape) if out is None else out)
+        if self.leak != 0:
+            np.copyto(out, self.leak, where=out == 0)
+        return out
+
 
 class IdentityActivation(Func):
-    # TODO(domenic): Override the apply and apply_derivative functions to improve performance.
     def _apply(self, value: float): return value
 
     def _apply_derivative(self, value: float): return 1
+
+    def _apply_array(self, value: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+        if out is None:
+            return value
+        np.copyto(out, value)
+        return out
+
+    def _apply_derivative_array(self, value: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+        if out is None:
+            return np.ones_like(value, dtype=float)
+        out.fill(1.)
+        return out
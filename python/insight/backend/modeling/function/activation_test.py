@@ -1,6 +1,8 @@
 import unittest
 
-from modeling.function.activation import RectifiedLinearUnitActivation
+import numpy as np
+
+from modeling.function.activation import RectifiedLinearUnitActivation, IdentityActivation
 
 
 class RectifiedLinearUnit(unittest.TestCase):
@@ -27,3 +29,23 @@ class RectifiedLinearUnit(unittest.TestCase):
         self.assertEqual(relu.apply_derivative(5.), 1.)
         self.assertEqual(relu.apply_derivative(0.), .01)
         self.assertEqual(relu.apply_derivative(-.5), .01)
+
+    def test_apply_array(self):
+        relu = RectifiedLinearUnitActivation(leak=.01)
+        values = np.array([[5., 0., -.5], [-2., 3., .25]])
+        np.testing.assert_allclose(relu.apply(values), [[5., 0., -.005], [-.02, 3., .25]])
+        np.testing.assert_allclose(relu.apply_derivative(values), [[1., .01, .01], [.01, 1., 1.]])
+
+
+class Identity(unittest.TestCase):
+    def test_apply_array_does_not_copy(self):
+        identity = IdentityActivation()
+        values = np.array([[5., 0.], [-.5, 2.]])
+        self.assertIs(identity.apply(values), values)
+        np.testing.assert_array_equal(identity.apply_derivative(values), np.ones((2, 2)))
+
+    def test_apply_scalar(self):
+        identity = IdentityActivation()
+        self.assertEqual(identity.apply(-.5), -.5)
+        self.assertEqual(identity.apply_derivative(-.5), 1)
+
@@ -6,23 +6,40 @@ from modeling.common.utils import same_type, same_size
 
 class Func(metaclass=ABCMeta):
 
-    def apply(self, value: np.ndarray) -> np.ndarray:
-        if same_type(float, value):
+    def apply(self, value: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+        """
+        :param out: An array of value's shape to write array results into instead of allocating.
+        """
+        if isinstance(value, np.ndarray):
+            return self._apply_array(value, out)
+        elif same_type(float, value):
             return self._apply(value)
         elif same_size(value):
-            return np.array([self._apply(v) for v in value])
+            return np.array([self.apply(v) for v in value])
         else:
             raise ValueError("Value must be a float or list of floats.")
 
-    def apply_derivative(self, value: np.ndarray) -> \
-            np.ndarray:
-        if same_type(float, value):
+    def apply_derivative(self, value: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+        if isinstance(value, np.ndarray):
+            return self._apply_derivative_array(value, out)
+        elif same_type(float, value):
             return self._apply_derivative(value)
         elif same_size(value):
-            return np.array([self._apply_derivative(v) for v in value])
+            return np.array([self.apply_derivative(v) for v in value])
         else:
             raise ValueError("Value must be a float or list of floats.")
 
+    def _apply_array(self, value: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+        """
+        Applies the function to every element of an array, writing into out when it is given.
+        Subclasses should override this with numpy ufuncs; the default falls back to calling
+        _apply on each element.
+        """
+        return _into(np.vectorize(self._apply, otypes=[float])(value), out)
+
+    def _apply_derivative_array(self, value: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+        return _into(np.vectorize(self._apply_derivative, otypes=[float])(value), out)
+
     @abstractmethod
     def _apply(self, value: float) -> float:
         pass
@@ -32,27 +49,56 @@ class Func(metaclass=ABCMeta):
         pass
 
 
+def _into(result: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    if out is None:
+        return result
+    np.copyto(out, result)
+    return out
+
+
 class Func2(metaclass=ABCMeta):
     def apply(self, v_1: np.ndarray, v_2: np.ndarray) -> np.ndarray:
-        if same_type(float, v_1, v_2):
+        if isinstance(v_1, np.ndarray) or isinstance(v_2, np.ndarray):
+            return self._apply_array(*self._same_shape_arrays(v_1, v_2))
+        elif same_type(float, v_1, v_2):
             return self._apply(v_1, v_2)
         elif same_size(v_1, v_2):
-            return np.array([self._apply(a, e) for a, e in zip(v_1, v_2)])
+            return np.array([self.apply(a, e) for a, e in zip(v_1, v_2)])
         else:
             raise ValueError("Value must be a float or list of floats.")
 
     def apply_derivative(self, actual: np.ndarray, expected: np.ndarray) -> np.ndarray:
-        if same_type(float, actual, expected):
+        if isinstance(actual, np.ndarray) or isinstance(expected, np.ndarray):
+            return self._apply_derivative_array(*self._same_shape_arrays(actual, expected))
+        elif same_type(float, actual, expected):
             return self._apply_derivative(actual, expected)
         elif same_size(actual, expected):
-            return np.array([self._apply_derivative(a, e) for a, e in zip(actual, expected)])
+            return np.array([self.apply_derivative(a, e) for a, e in zip(actual, expected)])
         else:
             raise ValueError("Value must be a float or list of floats.")
 
+    @staticmethod
+    def _same_shape_arrays(v_1, v_2):
+        v_1 = np.asarray(v_1)
+        v_2 = np.asarray(v_2)
+        if v_1.shape != v_2.shape:
+            raise ValueError("Values must be the same shape.")
+        return v_1, v_2
+
+    def _apply_array(self, v_1: np.ndarray, v_2: np.ndarray) -> np.ndarray:
+        """
+        Applies the function to every pair of elements of two arrays. Subclasses should override
+        this with numpy ufuncs; the default falls back to calling _apply on each pair.
+        """
+        return np.vectorize(self._apply, otypes=[float])(v_1, v_2)
+
+    def _apply_derivative_array(self, v_1: np.ndarray, v_2: np.ndarray) -> np.ndarray:
+        return np.vectorize(self._apply_derivative, otypes=[float])(v_1, v_2)
+
     @abstractmethod
     def _apply(self, v_1: float, v_2: float) -> float:
         pass
 
     @abstractmethod
     def _apply_derivative(self, v_1: float, v_2: float) -> float:
-        pass
\ No newline at end of file
+        pass
@@ -1,3 +1,5 @@
+import numpy as np
+
 from modeling.function.base import Func2
 
 
@@ -7,3 +9,9 @@ class QuadraticCost(Func2):
 
     def _apply_derivative(self, actual: float, expected: float) -> float:
         return actual - expected
+
+    def _apply_array(self, actual: np.ndarray, expected: np.ndarray) -> np.ndarray:
+        return .5 * np.square(actual - expected)
+
+    def _apply_derivative_array(self, actual: np.ndarray, expected: np.ndarray) -> np.ndarray:
+        return np.subtract(actual, expected)
@@ -0,0 +1,20 @@
+import unittest
+
+import numpy as np
+
+from modeling.function.cost import QuadraticCost
+
+
+class QuadraticCostTest(unittest.TestCase):
+    def test_apply_array_matches_scalar(self):
+        cost = QuadraticCost()
+        actual = np.array([[1., 2.], [-3., .5]])
+        expected = np.array([[.5, 2.], [1., -1.]])
+        np.testing.assert_allclose(
+            cost.apply(actual, expected),
+            [[cost.apply(a, e) for a, e in zip(*pair)] for pair in zip(actual, expected)])
+        np.testing.assert_allclose(cost.apply_derivative(actual, expected), actual - expected)
+
+    def test_apply_array_shape_mismatch(self):
+        with self.assertRaises(ValueError):
+            QuadraticCost().apply(np.zeros(3), np.zeros(2))
@@ -1,5 +1,5 @@
 from abc import ABCMeta, abstractmethod
-from typing import Mapping, Sequence
+from typing import Mapping, Sequence, Tuple
 
 import numpy as np
 
@@ -7,6 +7,14 @@ from modeling.function.activation import Func, IdentityActivation, RectifiedLine
 from modeling.domain_objects import ParameterSet, parameter_set_map
 from modeling.parameter_generators import ParameterGenerator, ConstantParameterGenerator
 from modeling.parameter_updaters import ParameterUpdater
+from modeling.precision import DTypePolicy, FLOAT64
+from modeling.profiling import Profiler, NULL_PROFILER
+
+# Scratch buffers a layer keeps before starting over, in case batch sizes keep changing.
+MAX_BUFFERS = 64
+
+# The columns of a parameter set that takes up the whole of its values array.
+ALL_COLUMNS = slice(None)
 
 
 class Layer:
@@ -28,45 +36,178 @@ class Layer:
         self.inputs = np.zeros(input_count)
         self.pre_activation = np.zeros(input_count)
         self.outputs = np.zeros(output_count)
-        self.cached_derivative = np.matrix(np.ones(output_count))
+        self.cached_derivative = np.ones((1, output_count))
         self.parameter_updater = parameter_updater
         self.activation = activation
+        # Samples whose gradients have been averaged into the gradient arrays since the parameters
+        # were last adjusted.
+        self.accumulated_sample_count = 0
+        self.dtype_policy = FLOAT64
+        # Master copies of the parameter values, keyed by attribute name, when the dtype policy
+        # keeps them.
+        self._masters = {}
+        self._buffers = {}
+        self.profiler = NULL_PROFILER
+        self.phase_name = "level_" + str(level)
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.dtype_policy.compute_dtype
+
+    def set_dtype_policy(self, policy: DTypePolicy):
+        """
+        Converts the parameters, gradients and scratch buffers to the policy's types.
+        """
+        masters = {}
+        for values_name, gradients_name in self.storage_attributes():
+            values = self._masters.get(values_name, getattr(self, values_name))
+            if policy.keeps_masters:
+                masters[values_name] = np.array(values, dtype=policy.master_dtype)
+            setattr(self, values_name, np.array(values, dtype=policy.compute_dtype))
+            setattr(self, gradients_name,
+                    np.array(getattr(self, gradients_name), dtype=policy.compute_dtype))
+        self.dtype_policy = policy
+        self._masters = masters
+        self._buffers.clear()
+
+    def set_profiler(self, profiler: Profiler):
+        """
+        Times the layer's forward, backward, gradients and adjust phases, and its updater's steps,
+        as level_<level>/<phase>.
+        """
+        self.profiler = profiler
+        self.parameter_updater.set_profiler(profiler, self.phase_name + "/update")
+
+    def buffer(self, name: str, shape: Tuple[int, ...]) -> np.ndarray:
+        """
+        A scratch array owned by the layer and reused by every pass with the same shape. Its
+        contents are overwritten by the next pass.
+        """
+        key = (name, shape)
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            if len(self._buffers) >= MAX_BUFFERS:
+                self._buffers.clear()
+            buffer = self._buffers[key] = np.empty(shape, dtype=self.dtype)
+        return buffer
 
     def forward_pass(self, raw_inputs: np.ndarray) -> np.ndarray:
-        self.inputs = raw_inputs
-        self.pre_activation = self.transform(raw_inputs)
-        self.outputs = self.activation.apply(self.pre_activation)
-        return self.outputs
+        """
+        Accepts either a single input vector or a (batch, input_count) matrix of input vectors.
+        The returned outputs are a buffer that the next forward pass overwrites.
+        """
+        with self.profiler.phase(self.phase_name, "forward"):
+            self.inputs = np.asarray(raw_inputs, dtype=self.dtype)
+            self.pre_activation = self.transform(self.inputs)
+            self.outputs = self.activation.apply(
+                self.pre_activation, out=self.buffer("outputs", self.pre_activation.shape))
+            return self.outputs
 
     def backward_pass(self, upstream_derivative: np.ndarray) -> np.ndarray:
-        self.cached_derivative = upstream_derivative
-        self.calculate_gradients()
-        self.cached_derivative = np.multiply(self.activation.apply_derivative(self.inputs),
-                                             np.matmul(self.cached_derivative,
-                                                       self.transform_derivative()))
-        return self.cached_derivative
+        """
+        Takes a (batch, output_count) matrix of upstream derivatives and returns the
+        (batch, input_count) derivatives for the layer below. Gradients are averaged over the batch
+        and over every earlier backward pass since the parameters were last adjusted.
+        """
+        with self.profiler.phase(self.phase_name, "backward"):
+            self.cached_derivative = np.atleast_2d(upstream_derivative)
+            with self.profiler.phase(self.phase_name, "gradients"):
+                self.calculate_gradients()
+            self.accumulated_sample_count += self.batch_count
+            downstream_derivative = self.transform_derivative(self.cached_derivative)
+            activation_derivative = self.activation.apply_derivative(
+                self.inputs, out=self.buffer("activation_derivative", self.inputs.shape))
+            self.cached_derivative = np.multiply(downstream_derivative, activation_derivative,
+                                                 out=downstream_derivative)
+            return self.cached_derivative
+
+    @property
+    def batch_count(self) -> int:
+        return len(self.cached_derivative)
+
+    def accumulate_gradient(self, gradients: np.ndarray, batch_gradients: np.ndarray):
+        """
+        Folds the mean gradients of the current batch into the running mean held in gradients,
+        in place. batch_gradients is used as scratch space.
+        """
+        if self.accumulated_sample_count == 0:
+            np.copyto(gradients, batch_gradients)
+        else:
+            np.subtract(batch_gradients, gradients, out=batch_gradients)
+            batch_gradients *= self.batch_count / (self.accumulated_sample_count + self.batch_count)
+            gradients += batch_gradients
+
+    def mean_gradient(self, name: str, error: np.ndarray) -> np.ndarray:
+        """
+        The mean over the batch of a (batch, width) error, eg. a bias gradient.
+        """
+        return np.mean(error, axis=0, out=self.buffer(name, np.shape(error)[-1:]))
+
+    def mean_weight_gradient(self, name: str, error: np.ndarray) -> np.ndarray:
+        """
+        The mean over the batch of the outer products of the inputs and a (batch, width) error.
+        """
+        gradient = np.matmul(np.transpose(np.atleast_2d(self.inputs)), error,
+                             out=self.buffer(name, (self.input_count, np.shape(error)[-1])))
+        gradient /= self.batch_count
+        return gradient
 
     def adjust_parameters(
             self,
-            param_set_maps: Sequence[Mapping[str, ParameterSet]]) -> Mapping[str, ParameterSet]:
-        result = self.parameter_updater.adjust(param_set_maps)
-        self.set_parameters(result)
-        return result
+            param_set_maps: Sequence[Mapping[str, ParameterSet]] = None) -> \
+            Mapping[str, ParameterSet]:
+        """
+        Updates the parameters from the gradients accumulated since the last adjustment, or from
+        the given parameter set snapshots.
+        """
+        with self.profiler.phase(self.phase_name, "adjust"):
+            if param_set_maps is None:
+                param_set_maps = [self.get_parameters()]
+            result = self.parameter_updater.adjust(param_set_maps)
+            self.set_parameters(result)
+            self.accumulated_sample_count = 0
+            return result
 
-    @abstractmethod
-    def transform(self, raw_inputs: np.ndarray) -> np.ndarray: pass
+    def get_parameters(self) -> Mapping[str, ParameterSet]:
+        return parameter_set_map([
+            ParameterSet(name,
+                         self._masters.get(values_name, getattr(self, values_name))[..., columns],
+                         getattr(self, gradients_name)[..., columns])
+            for name, values_name, gradients_name, columns in self.parameter_attributes()])
+
+    def set_parameters(self, parameters: Mapping[str, ParameterSet]):
+        for name, values_name, _, columns in self.parameter_attributes():
+            if name in parameters:
+                values = parameters.get(name).values
+                if values_name in self._masters:
+                    np.copyto(self._masters[values_name][..., columns], values)
+                np.copyto(getattr(self, values_name)[..., columns], values, casting='same_kind')
+
+    def storage_attributes(self) -> Sequence[Tuple[str, str]]:
+        """
+        The names of the values and gradients arrays that hold the layer's parameter sets, each
+        pair once.
+        """
+        return sorted({(values_name, gradients_name)
+                       for _, values_name, gradients_name, _ in self.parameter_attributes()})
 
     @abstractmethod
-    def calculate_gradients(self): pass
+    def parameter_attributes(self) -> Sequence[Tuple[str, str, str, slice]]:
+        """
+        The parameter set name, the names of the values and gradients attributes, and the columns
+        of those arrays that hold the set, for each of the layer's parameter sets. Several sets
+        may share the same arrays.
+        """
+        pass
 
     @abstractmethod
-    def transform_derivative(self) -> np.ndarray: pass
+    def transform(self, raw_inputs: np.ndarray) -> np.ndarray: pass
 
     @abstractmethod
-    def get_parameters(self) -> Mapping[str, ParameterSet]: pass
+    def calculate_gradients(self): pass
 
     @abstractmethod
-    def set_parameters(self, parameters: Mapping[str, ParameterSet]): pass
+    def transform_derivative(self, upstream_derivative: np.ndarray) -> np.ndarray: pass
 
 
 # TODO(domenic): Write tests and verify this is correct.
@@ -79,54 +220,55 @@ class LinearLayer(Layer):
     def fx_biases_name(self) -> str:
         return self.parameter_prefix + "fx_biases"
 
-    @property
-    def fx_prime(self):
-        return np.transpose(np.matrix(self.inputs))
-
     def __init__(self,
                  input_count: int,
                  output_count: int,
                  level: int,
                  parameter_updater: ParameterUpdater,
                  parameter_generator: ParameterGenerator = ConstantParameterGenerator(),
-                 activation: Func = RectifiedLinearUnitActivation()):
+                 activation: Func = RectifiedLinearUnitActivation(),
+                 dtype_policy: DTypePolicy = FLOAT64):
         super().__init__(input_count, output_count, level, parameter_updater, activation)
         # Forward pass parameters
-        self.fx_weights = parameter_generator(input_count, output_count)
-        self.fx_biases = parameter_generator(1, output_count)[0]  # Get 1-d array.
+        self.fx_weights = np.array(parameter_generator(input_count, output_count), dtype=float)
+        self.fx_biases = np.array(parameter_generator(1, output_count)[0], dtype=float)  # 1-d
         self.fx = np.zeros(output_count)
 
         # Backward pass parameters
         self.fx_weight_gradients = np.zeros(self.fx_weights.shape)
         self.fx_bias_gradients = np.zeros(len(self.fx_biases))
+        self.set_dtype_policy(dtype_policy)
 
     def transform(self, raw_inputs: np.ndarray) -> np.ndarray:
-        self.fx = np.matmul(raw_inputs, self.fx_weights) + self.fx_biases
+        self.fx = np.matmul(raw_inputs, self.fx_weights,
+                            out=self.buffer("fx", raw_inputs.shape[:-1] + (self.output_count,)))
+        self.fx += self.fx_biases
         return self.fx
 
-    def transform_derivative(self) -> np.ndarray:
-        return np.transpose(self.fx_weights)
+    def transform_derivative(self, upstream_derivative: np.ndarray) -> np.ndarray:
+        return np.matmul(upstream_derivative, np.transpose(self.fx_weights),
+                         out=self.buffer("downstream", (len(upstream_derivative), self.input_count)))
 
     def calculate_gradients(self):
         fx_error = self.cached_derivative
-        self.fx_bias_gradients = fx_error.A1  # A1 converts matrix to 1-d array.
-        self.fx_weight_gradients = np.matmul(self.fx_prime, fx_error)
+        self.accumulate_gradient(self.fx_bias_gradients,
+                                 self.mean_gradient("fx_bias_gradients", fx_error))
+        self.accumulate_gradient(self.fx_weight_gradients,
+                                 self.mean_weight_gradient("fx_weight_gradients", fx_error))
 
-    def get_parameters(self) -> Mapping[str, ParameterSet]:
-        return parameter_set_map([
-            ParameterSet(self.fx_weights_name, self.fx_weights, self.fx_weight_gradients),
-            ParameterSet(self.fx_biases_name, self.fx_biases, self.fx_bias_gradients)
-        ])
-
-    def set_parameters(self, parameters: Mapping[str, ParameterSet]):
-        if self.fx_weights_name in parameters:
-            self.fx_weights = parameters.get(self.fx_weights_name).values
-
-        if self.fx_biases_name in parameters:
-            self.fx_biases = parameters.get(self.fx_biases_name).values
+    def parameter_attributes(self) -> Sequence[Tuple[str, str, str, slice]]:
+        return [(self.fx_weights_name, "fx_weights", "fx_weight_gradients", ALL_COLUMNS),
+                (self.fx_biases_name, "fx_biases", "fx_bias_gradients", ALL_COLUMNS)]
 
 
 class QuadraticLayer(Layer):
+    """
+    Outputs f(x) * g(x) for the linear functions f(x) = x * fx_weights + fx_biases and
+    g(x) = x * gx_weights + gx_biases. The f and g parameters are stored side by side as
+    [fx | gx] columns of one weights and one biases array, so both are computed by a single
+    matmul per pass. fx_weights and the other parameter arrays are views of those columns.
+    """
+
     @property
     def fx_weights_name(self) -> str:
         return self.parameter_prefix + "fx_weights"
@@ -144,12 +286,12 @@ class QuadraticLayer(Layer):
         return self.parameter_prefix + "gx_biases"
 
     @property
-    def fx_prime(self):
-        return np.transpose(np.matrix(self.inputs))
+    def fx_columns(self) -> slice:
+        return slice(0, self.output_count)
 
     @property
-    def gx_prime(self):
-        return np.transpose(np.matrix(self.inputs))
+    def gx_columns(self) -> slice:
+        return slice(self.output_count, 2 * self.output_count)
 
     def __init__(self,
                  input_count: int,
@@ -157,56 +299,90 @@ class QuadraticLayer(Layer):
                  level: int,
                  parameter_updater: ParameterUpdater,
                  parameter_generator: ParameterGenerator = ConstantParameterGenerator(),
-                 activation: Func = IdentityActivation()):
+                 activation: Func = IdentityActivation(),
+                 dtype_policy: DTypePolicy = FLOAT64):
         super().__init__(input_count, output_count, level, parameter_updater, activation)
         # Forward pass parameters
-        self.fx_weights = parameter_generator(input_count, output_count)
-        self.fx_biases = parameter_generator(1, output_count)[0]  # Get 1-d array.
+        fx_weights = parameter_generator(input_count, output_count)
+        fx_biases = parameter_generator(1, output_count)[0]
+        gx_weights = parameter_generator(input_count, output_count)
+        gx_biases = parameter_generator(1, output_count)[0]
+        self.weights = np.array(np.concatenate([fx_weights, gx_weights], axis=1), dtype=float)
+        self.biases = np.array(np.concatenate([fx_biases, gx_biases]), dtype=float)  # 1-d
         self.fx = np.zeros(output_count)
-        self.gx_weights = parameter_generator(input_count, output_count)
-        self.gx_biases = parameter_generator(1, output_count)[0]  # Get 1-d array.
         self.gx = np.zeros(output_count)
 
         # Backward pass parameters
-        self.fx_weight_gradients = np.zeros(self.fx_weights.shape)
-        self.fx_bias_gradients = np.zeros(len(self.fx_biases))
-        self.gx_weight_gradients = np.zeros(self.gx_weights.shape)
-        self.gx_bias_gradients = np.zeros(len(self.gx_biases))
+        self.weight_gradients = np.zeros(self.weights.shape)
+        self.bias_gradients = np.zeros(self.biases.shape)
+        self.set_dtype_policy(dtype_policy)
 
-    def transform(self, raw_inputs: np.ndarray) -> np.ndarray:
-        self.fx = np.matmul(raw_inputs, self.fx_weights) + self.fx_biases
-        self.gx = np.matmul(raw_inputs, self.gx_weights) + self.gx_biases
-        return self.fx * self.gx
+    @property
+    def fx_weights(self) -> np.ndarray:
+        return self.weights[:, self.fx_columns]
 
-    def transform_derivative(self) -> np.ndarray:
-        return np.transpose(self.gx_weights * self.fx + self.fx_weights * self.gx)
+    @property
+    def fx_biases(self) -> np.ndarray:
+        return self.biases[self.fx_columns]
 
-    def calculate_gradients(self):
-        fx_error = np.multiply(self.gx, self.cached_derivative)
-        self.fx_bias_gradients = fx_error.A1  # A1 converts matrix to 1-d array.
-        self.fx_weight_gradients = np.matmul(self.fx_prime, fx_error)
+    @property
+    def gx_weights(self) -> np.ndarray:
+        return self.weights[:, self.gx_columns]
+
+    @property
+    def gx_biases(self) -> np.ndarray:
+        return self.biases[self.gx_columns]
 
-        gx_error = np.multiply(self.fx, self.cached_derivative)
-        self.gx_bias_gradients = gx_error.A1  # A1 converts matrix to 1-d array.
-        self.gx_weight_gradients = np.matmul(self.gx_prime, gx_error)
+    @property
+    def fx_weight_gradients(self) -> np.ndarray:
+        return self.weight_gradients[:, self.fx_columns]
 
-    def get_parameters(self) -> Mapping[str, ParameterSet]:
-        return parameter_set_map([
-            ParameterSet(self.fx_weights_name, self.fx_weights, self.fx_weight_gradients),
-            ParameterSet(self.fx_biases_name, self.fx_biases, self.fx_bias_gradients),
-            ParameterSet(self.gx_weights_name, self.gx_weights, self.gx_weight_gradients),
-            ParameterSet(self.gx_biases_name, self.gx_biases, self.gx_bias_gradients)
-        ])
+    @property
+    def fx_bias_gradients(self) -> np.ndarray:
+        return self.bias_gradients[self.fx_columns]
 
-    def set_parameters(self, parameters: Mapping[str, ParameterSet]):
-        if self.fx_weights_name in parameters:
-            self.fx_weights = parameters.get(self.fx_weights_name).values
+    @property
+    def gx_weight_gradients(self) -> np.ndarray:
+        return self.weight_gradients[:, self.gx_columns]
 
-        if self.fx_biases_name in parameters:
-            self.fx_biases = parameters.get(self.fx_biases_name).values
+    @property
+    def gx_bias_gradients(self) -> np.ndarray:
+        return self.bias_gradients[self.gx_columns]
 
-        if self.gx_weights_name in parameters:
-            self.gx_weights = parameters.get(self.gx_weights_name).values
+    def transform(self, raw_inputs: np.ndarray) -> np.ndarray:
+        shape = raw_inputs.shape[:-1] + (self.output_count,)
+        projection = np.matmul(raw_inputs, self.weights,
+                               out=self.buffer("projection", shape[:-1] + (2 * self.output_count,)))
+        projection += self.biases
+        self.fx = projection[..., self.fx_columns]
+        self.gx = projection[..., self.gx_columns]
+        return np.multiply(self.fx, self.gx, out=self.buffer("pre_activation", shape))
+
+    def transform_derivative(self, upstream_derivative: np.ndarray) -> np.ndarray:
+        # Equivalent to multiplying by (gx_weights * fx + fx_weights * gx)^T for each sample,
+        # without building a per-sample Jacobian.
+        shape = (len(upstream_derivative), self.input_count)
+        return np.matmul(self.errors(upstream_derivative), np.transpose(self.weights),
+                         out=self.buffer("downstream", shape))
+
+    def errors(self, upstream_derivative: np.ndarray) -> np.ndarray:
+        """
+        The (batch, 2 * output_count) upstream derivative with respect to fx, followed by the
+        upstream derivative with respect to gx.
+        """
+        errors = self.buffer("errors", (len(upstream_derivative), 2 * self.output_count))
+        np.multiply(self.gx, upstream_derivative, out=errors[:, self.fx_columns])
+        np.multiply(self.fx, upstream_derivative, out=errors[:, self.gx_columns])
+        return errors
 
-        if self.gx_biases_name in parameters:
-            self.gx_biases = parameters.get(self.gx_biases_name).values
+    def calculate_gradients(self):
+        errors = self.errors(self.cached_derivative)
+        self.accumulate_gradient(self.bias_gradients, self.mean_gradient("bias_gradients", errors))
+        self.accumulate_gradient(self.weight_gradients,
+                                 self.mean_weight_gradient("weight_gradients", errors))
+
+    def parameter_attributes(self) -> Sequence[Tuple[str, str, str, slice]]:
+        return [(self.fx_weights_name, "weights", "weight_gradients", self.fx_columns),
+                (self.fx_biases_name, "biases", "bias_gradients", self.fx_columns),
+                (self.gx_weights_name, "weights", "weight_gradients", self.gx_columns),
+                (self.gx_biases_name, "biases", "bias_gradients", self.gx_columns)]
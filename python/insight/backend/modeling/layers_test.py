@@ -3,6 +3,7 @@ import unittest
 import numpy as np
 
 from modeling.layers import QuadraticLayer
+from modeling.parameter_generators import SequenceParameterGenerator
 from modeling.parameter_updaters import ParameterUpdater
 
 
@@ -20,3 +21,33 @@ class QuadraticLayerTest(unittest.TestCase):
         np.testing.assert_array_equal(layer_2.inputs, [9, 9, 9])
         np.testing.assert_array_equal(layer_2.pre_activation, [784])
         np.testing.assert_array_equal(layer_2.outputs, [784])
+
+    def test_fused_parameters_are_views(self):
+        layer = QuadraticLayer(2, 3, level=1, parameter_updater=ParameterUpdater([]),
+                               parameter_generator=SequenceParameterGenerator())
+        self.assertEqual(layer.weights.shape, (2, 6))
+        self.assertTrue(np.shares_memory(layer.fx_weights, layer.weights))
+        self.assertTrue(np.shares_memory(layer.gx_bias_gradients, layer.bias_gradients))
+
+        parameters = layer.get_parameters()
+        np.testing.assert_array_equal(parameters["level_1_gx_weights"].values,
+                                      SequenceParameterGenerator()(2, 3))
+        parameters["level_1_gx_biases"].values[:] = [4, 5, 6]
+        layer.set_parameters(parameters)
+        np.testing.assert_array_equal(layer.biases[3:], [4, 5, 6])
+        np.testing.assert_array_equal(layer.fx_biases, SequenceParameterGenerator()(1, 3)[0])
+
+    def test_fused_pass_matches_separate_projections(self):
+        layer = QuadraticLayer(2, 3, level=1, parameter_updater=ParameterUpdater([]),
+                               parameter_generator=SequenceParameterGenerator())
+        inputs = np.array([[-3, 3], [.3, .7]])
+        upstream = np.array([[1, -2, .5], [0, 3, 1]])
+        fx = inputs @ layer.fx_weights + layer.fx_biases
+        gx = inputs @ layer.gx_weights + layer.gx_biases
+
+        np.testing.assert_allclose(layer.forward_pass(inputs), fx * gx)
+        downstream = layer.backward_pass(upstream)
+        np.testing.assert_allclose(
+            downstream, (gx * upstream) @ layer.fx_weights.T + (fx * upstream) @ layer.gx_weights.T)
+        np.testing.assert_allclose(layer.fx_weight_gradients, inputs.T @ (gx * upstream) / 2)
+        np.testing.assert_allclose(layer.gx_bias_gradients, np.mean(fx * upstream, axis=0))
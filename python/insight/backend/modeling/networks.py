@@ -7,6 +7,15 @@ from modeling.function.base import Func2
 from modeling.function.cost import QuadraticCost
 from modeling.domain_objects import ParameterSet
 from modeling.layers import Layer
+from modeling.precision import DTypePolicy
+from modeling.profiling import Profiler, NULL_PROFILER
+
+
+def sample_count(values: Sequence) -> int:
+    """
+    The number of samples in either a single vector or a (batch, count) matrix of vectors.
+    """
+    return len(values) if np.ndim(values) > 1 else 1
 
 
 class NeuralNetwork:
@@ -18,6 +27,7 @@ class NeuralNetwork:
         self.total_error = 0.0
         self.forward_pass_tally = 0
         self.backward_pass_tally = 0
+        self.profiler = NULL_PROFILER
 
     @property
     def input_count(self):
@@ -35,34 +45,67 @@ class NeuralNetwork:
     def outputs(self):
         return self.layers[-1].outputs
 
+    @property
+    def dtype(self) -> np.dtype:
+        return self.layers[-1].dtype
+
+    def set_profiler(self, profiler: Profiler):
+        """
+        Times the network's forward, backward and adjust phases, and those of each of its layers.
+        """
+        self.profiler = profiler
+        for layer in self.layers:
+            layer.set_profiler(profiler)
+
+    def set_dtype_policy(self, policy: DTypePolicy):
+        for layer in self.layers:
+            layer.set_dtype_policy(policy)
+
     def reset(self):
         self.total_error = 0.0
         self.forward_pass_tally = 0
         self.backward_pass_tally = 0
 
-    def adjust_parameters(self, parameter_batch: Sequence[Sequence[Mapping[str, ParameterSet]]]) -> \
+    def adjust_parameters(
+            self, parameter_batch: Sequence[Sequence[Mapping[str, ParameterSet]]] = None) -> \
             Sequence[Mapping[str, ParameterSet]]:
-        batch_count = len(parameter_batch)
-        if self.layer_count != batch_count:
-            raise ValueError(
-                "Number of delta sequences ({0}) must equal number of layers ({1})".format(
-                    batch_count, self.layer_count))
-        return [layer.adjust_parameters(param_set_maps) for layer, param_set_maps in
-                zip(self.layers, parameter_batch)]
+        """
+        Updates every layer from the gradients accumulated by the backward passes since the last
+        adjustment, or from per-layer sequences of parameter set snapshots.
+        """
+        with self.profiler.phase("network", "adjust"):
+            if parameter_batch is None:
+                return [layer.adjust_parameters() for layer in self.layers]
+            batch_count = len(parameter_batch)
+            if self.layer_count != batch_count:
+                raise ValueError(
+                    "Number of delta sequences ({0}) must equal number of layers ({1})".format(
+                        batch_count, self.layer_count))
+            return [layer.adjust_parameters(param_set_maps) for layer, param_set_maps in
+                    zip(self.layers, parameter_batch)]
 
     def get_parameters(self):
         return [layer.get_parameters() for layer in self.layers]
 
     def forward_pass(self, inputs: Sequence[float]) -> Sequence[float]:
-        self.forward_pass_tally += 1
-        return self.do_forward_pass(inputs)
+        self.forward_pass_tally += sample_count(inputs)
+        with self.profiler.phase("network", "forward"):
+            return self.do_forward_pass(inputs)
 
     def backward_pass(self, expected: Sequence[float]) -> float:
-        self.backward_pass_tally += 1
-        error = self.do_backward_pass(expected)
+        self.backward_pass_tally += sample_count(expected)
+        with self.profiler.phase("network", "backward"):
+            error = self.do_backward_pass(expected)
         self.total_error += error
         return error
 
+    @abstractmethod
+    def error(self, expected: Sequence[float]) -> float:
+        """
+        The cost of the outputs of the last forward pass, without a backward pass.
+        """
+        pass
+
     @abstractmethod
     def do_forward_pass(self, inputs: Sequence[float]) -> Sequence[float]:
         pass
@@ -73,18 +116,29 @@ class NeuralNetwork:
 
 
 class FeedForward(NeuralNetwork):
-    def __init__(self, layers: Sequence[Layer], cost: Func2 = QuadraticCost()):
+    def __init__(self, layers: Sequence[Layer], cost: Func2 = QuadraticCost(),
+                 dtype_policy: DTypePolicy = None):
+        """
+        :param dtype_policy: Converts the layers to this policy. None leaves each layer with the
+            policy it was created with.
+        """
         super().__init__(layers)
         self.cost = cost
+        if dtype_policy is not None:
+            self.set_dtype_policy(dtype_policy)
 
     def do_forward_pass(self, inputs: Sequence[float]) -> Sequence[float]:
         for layer in self.layers:
             inputs = layer.forward_pass(inputs)
         return inputs
 
+    def error(self, expected: Sequence[float]) -> float:
+        return float(np.sum(self.cost.apply(self.outputs, np.asarray(expected, dtype=self.dtype))))
+
     def do_backward_pass(self, expected: Sequence[float]) -> float:
-        error = sum(self.cost.apply(self.outputs, expected))
-        upstream_derivative = np.matrix(self.cost.apply_derivative(self.outputs, expected))
+        expected = np.asarray(expected, dtype=self.dtype)
+        error = self.error(expected)
+        upstream_derivative = np.atleast_2d(self.cost.apply_derivative(self.outputs, expected))
         for layer in reversed(self.layers):
             upstream_derivative = layer.backward_pass(upstream_derivative)
         return error
@@ -5,7 +5,9 @@ import numpy as np
 from modeling.layers import QuadraticLayer, LinearLayer
 from modeling.networks import FeedForward
 from modeling.parameter_generators import SequenceParameterGenerator
-from modeling.parameter_updaters import ParameterUpdater
+from modeling.parameter_updaters import ParameterUpdater, DeltaParameterUpdateStep, FlatGradient, \
+    FlatLearningRate
+from modeling.precision import FLOAT32, FLOAT64, MIXED
 
 
 class LinearFeedForwardTest(unittest.TestCase):
@@ -191,3 +193,138 @@ class QuadraticFeedForwardTest(unittest.TestCase):
         np.testing.assert_allclose(layers[2].gx_bias_gradients,
                                    [-2.15644806e+08, -1.40066062e+08, -8.44036196e+07,
                                     -4.60629426e+07, -2.15552538e+07])
+
+
+class BatchedFeedForwardTest(unittest.TestCase):
+    @staticmethod
+    def create_network(layer):
+        return FeedForward([
+            layer(2, 3, level=1, parameter_updater=ParameterUpdater([]),
+                  parameter_generator=SequenceParameterGenerator()),
+            layer(3, 2, level=2, parameter_updater=ParameterUpdater([]),
+                  parameter_generator=SequenceParameterGenerator())
+        ])
+
+    def assert_batch_matches_single_samples(self, layer):
+        inputs = [[-3, 3], [.3, .7], [1, -2]]
+        expected = [[18, -18], [1, 2], [0, .5]]
+
+        single = self.create_network(layer)
+        single_outputs = []
+        single_gradients = []
+        for sample_inputs, sample_expected in zip(inputs, expected):
+            reference = self.create_network(layer)
+            reference.forward_pass(sample_inputs)
+            reference.backward_pass(sample_expected)
+            single_gradients.append([{name: ps.gradients for name, ps in params.items()}
+                                     for params in reference.get_parameters()])
+
+            # Consecutive backward passes accumulate their mean gradient.
+            single_outputs.append(np.copy(single.forward_pass(sample_inputs)))
+            single.backward_pass(sample_expected)
+
+        batched = self.create_network(layer)
+        np.testing.assert_allclose(batched.forward_pass(inputs), single_outputs)
+        batched.backward_pass(expected)
+
+        self.assertAlmostEqual(batched.total_error, single.total_error)
+        self.assertEqual(batched.forward_pass_tally, len(inputs))
+        self.assertEqual(batched.backward_pass_tally, len(inputs))
+        for level, (params, single_params) in enumerate(
+                zip(batched.get_parameters(), single.get_parameters())):
+            for name, parameter_set in params.items():
+                mean_gradients = np.mean([gradients[level][name] for gradients in single_gradients],
+                                         axis=0)
+                np.testing.assert_allclose(parameter_set.gradients, mean_gradients)
+                np.testing.assert_allclose(single_params[name].gradients, mean_gradients)
+
+    def test_linear_batch(self):
+        self.assert_batch_matches_single_samples(LinearLayer)
+
+    def test_quadratic_batch(self):
+        self.assert_batch_matches_single_samples(QuadraticLayer)
+
+    def test_adjust_resets_accumulated_gradients(self):
+        network = self.create_network(LinearLayer)
+        network.forward_pass([[-3, 3], [1, 1]])
+        network.backward_pass([[18, -18], [1, 1]])
+        network.adjust_parameters()
+        self.assertEqual(network.layers[0].accumulated_sample_count, 0)
+
+        fresh = self.create_network(LinearLayer)
+        network.forward_pass([.3, .7])
+        network.backward_pass([1, 2])
+        fresh.forward_pass([.3, .7])
+        fresh.backward_pass([1, 2])
+        np.testing.assert_allclose(network.layers[1].fx_bias_gradients,
+                                   fresh.layers[1].fx_bias_gradients)
+
+
+class DTypePolicyTest(unittest.TestCase):
+    inputs = [[-3, 3], [.3, .7], [1, -2]]
+    expected = [[18, -18], [1, 2], [0, .5]]
+
+    @staticmethod
+    def create_network(layer, dtype_policy, learning_rate=0.):
+        def updater():
+            return ParameterUpdater(DeltaParameterUpdateStep.foreach(
+                FlatGradient(), FlatLearningRate(learning_rate)))
+
+        return FeedForward([
+            layer(2, 3, level=1, parameter_updater=updater(),
+                  parameter_generator=SequenceParameterGenerator()),
+            layer(3, 2, level=2, parameter_updater=updater(),
+                  parameter_generator=SequenceParameterGenerator())
+        ], dtype_policy=dtype_policy)
+
+    def assert_float32_matches_float64(self, layer):
+        reduced = self.create_network(layer, FLOAT32)
+        full = self.create_network(layer, FLOAT64)
+        self.assertEqual(reduced.forward_pass(self.inputs).dtype, np.float32)
+        np.testing.assert_allclose(reduced.outputs, full.forward_pass(self.inputs), rtol=1e-5)
+        reduced.backward_pass(self.expected)
+        full.backward_pass(self.expected)
+        np.testing.assert_allclose(reduced.total_error, full.total_error, rtol=1e-5)
+        for reduced_layer in reduced.layers:
+            self.assertEqual(reduced_layer.fx_weights.dtype, np.float32)
+            self.assertEqual(reduced_layer.fx_weight_gradients.dtype, np.float32)
+
+        for params, full_params in zip(reduced.get_parameters(), full.get_parameters()):
+            for name, parameter_set in params.items():
+                np.testing.assert_allclose(parameter_set.gradients, full_params[name].gradients,
+                                           rtol=1e-4, atol=1e-5)
+
+    def test_linear_float32(self):
+        self.assert_float32_matches_float64(LinearLayer)
+
+    def test_quadratic_float32(self):
+        self.assert_float32_matches_float64(QuadraticLayer)
+
+    def test_mixed_keeps_master_weights(self):
+        # Updates far below float32 resolution are lost without master weights.
+        reduced = self.create_network(LinearLayer, FLOAT32, learning_rate=1e-12)
+        mixed = self.create_network(LinearLayer, MIXED, learning_rate=1e-12)
+        initial = np.copy(mixed.layers[1].fx_biases)
+        for network in (reduced, mixed):
+            for _ in range(3):
+                network.forward_pass(self.inputs)
+                network.backward_pass(self.expected)
+                network.adjust_parameters()
+
+        np.testing.assert_array_equal(reduced.layers[1].fx_biases, initial)
+        masters = mixed.get_parameters()[1]["level_2_fx_biases"].values
+        self.assertTrue(np.all(masters != initial))
+        np.testing.assert_array_equal(mixed.layers[1].fx_biases, masters.astype(np.float32))
+        self.assertEqual(mixed.layers[1].fx_biases.dtype, np.float32)
+
+    def test_policy_change_keeps_parameters(self):
+        network = self.create_network(QuadraticLayer, MIXED)
+        network.set_dtype_policy(FLOAT64)
+        fresh = self.create_network(QuadraticLayer, FLOAT64)
+        np.testing.assert_allclose(network.forward_pass(self.inputs),
+                                   fresh.forward_pass(self.inputs))
+        self.assertEqual(network.outputs.dtype, np.float64)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,211 @@
+import multiprocessing
+from typing import Iterator, Tuple
+
+import numpy as np
+
+from modeling.common.shared_arrays import SharedArrays
+from modeling.networks import NeuralNetwork
+from modeling.trainers import Trainer, ClosedFormFunctionTrainer, BatchStepResult
+
+
+class ParameterLayout:
+    """
+    The position of every parameter array of a network in one flat vector, so parameter values or
+    gradients can be copied between replicas of the network through a single shared array.
+    """
+
+    def __init__(self, network: NeuralNetwork):
+        # (layer index, values attribute, gradients attribute, columns of the flat vector)
+        self.entries = []
+        self.size = 0
+        for index, layer in enumerate(network.layers):
+            for values_name, gradients_name in layer.storage_attributes():
+                size = getattr(layer, values_name).size
+                self.entries.append(
+                    (index, values_name, gradients_name, slice(self.size, self.size + size)))
+                self.size += size
+
+    def arrays(self, network: NeuralNetwork,
+               gradients: bool = False) -> Iterator[Tuple[np.ndarray, slice]]:
+        for index, values_name, gradients_name, columns in self.entries:
+            name = gradients_name if gradients else values_name
+            yield getattr(network.layers[index], name), columns
+
+    def store(self, network: NeuralNetwork, flat: np.ndarray, gradients: bool = False):
+        """
+        Copies the network's parameter values, or gradients, into flat.
+        """
+        for array, columns in self.arrays(network, gradients):
+            flat[columns] = np.ravel(array)
+
+    def load(self, network: NeuralNetwork, flat: np.ndarray, gradients: bool = False):
+        """
+        Copies flat into the network's parameter values, or gradients.
+        """
+        for array, columns in self.arrays(network, gradients):
+            np.copyto(array, np.reshape(flat[columns], array.shape), casting='same_kind')
+
+
+class DataParallelTrainer(Trainer):
+    """
+    Trains a network on batches that are split across worker processes. Each worker holds a replica
+    of the trainer, runs the forward and backward pass over its share of the batch, and writes its
+    mean gradients into shared memory. This process averages them weighted by share size, adjusts
+    its network once with its ParameterUpdater, and the workers load the updated parameters from
+    shared memory before their next pass, so every replica applies the same update.
+
+    Validation runs on this process's network. The workers are started by the first batch, or by
+    start(), and must be stopped with close().
+    """
+
+    def __init__(self, trainer: ClosedFormFunctionTrainer, worker_count: int,
+                 max_batch_size: int = None):
+        """
+        :param trainer: Samples inputs and computes expected outputs. Its network is the one
+            trained, and its function must be picklable if processes are not forked.
+        :param max_batch_size: The largest batch that will be trained. Defaults to the trainer's
+            batch size.
+        """
+        if worker_count < 1:
+            raise ValueError("worker_count must be at least 1")
+        super().__init__(trainer.network, trainer.batch_size)
+        self.trainer = trainer
+        self.worker_count = worker_count
+        self.max_batch_size = max(max_batch_size or trainer.batch_size, 1)
+        self.layout = ParameterLayout(self.network)
+        self.shared = None
+        self._workers = []
+        self._connections = []
+
+    @property
+    def started(self) -> bool:
+        return self.shared is not None
+
+    def start(self):
+        if self.started:
+            return
+        network = self.network
+        self.shared = SharedArrays({
+            "inputs": (self.max_batch_size, network.input_count),
+            "expected": (self.max_batch_size, network.output_count),
+            "outputs": (self.max_batch_size, network.output_count),
+            "values": (self.layout.size,),
+            "gradients": (self.worker_count, self.layout.size),
+            "errors": (self.worker_count,)
+        })
+        for index in range(self.worker_count):
+            connection, worker_connection = multiprocessing.Pipe()
+            worker = multiprocessing.Process(
+                target=run_worker,
+                args=(self.trainer, index, self.shared.shapes, self.shared.name, worker_connection),
+                name="insight-trainer-%d" % index, daemon=True)
+            worker.start()
+            worker_connection.close()
+            self._workers.append(worker)
+            self._connections.append(connection)
+
+    def close(self):
+        for connection in self._connections:
+            try:
+                connection.send(None)
+            except OSError:
+                pass
+        for worker in self._workers:
+            worker.join(5)
+            if worker.is_alive():
+                worker.terminate()
+        for connection in self._connections:
+            connection.close()
+        self._workers = []
+        self._connections = []
+        if self.shared is not None:
+            self.shared.close()
+            self.shared = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def expected_outputs(self, inputs: np.ndarray) -> np.ndarray:
+        return self.trainer.expected_outputs(inputs)
+
+    def _batch_step(self, inputs: np.ndarray = None, batch_size: int = 1) -> BatchStepResult:
+        if inputs is None:
+            inputs = self.trainer.sample_inputs(batch_size)
+        batch_size = len(inputs)
+        if batch_size > self.max_batch_size:
+            raise ValueError("Batch of {0} is larger than max_batch_size {1}".format(
+                batch_size, self.max_batch_size))
+        self.start()
+        shared = self.shared
+
+        shared["inputs"][:batch_size] = inputs
+        self.layout.store(self.network, shared["values"])
+        bounds = np.linspace(0, batch_size, self.worker_count + 1).astype(int)
+        workers = [index for index in range(self.worker_count) if bounds[index + 1] > bounds[index]]
+        for index in workers:
+            self._connections[index].send((bounds[index], bounds[index + 1]))
+        failures = [failure for failure in (self._connections[index].recv() for index in workers)
+                    if failure is not None]
+        if len(failures) > 0:
+            raise RuntimeError("Training worker failed: " + failures[0])
+
+        shares = np.diff(bounds)[workers] / batch_size
+        gradients = np.tensordot(shares, shared["gradients"][workers], axes=1)
+        self.layout.load(self.network, gradients, gradients=True)
+        for layer in self.network.layers:
+            layer.accumulated_sample_count = batch_size
+
+        # Keep the tallies that updaters read, eg. the average error, as if the pass ran here.
+        error = float(np.sum(shared["errors"][workers]))
+        self.network.forward_pass_tally += batch_size
+        self.network.backward_pass_tally += batch_size
+        self.network.total_error += error
+        return BatchStepResult(np.array(inputs), np.array(shared["expected"][:batch_size]),
+                               self.network, error, outputs=shared["outputs"][:batch_size])
+
+    def _validation_size(self, resolution: float, sample_count: int = None) -> int:
+        return self.trainer._validation_size(resolution, sample_count)
+
+    def _validation_batches(self, chunk_size: int, resolution: float,
+                            sample_count: int = None) -> Iterator[np.ndarray]:
+        return self.trainer._validation_batches(chunk_size, resolution, sample_count)
+
+
+def run_worker(trainer: ClosedFormFunctionTrainer, index: int, shapes, name: str, connection):
+    """
+    Runs the passes a DataParallelTrainer sends over connection on a replica of its trainer, until
+    it sends None.
+    """
+    shared = SharedArrays(shapes, name=name)
+    network = trainer.network
+    layout = ParameterLayout(network)
+    try:
+        while True:
+            command = connection.recv()
+            if command is None:
+                return
+            start, stop = command
+            try:
+                layout.load(network, shared["values"])
+                # A copy, so the replica's layers don't keep views of the shared memory.
+                inputs = np.array(shared["inputs"][start:stop])
+                network.forward_pass(inputs)
+                expected = trainer.expected_outputs(inputs)
+                # Each pass's gradients are averaged by the coordinator, not accumulated here.
+                for layer in network.layers:
+                    layer.accumulated_sample_count = 0
+                shared["errors"][index] = network.backward_pass(expected)
+                layout.store(network, shared["gradients"][index], gradients=True)
+                shared["expected"][start:stop] = expected
+                shared["outputs"][start:stop] = network.outputs
+                connection.send(None)
+            except Exception as e:
+                connection.send(repr(e))
+    except EOFError:
+        pass
+    finally:
+        shared.close()
@@ -0,0 +1,88 @@
+import copy
+import unittest
+
+import numpy as np
+
+from modeling.layers import LinearLayer, QuadraticLayer
+from modeling.networks import FeedForward
+from modeling.parallel import ParameterLayout, DataParallelTrainer
+from modeling.parameter_generators import SequenceParameterGenerator
+from modeling.parameter_updaters import ParameterUpdater, DeltaParameterUpdateStep, FlatGradient, \
+    FlatLearningRate
+from modeling.trainers import ClosedFormFunctionTrainer
+
+
+def create_trainer(layer=QuadraticLayer) -> ClosedFormFunctionTrainer:
+    def updater():
+        return ParameterUpdater(DeltaParameterUpdateStep.foreach(
+            FlatGradient(), FlatLearningRate(.01)))
+
+    network = FeedForward([
+        layer(2, 3, level=0, parameter_updater=updater(),
+              parameter_generator=SequenceParameterGenerator()),
+        layer(3, 1, level=1, parameter_updater=updater(),
+              parameter_generator=SequenceParameterGenerator())
+    ])
+    return ClosedFormFunctionTrainer(network, "lambda x: x[0] * x[1]", (-1, 1), 8)
+
+
+class ParameterLayoutTest(unittest.TestCase):
+    def test_round_trip(self):
+        trainer = create_trainer()
+        layout = ParameterLayout(trainer.network)
+        self.assertEqual(layout.size, 2 * (2 * 3 + 3) + 2 * (3 + 1))
+
+        flat = np.empty(layout.size)
+        layout.store(trainer.network, flat)
+        replica = create_trainer(QuadraticLayer).network
+        replica.layers[1].weights[:] = 0
+        layout.load(replica, flat)
+        np.testing.assert_array_equal(replica.layers[1].gx_weights,
+                                      trainer.network.layers[1].gx_weights)
+
+
+class DataParallelTrainerTest(unittest.TestCase):
+    def assert_matches_serial(self, layer, worker_count: int, batch_size: int):
+        serial = create_trainer(layer)
+        parallel_trainer = copy.deepcopy(serial)
+        np.random.seed(3)
+        batches = [serial.sample_inputs(batch_size) for _ in range(3)]
+
+        with DataParallelTrainer(parallel_trainer, worker_count, batch_size) as parallel:
+            for inputs in batches:
+                for trainer in (serial, parallel):
+                    trainer.network.reset()
+                    step = trainer._batch_step(inputs)
+                    trainer.network.adjust_parameters()
+                    if trainer is serial:
+                        serial_step = step
+                np.testing.assert_allclose(step.outputs, serial_step.outputs)
+                np.testing.assert_allclose(step.expected, serial_step.expected)
+                self.assertAlmostEqual(step.error, serial_step.error)
+                self.assertAlmostEqual(parallel.network.total_error, serial.network.total_error)
+
+        for params, serial_params in zip(parallel.network.get_parameters(),
+                                         serial.network.get_parameters()):
+            for name, parameter_set in params.items():
+                np.testing.assert_allclose(parameter_set.values, serial_params[name].values)
+                np.testing.assert_allclose(parameter_set.gradients, serial_params[name].gradients)
+
+    def test_linear(self):
+        self.assert_matches_serial(LinearLayer, 2, 9)
+
+    def test_quadratic_more_workers_than_samples(self):
+        self.assert_matches_serial(QuadraticLayer, 3, 2)
+
+    def test_batch_train(self):
+        with DataParallelTrainer(create_trainer(), 2, 16) as parallel:
+            result = parallel.batch_train(16, 2)
+            self.assertEqual(result.batch_size, 16)
+            self.assertEqual(np.shape(result.actual), (16, 1))
+            self.assertEqual(parallel.validate(chunk_size=64).sample_count, 400)
+            with self.assertRaises(ValueError):
+                parallel.batch_train(17, 1)
+        self.assertFalse(parallel.started)
+
+
+if __name__ == '__main__':
+    unittest.main()
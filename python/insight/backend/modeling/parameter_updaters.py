@@ -1,8 +1,9 @@
 from abc import ABCMeta, abstractmethod
 from collections import deque
-from typing import Sequence, Callable, Mapping, List
+from typing import Sequence, Callable, Mapping, List, Tuple, Optional
 
-from modeling.domain_objects import ParameterSet, Parameter, DeltaStep
+from modeling.domain_objects import ParameterSet, Parameter, DeltaTrace
+from modeling.profiling import Profiler, NULL_PROFILER
 import numpy as np
 import re
 
@@ -24,14 +25,72 @@ class ParameterUpdateStep:
         return to_sentence(self.__class__.__name__)
 
     @abstractmethod
-    def __call__(self, parameters: Sequence[Parameter]) -> Sequence[Parameter]:
+    def __call__(self, parameter_sets: Sequence[ParameterSet]) -> Sequence[ParameterSet]:
+        """
+        Updates the delta values of every parameter set of a layer in place.
+        """
         pass
 
 
+class DeltaTracer:
+    """
+    Decides which updates and which parameters record the DeltaSteps that produced their deltas.
+    """
+
+    @staticmethod
+    def off():
+        return DeltaTracer(enabled=False)
+
+    @staticmethod
+    def full():
+        return DeltaTracer()
+
+    @staticmethod
+    def sampled(batch_stride: int = 1, parameter_indices: Mapping[str, Sequence[int]] = None):
+        return DeltaTracer(batch_stride=batch_stride, parameter_indices=parameter_indices)
+
+    def __init__(self,
+                 enabled: bool = True,
+                 batch_stride: int = 1,
+                 parameter_indices: Mapping[str, Sequence[int]] = None):
+        """
+        :param batch_stride: Only every batch_stride-th update is traced.
+        :param parameter_indices: Flat indices of the elements to trace, keyed by parameter set
+            name. Sets that are not in the mapping are not traced. None traces every element.
+        """
+        if batch_stride < 1:
+            raise ValueError("batch_stride must be at least 1")
+        self.enabled = enabled
+        self.batch_stride = batch_stride
+        self.parameter_indices = parameter_indices
+
+    def create_trace(self, parameter_set: ParameterSet, step_count: int,
+                     update_number: int) -> Optional[DeltaTrace]:
+        if not self.enabled or update_number % self.batch_stride != 0:
+            return None
+        if self.parameter_indices is None:
+            return DeltaTrace(parameter_set.size, step_count)
+        if parameter_set.name not in self.parameter_indices:
+            return None
+        return DeltaTrace(parameter_set.size, step_count,
+                          self.parameter_indices[parameter_set.name])
+
+
 class ParameterUpdater:
-    def __init__(self, steps: List[ParameterUpdateStep]):
+    def __init__(self, steps: List[ParameterUpdateStep], tracer: DeltaTracer = None):
         self.steps = steps.copy()
         self.steps.append(DeltaParameterUpdateStep(ToNegative()))
+        self.tracer = DeltaTracer.full() if tracer is None else tracer
+        self.update_tally = 0
+        self.profiler = NULL_PROFILER
+        self.phase_name = "update"
+
+    def set_profiler(self, profiler: Profiler, phase_name: str = "update"):
+        """
+        Times each step as <phase_name>/<step name>.
+        """
+        self.profiler = profiler
+        self.phase_name = phase_name
 
     def adjust(self,
                param_set_maps: Sequence[Mapping[str, ParameterSet]]) -> Mapping[str, ParameterSet]:
@@ -41,27 +100,26 @@ class ParameterUpdater:
 
         result = param_set_maps[0]
 
-        # Scale gradients in batch.
-        for param_set_map in param_set_maps:
-            for param_set in param_set_map.values():
-                for key in param_set.parameter_map.keys():
-                    gradient = param_set.parameter_map[key].gradient
-                    scaled_gradient = gradient / count
-                    if param_set_map is result:
-                        param_set.parameter_map[key].gradient = scaled_gradient
-                    else:
-                        param_set.parameter_map[key].gradient += scaled_gradient
+        # Average gradients in batch.
+        for name, param_set in result.items():
+            gradients = param_set.gradients / count
+            for param_set_map in param_set_maps[1:]:
+                gradients += param_set_map[name].gradients / count
+            param_set.gradients = gradients
+            param_set.trace = self.tracer.create_trace(param_set, len(self.steps),
+                                                       self.update_tally)
+        self.update_tally += 1
 
         # Compute delta update.
-        parameters = [p for ps in result.values() for p in ps.parameters]
+        parameter_sets = list(result.values())
 
         for step in self.steps:
-            parameters = step(parameters)
+            with self.profiler.phase(self.phase_name, step.name):
+                parameter_sets = step(parameter_sets)
 
         # Update the weights.
         for param_set in result.values():
-            for p in param_set.parameters:
-                p.value += p.delta.value
+            param_set.values += param_set.delta_values
 
         return result
 
@@ -77,6 +135,17 @@ class ParameterDeltaTransform:
     def __call__(self, parameter: Parameter) -> float:
         pass
 
+    def apply(self, parameter_set: ParameterSet) -> np.ndarray:
+        """
+        Computes the new delta values for a whole parameter set at once. Subclasses should
+        override this with array operations; the default calls the transform once per active
+        parameter.
+        """
+        updated_values = parameter_set.delta_values.copy()
+        for p in parameter_set.active_parameters:
+            updated_values.flat[p.index] = self(p)
+        return updated_values
+
 
 class DeltaParameterUpdateStep(ParameterUpdateStep):
     @staticmethod
@@ -90,18 +159,23 @@ class DeltaParameterUpdateStep(ParameterUpdateStep):
     def __init__(self, transform: ParameterDeltaTransform):
         self.transform = transform
 
-    def __call__(self, parameters: Sequence[Parameter]) -> Sequence[Parameter]:
-        for p in parameters:
-            updated_value = self.transform(p)
-            p.delta.add_step(DeltaStep(self.transform.name, p.delta.value, updated_value))
-            p.delta.value = updated_value
-        return parameters
+    @property
+    def name(self) -> str:
+        return self.transform.name
+
+    def __call__(self, parameter_sets: Sequence[ParameterSet]) -> Sequence[ParameterSet]:
+        for param_set in parameter_sets:
+            param_set.update_delta_values(self.transform.name, self.transform.apply(param_set))
+        return parameter_sets
 
 
 class ToNegative(ParameterDeltaTransform):
     def __call__(self, parameter: Parameter) -> float:
         return -parameter.delta.value
 
+    def apply(self, parameter_set: ParameterSet) -> np.ndarray:
+        return np.negative(parameter_set.delta_values)
+
 
 class FlatLearningRate(ParameterDeltaTransform):
     def __init__(self, learning_rate: float):
@@ -110,6 +184,9 @@ class FlatLearningRate(ParameterDeltaTransform):
     def __call__(self, parameter: Parameter) -> float:
         return self.learning_rate * parameter.delta.value
 
+    def apply(self, parameter_set: ParameterSet) -> np.ndarray:
+        return self.learning_rate * parameter_set.delta_values
+
 
 class DecreasingLearningRate(ParameterDeltaTransform):
     def __init__(self,
@@ -122,11 +199,17 @@ class DecreasingLearningRate(ParameterDeltaTransform):
         self.epoch_getter = epoch_getter
         self.degree = degree
 
-    def __call__(self, parameter: Parameter) -> float:
-        rate = self.learning_rate * (
+    @property
+    def rate(self) -> float:
+        return self.learning_rate * (
             (self.epochs ** self.degree - self.epoch_getter() ** self.degree) /
             self.epochs ** self.degree)
-        return rate * parameter.delta.value
+
+    def __call__(self, parameter: Parameter) -> float:
+        return self.rate * parameter.delta.value
+
+    def apply(self, parameter_set: ParameterSet) -> np.ndarray:
+        return self.rate * parameter_set.delta_values
 
 
 class ErrorRegularizedGradient(ParameterDeltaTransform):
@@ -137,6 +220,9 @@ class ErrorRegularizedGradient(ParameterDeltaTransform):
         total_error = self.total_error_getter_function()
         return parameter.gradient / total_error
 
+    def apply(self, parameter_set: ParameterSet) -> np.ndarray:
+        return parameter_set.gradients / self.total_error_getter_function()
+
 
 class Momentum(ParameterDeltaTransform):
     def __init__(self, history_weights: Sequence[float]):
@@ -145,11 +231,32 @@ class Momentum(ParameterDeltaTransform):
         self.history_weights = history_weights
         self.history_count = len(history_weights)
         self.history = {}
+        self.array_history = {}
 
     def __call__(self, parameter: Parameter):
         values = self._update_history(parameter)
         return sum(w * d for w, d in zip(self.history_weights, values))
 
+    def apply(self, parameter_set: ParameterSet) -> np.ndarray:
+        history = self.array_history.get(parameter_set.name)
+        if history is None or history.shape != parameter_set.shape:
+            history = _RingBuffer(self.history_count, parameter_set.shape)
+            self.array_history[parameter_set.name] = history
+
+        delta_values = parameter_set.delta_values
+        # A sign change clears the history of that parameter.
+        reset = history.newest * delta_values < 0
+        if parameter_set.mask is not None:
+            reset &= parameter_set.mask
+        history.values[:, reset] = 0
+        history.push(delta_values, parameter_set.mask)
+
+        # Accumulate newest first so the result matches the per-parameter sum exactly.
+        result = self.history_weights[0] * history.newest
+        for age in range(1, self.history_count):
+            result += self.history_weights[age] * history.get(age)
+        return result
+
     def _update_history(self, parameter: Parameter) -> deque:
         if self.history.get(parameter.name) is None:
             self.history[parameter.name] = deque(maxlen=self.history_count)
@@ -160,62 +267,57 @@ class Momentum(ParameterDeltaTransform):
         return history
 
 
-class Derivative:
-    def __init__(self):
-        self._observations = deque(maxlen=2)
-        self._first_derivatives = deque(maxlen=2)
-        self._second_derivatives = deque(maxlen=2)
-
-    @property
-    def observation_sign_change(self) -> bool:
-        if len(self._observations) < 2:
-            return False
-        return np.sign(self._observations[0]) != np.sign(self._observations[1])
-
-    @property
-    def first_positive(self) -> bool:
-        return np.sign(self.first) >= 0
-
-    @property
-    def second_positive(self) -> bool:
-        return np.sign(self.second) >= 0
+class _RingBuffer:
+    """
+    A fixed-size (count, *shape) history of arrays. Entries that were never written are zero.
+    """
 
-    @property
-    def first_negative(self) -> bool:
-        return not self.first_positive
+    def __init__(self, count: int, shape: Tuple[int, ...]):
+        self.values = np.zeros((count,) + tuple(shape))
+        self.shape = tuple(shape)
+        self._newest = 0
 
     @property
-    def second_negative(self) -> bool:
-        return not self.second_positive
+    def newest(self) -> np.ndarray:
+        return self.values[self._newest]
+
+    def get(self, age: int) -> np.ndarray:
+        return self.values[(self._newest - age) % len(self.values)]
+
+    def push(self, values: np.ndarray, mask: np.ndarray = None):
+        """
+        Adds values as the newest entry. When a mask is given, only the masked elements are
+        pushed and the history of the others is left as it was.
+        """
+        if mask is None:
+            self._newest = (self._newest + 1) % len(self.values)
+            self.values[self._newest] = values
+            return
 
-    @property
-    def observation(self) -> float:
-        if len(self._observations) > 0:
-            return self._observations[0]
-        else:
-            return 0
+        ages = np.arange(len(self.values))
+        ordered = np.stack([self.get(age) for age in ages])
+        pushed = np.concatenate([[values], ordered[:-1]])
+        # With the newest entry in slot 0, the entry of a given age is in slot -age.
+        self.values = np.where(mask, pushed, ordered)[-ages % len(ages)]
+        self._newest = 0
 
-    @property
-    def first(self) -> float:
-        if len(self._first_derivatives) > 0:
-            return self._first_derivatives[0]
-        else:
-            return 0
 
-    @property
-    def second(self) -> float:
-        if len(self._second_derivatives) > 0:
-            return self._second_derivatives[0]
-        else:
-            return 0
+class _AdaptiveState:
+    """
+    The per-element state of AdaptiveGradientDerivative for one parameter set. Histories are
+    stored newest first.
+    """
 
-    def add_observation(self, value: float):
-        self._observations.appendleft(value)
-        if len(self._observations) > 1:
-            self._first_derivatives.appendleft(self._observations[1] - self._observations[0])
-        if len(self._first_derivatives) > 1:
-            self._second_derivatives.appendleft(
-                self._first_derivatives[1] - self._first_derivatives[0])
+    def __init__(self, shape: Tuple[int, ...], start_step: float, grow_rate: float):
+        self.shape = shape
+        # Number of gradients observed, capped at the 3 needed for a second derivative.
+        self.observation_count = np.zeros(shape, int)
+        self.observations = np.zeros((2,) + shape)
+        self.first_derivatives = np.zeros((2,) + shape)
+        self.second_derivative = np.zeros(shape)
+        self.start_steps = np.full(shape, start_step)
+        self.grow_rates = np.full(shape, grow_rate)
+        self.steps = self.start_steps.copy()
 
 
 class AdaptiveGradientDerivative(ParameterUpdateStep):
@@ -229,21 +331,18 @@ class AdaptiveGradientDerivative(ParameterUpdateStep):
         self.total_error_getter = total_error_getter
         self.initial_start_step = initial_start_step
         self.initial_grow_rate = initial_grow_rate
-        self._derivatives = {}
-        self._steps = {}
-        self._start_steps = {}
-        self._grow_rates = {}
+        self._states = {}
 
-    def __call__(self, parameters: Sequence[Parameter]) -> Sequence[Parameter]:
-        self._account_for_error(parameters)
+    def __call__(self, parameter_sets: Sequence[ParameterSet]) -> Sequence[ParameterSet]:
+        states = [self._get_state(param_set) for param_set in parameter_sets]
+        self._account_for_error(parameter_sets, states)
 
-        for p in parameters:
-            updated_value = self.get_delta(p)
-            p.delta.add_step(DeltaStep(self.name, p.delta.value, updated_value))
-            p.delta.value = updated_value
-        return parameters
+        for param_set, state in zip(parameter_sets, states):
+            param_set.update_delta_values(self.name, self.get_deltas(param_set, state))
+        return parameter_sets
 
-    def _account_for_error(self, parameters: Sequence[Parameter]):
+    def _account_for_error(self, parameter_sets: Sequence[ParameterSet],
+                           states: Sequence[_AdaptiveState]):
         self.error_history.appendleft(self.total_error_getter())
 
         history_length = len(self.error_history)
@@ -257,58 +356,84 @@ class AdaptiveGradientDerivative(ParameterUpdateStep):
         over_error_threshold = error_delta > 1
 
         if all_bad or over_error_threshold:
-            self._reset(parameters)
-
-    def get_delta(self, parameter: Parameter) -> float:
-        derivative = self._get_derivative(parameter)
-        derivative.add_observation(parameter.gradient)
-        if derivative.observation_sign_change:
-            self._decrease_rate(parameter)
-            self._initialize_step(parameter)
-            return 0
-        elif derivative.first_negative:
-            self._steps[parameter.name] *= (1 + self.initial_grow_rate)
-            if derivative.second_positive:
-                self._increase_rate(parameter)
-
-        sign = -1 if np.sign(parameter.gradient) < 0 else 1
-        return sign * self._steps[parameter.name]
-
-    def _get_derivative(self, parameter: Parameter) -> Derivative:
-        if self._derivatives.get(parameter.name) is None:
-            self._derivatives[parameter.name] = Derivative()
-            self._initialize_step(parameter)
+            for param_set, state in zip(parameter_sets, states):
+                state.steps = np.where(self._active(param_set), state.start_steps, state.steps)
+
+    def get_deltas(self, parameter_set: ParameterSet, state: _AdaptiveState) -> np.ndarray:
+        active = self._active(parameter_set)
+        gradients = parameter_set.gradients
+
+        # Record the gradient as the newest observation and update the derivatives of the
+        # observation history.
+        count = np.where(active, np.minimum(state.observation_count + 1, 3),
+                         state.observation_count)
+        observations = np.where(active, [gradients, state.observations[0]], state.observations)
+        has_first = count > 1
+        first_derivatives = np.where(
+            active & has_first,
+            [observations[1] - observations[0], state.first_derivatives[0]],
+            state.first_derivatives)
+        has_second = count > 2
+        second_derivative = np.where(active & has_second,
+                                     first_derivatives[1] - first_derivatives[0],
+                                     state.second_derivative)
+
+        first = np.where(has_first, first_derivatives[0], 0)
+        second = np.where(has_second, second_derivative, 0)
+        sign_change = has_first & (np.sign(observations[0]) != np.sign(observations[1]))
+
+        # On a sign change the rates decrease and the step starts over. Otherwise, while the
+        # observations are shrinking the step grows, and the rates increase while they shrink
+        # more slowly.
+        decrease = active & sign_change
+        grow = active & np.logical_not(sign_change) & (first < 0)
+        increase = grow & (second >= 0)
+        for rates in ('start_steps', 'grow_rates'):
+            values = getattr(state, rates)
+            values = np.where(decrease, values * .9, values)
+            setattr(state, rates, np.where(increase, values * 1.01, values))
+        state.steps = np.where(decrease, state.start_steps,
+                               np.where(grow, state.steps * (1 + self.initial_grow_rate),
+                                        state.steps))
+
+        state.observation_count = count
+        state.observations = observations
+        state.first_derivatives = first_derivatives
+        state.second_derivative = second_derivative
+
+        return np.where(sign_change, 0, np.where(gradients < 0, -1, 1) * state.steps)
+
+    def _get_state(self, parameter_set: ParameterSet) -> _AdaptiveState:
+        state = self._states.get(parameter_set.name)
+        if state is None or state.shape != parameter_set.shape:
+            state = _AdaptiveState(parameter_set.shape, self.initial_start_step,
+                                   self.initial_grow_rate)
+            self._states[parameter_set.name] = state
+        return state
 
-        return self._derivatives[parameter.name]
-
-    def _initialize_step(self, parameter: Parameter):
-        if self._start_steps.get(parameter.name) is None:
-            self._start_steps[parameter.name] = self.initial_start_step
-            self._grow_rates[parameter.name] = self.initial_grow_rate
-        self._steps[parameter.name] = self._start_steps[parameter.name]
-
-    def _decrease_rate(self, parameter: Parameter):
-        self._start_steps[parameter.name] *= .9
-        self._grow_rates[parameter.name] *= .9
-
-    def _increase_rate(self, parameter: Parameter):
-        self._start_steps[parameter.name] *= 1.01
-        self._grow_rates[parameter.name] *= 1.01
-
-    def _reset(self, parameters: Sequence[Parameter]):
-        for p in parameters:
-            self._initialize_step(p)
+    @staticmethod
+    def _active(parameter_set: ParameterSet) -> np.ndarray:
+        if parameter_set.mask is None:
+            return np.ones(parameter_set.shape, bool)
+        return parameter_set.mask
 
 
 class FlatGradient(ParameterDeltaTransform):
     def __call__(self, parameter: Parameter) -> float:
         return parameter.gradient
 
+    def apply(self, parameter_set: ParameterSet) -> np.ndarray:
+        return parameter_set.gradients
+
 
 class LogScaledDelta(ParameterDeltaTransform):
     def __call__(self, parameter: Parameter) -> float:
         return np.sign(parameter.delta.value) * np.log(1 + abs(parameter.delta.value))
 
+    def apply(self, parameter_set: ParameterSet) -> np.ndarray:
+        delta_values = parameter_set.delta_values
+        return np.sign(delta_values) * np.log(1 + np.abs(delta_values))
+
 
 class ClampedDelta(ParameterDeltaTransform):
     def __init__(self, min: float = -1e6, max: float = 1e6):
@@ -318,46 +443,124 @@ class ClampedDelta(ParameterDeltaTransform):
     def __call__(self, parameter: Parameter) -> float:
         return np.clip(parameter.delta.value, self.min, self.max)
 
+    def apply(self, parameter_set: ParameterSet) -> np.ndarray:
+        return np.clip(parameter_set.delta_values, self.min, self.max)
 
-class LargestDeltasFilter(ParameterUpdateStep):
-    def __init__(self, keep_rate: float = 0.5):
-        self.keep_rate = keep_rate
 
-    def __call__(self, parameters: Sequence[Parameter]) -> Sequence[Parameter]:
-        sorted_parameters = sorted(parameters, key=lambda p: -abs(p.delta.value))
-        return sorted_parameters[:int(np.ceil(len(sorted_parameters) * self.keep_rate))]
+def _active_magnitudes(parameter_sets: Sequence[ParameterSet],
+                       select: Callable[[ParameterSet], np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Concatenates |select(parameter_set)| of the active elements of every set, along with the flat
+    indices of those elements into the concatenation of all elements.
+    """
+    magnitudes = np.concatenate([np.abs(select(ps)).ravel() for ps in parameter_sets])
+    if all(ps.mask is None for ps in parameter_sets):
+        return magnitudes, np.arange(len(magnitudes))
+    masks = [np.ones(ps.size, bool) if ps.mask is None else ps.mask.ravel()
+             for ps in parameter_sets]
+    indices = np.flatnonzero(np.concatenate(masks))
+    return magnitudes[indices], indices
+
 
+class LargestEffectStep(ParameterUpdateStep):
+    """
+    Base class of the steps that single out the parameters with the largest gradients or deltas.
+    """
 
-class LargestGradientsFilter(ParameterUpdateStep):
-    def __init__(self, keep_rate: float = 0.5):
+    def __init__(self, keep_rate: float = 0.5, sample_size: int = None,
+                 random: np.random.Generator = None):
+        """
+        :param keep_rate: Fraction of the active parameters to single out.
+        :param sample_size: When set, and there are more active parameters than this, the cutoff
+            magnitude is estimated from a random sample of this many parameters instead of being
+            computed exactly, so about keep_rate of the parameters are singled out.
+        :param random: Draws the sample. Defaults to numpy's global random state.
+        """
         self.keep_rate = keep_rate
+        self.sample_size = sample_size
+        self.random = random
+
+    def _largest(self, parameter_sets: Sequence[ParameterSet],
+                 select: Callable[[ParameterSet], np.ndarray]) -> List[np.ndarray]:
+        """
+        Returns a boolean mask per parameter set that is True for the active elements with the
+        largest |select(parameter_set)| values, across all of the sets.
+        """
+        magnitudes, indices = _active_magnitudes(parameter_sets, select)
+        count = len(indices)
+        cutoff = int(np.ceil(count * self.keep_rate))
+
+        if cutoff >= count:
+            kept_indices = indices
+        elif cutoff <= 0:
+            kept_indices = indices[:0]
+        elif self.sample_size is not None and count > self.sample_size:
+            sample = magnitudes[self._sample_indices(count)]
+            position = self.sample_size - int(np.ceil(self.sample_size * self.keep_rate))
+            threshold = np.partition(sample, position)[position]
+            kept_indices = indices[magnitudes >= threshold]
+        else:
+            kept_indices = indices[np.argpartition(magnitudes, count - cutoff)[count - cutoff:]]
 
-    def __call__(self, parameters: Sequence[Parameter]) -> Sequence[Parameter]:
-        sorted_parameters = sorted(parameters, key=lambda p: -abs(p.gradient))
-        return sorted_parameters[:int(np.ceil(len(sorted_parameters) * self.keep_rate))]
+        kept = np.zeros(sum(ps.size for ps in parameter_sets), bool)
+        kept[kept_indices] = True
+        offsets = np.cumsum([0] + [ps.size for ps in parameter_sets])
+        return [np.reshape(kept[offsets[i]:offsets[i + 1]], ps.shape)
+                for i, ps in enumerate(parameter_sets)]
 
+    def _sample_indices(self, count: int) -> np.ndarray:
+        if self.random is None:
+            return np.random.randint(0, count, self.sample_size)
+        return self.random.integers(0, count, self.sample_size)
 
-class LargestGradientsOnly(ParameterUpdateStep):
-    def __init__(self, keep_rate: float = 0.5):
-        self.keep_rate = keep_rate
 
-    def __call__(self, parameters: Sequence[Parameter]) -> Sequence[Parameter]:
-        sorted_parameters = sorted(parameters, key=lambda p: -abs(p.gradient))
-        cutoff = int(np.ceil(len(sorted_parameters) * self.keep_rate))
-        for parameter in sorted_parameters[cutoff:]:
-            parameter.delta.value = 0
-            parameter.delta.add_step(DeltaStep(self.name, parameter.delta.value, 0))
-        return sorted_parameters
+def _filter(parameter_sets: Sequence[ParameterSet], masks: Sequence[np.ndarray]):
+    for param_set, mask in zip(parameter_sets, masks):
+        param_set.mask = mask
 
 
-class LargestDeltasOnly(ParameterUpdateStep):
-    def __init__(self, keep_rate: float = 0.5):
-        self.keep_rate = keep_rate
+def _zero_others(name: str, parameter_sets: Sequence[ParameterSet], masks: Sequence[np.ndarray]):
+    for param_set, mask in zip(parameter_sets, masks):
+        param_set.update_delta_values(name, np.where(mask, param_set.delta_values, 0))
+
+
+class LargestDeltasFilter(LargestEffectStep):
+    """
+    Restricts the remaining update steps to the parameters with the largest deltas.
+    """
+
+    def __call__(self, parameter_sets: Sequence[ParameterSet]) -> Sequence[ParameterSet]:
+        _filter(parameter_sets, self._largest(parameter_sets, lambda ps: ps.delta_values))
+        return parameter_sets
+
+
+class LargestGradientsFilter(LargestEffectStep):
+    """
+    Restricts the remaining update steps to the parameters with the largest gradients.
+    """
+
+    def __call__(self, parameter_sets: Sequence[ParameterSet]) -> Sequence[ParameterSet]:
+        _filter(parameter_sets, self._largest(parameter_sets, lambda ps: ps.gradients))
+        return parameter_sets
+
+
+class LargestGradientsOnly(LargestEffectStep):
+    """
+    Zeroes the deltas of all but the parameters with the largest gradients.
+    """
+
+    def __call__(self, parameter_sets: Sequence[ParameterSet]) -> Sequence[ParameterSet]:
+        _zero_others(self.name, parameter_sets,
+                     self._largest(parameter_sets, lambda ps: ps.gradients))
+        return parameter_sets
+
+
+class LargestDeltasOnly(LargestEffectStep):
+    """
+    Zeroes the deltas of all but the parameters with the largest deltas.
+    """
 
-    def __call__(self, parameters: Sequence[Parameter]) -> Sequence[Parameter]:
-        sorted_parameters = sorted(parameters, key=lambda p: -abs(p.delta.value))
-        cutoff = int(np.ceil(len(sorted_parameters) * self.keep_rate))
-        for parameter in sorted_parameters[cutoff:]:
-            parameter.delta.value = 0
-            parameter.delta.add_step(DeltaStep(self.name, parameter.delta.value, 0))
-        return sorted_parameters
+    def __call__(self, parameter_sets: Sequence[ParameterSet]) -> Sequence[ParameterSet]:
+        _zero_others(self.name, parameter_sets,
+                     self._largest(parameter_sets, lambda ps: ps.delta_values))
+        return parameter_sets
@@ -4,15 +4,16 @@ import numpy as np
 
 from modeling.domain_objects import ParameterSet, parameter_set_map, Parameter, Delta
 from modeling.parameter_updaters import ParameterUpdater, \
-    DeltaParameterUpdateStep, ScaledGradientParameterDeltaTransform, \
-    ErrorRegularizedGradient, \
-    LogScaledDelta, LargestGradientsOnly
+    DeltaParameterUpdateStep, FlatGradient, FlatLearningRate, ClampedDelta, \
+    DecreasingLearningRate, ErrorRegularizedGradient, \
+    LogScaledDelta, LargestGradientsOnly, LargestGradientsFilter, ToNegative, DeltaTracer, \
+    Momentum, AdaptiveGradientDerivative
 
 
 class ParameterUpdaterTest(unittest.TestCase):
     def test_e2e_with_flat_parameter_transform(self):
         updater = ParameterUpdater(
-            [DeltaParameterUpdateStep(ScaledGradientParameterDeltaTransform(learning_rate=.01))])
+            DeltaParameterUpdateStep.foreach(FlatGradient(), FlatLearningRate(learning_rate=.01)))
 
         param_map = parameter_set_map([
             ParameterSet("param_1", [[1, 1, 1], [1, 1, 1]], [[5, 10, -5], [0, 100, -50]]),
@@ -22,6 +23,81 @@ class ParameterUpdaterTest(unittest.TestCase):
         np.testing.assert_allclose(result_map["param_1"].values, [[0.95, 0.9, 1.05], [1., 0., 1.5]])
         np.testing.assert_allclose(result_map["param_2"].values, [1., 0., 1.5])
 
+    def test_averages_gradients_in_batch(self):
+        updater = ParameterUpdater(
+            DeltaParameterUpdateStep.foreach(FlatGradient(), FlatLearningRate(learning_rate=.01)))
+
+        param_maps = [
+            parameter_set_map([ParameterSet("param_1", [1, 1, 1], [0, 100, -50])]),
+            parameter_set_map([ParameterSet("param_1", [1, 1, 1], [10, 0, -150])])
+        ]
+        result_map = updater.adjust(param_maps)
+        np.testing.assert_allclose(result_map["param_1"].gradients, [5, 50, -100])
+        np.testing.assert_allclose(result_map["param_1"].values, [.95, .5, 2])
+
+    def test_records_delta_steps(self):
+        updater = ParameterUpdater(
+            DeltaParameterUpdateStep.foreach(FlatGradient(), FlatLearningRate(learning_rate=.01)))
+
+        param_map = parameter_set_map([ParameterSet("param_1", [1, 1], [100, -50])])
+        result_map = updater.adjust([param_map])
+        steps = result_map["param_1"].parameters[1].delta.steps
+        self.assertEqual([step.name for step in steps],
+                         ["Flat gradient", "Flat learning rate", "To negative"])
+        self.assertEqual(steps[1].input_value, -50)
+        self.assertEqual(steps[1].output_value, -.5)
+
+    def test_tracing_off(self):
+        updater = ParameterUpdater(
+            DeltaParameterUpdateStep.foreach(FlatGradient(), FlatLearningRate(learning_rate=.01)),
+            tracer=DeltaTracer.off())
+
+        param_map = parameter_set_map([ParameterSet("param_1", [1, 1], [100, -50])])
+        result_map = updater.adjust([param_map])
+        self.assertIsNone(result_map["param_1"].trace)
+        self.assertEqual(result_map["param_1"].parameters[1].delta.steps, [])
+        np.testing.assert_allclose(result_map["param_1"].values, [0, 1.5])
+
+    def test_tracing_sampled(self):
+        updater = ParameterUpdater(
+            DeltaParameterUpdateStep.foreach(FlatGradient(), FlatLearningRate(learning_rate=.01)),
+            tracer=DeltaTracer.sampled(batch_stride=2, parameter_indices={"param_1": [2]}))
+
+        def adjust():
+            return updater.adjust([parameter_set_map([
+                ParameterSet("param_1", [1, 1, 1], [100, -50, 10]),
+                ParameterSet("param_2", [1, 1, 1], [100, -50, 10])])])
+
+        result_map = adjust()
+        self.assertIsNone(result_map["param_2"].trace)
+        self.assertEqual(result_map["param_1"].trace.input_values.shape, (3, 1))
+        self.assertEqual(result_map["param_1"].parameters[0].delta.steps, [])
+        steps = result_map["param_1"].parameters[2].delta.steps
+        self.assertEqual([(step.input_value, step.output_value) for step in steps],
+                         [(0, 10), (10, .1), (.1, -.1)])
+
+        result_map = adjust()
+        self.assertIsNone(result_map["param_1"].trace)
+
+        result_map = adjust()
+        self.assertIsNotNone(result_map["param_1"].trace)
+
+
+class ArrayTransformTest(unittest.TestCase):
+    def assert_apply_matches_call(self, transformer):
+        parameter_set = ParameterSet("set_a", [[1, 2, 3], [4, 5, 6]],
+                                     [[5, 10, -5], [0, 2e6, -50]])
+        parameter_set.delta_values[:] = [[-10, 0, 10], [3, -2e6, .5]]
+        expected = np.reshape([transformer(p) for p in parameter_set.parameters], (2, 3))
+        np.testing.assert_allclose(transformer.apply(parameter_set), expected)
+
+    def test_transforms(self):
+        for transformer in [FlatGradient(), FlatLearningRate(.1), ClampedDelta(-5, 5),
+                            LogScaledDelta(), ToNegative(),
+                            DecreasingLearningRate(.1, 100, lambda: 10, degree=2),
+                            ErrorRegularizedGradient(lambda: 4)]:
+            self.assert_apply_matches_call(transformer)
+
 
 class DeltaTransformTest(unittest.TestCase):
     def test_error_regularized(self):
@@ -31,7 +107,7 @@ class DeltaTransformTest(unittest.TestCase):
 
         parameter = Parameter("set_a", 1, 4, -10, Delta())
         result = transformer(parameter)
-        self.assertEqual(result, -.5)
+        self.assertEqual(result, -2)
 
         total_error = 50
         result = transformer(parameter)
@@ -53,27 +129,115 @@ class DeltaTransformTest(unittest.TestCase):
         self.assertAlmostEqual(result, 2.3979, places=4)
 
 
+class MomentumTest(unittest.TestCase):
+    def test_apply_matches_call(self):
+        scalar_momentum = Momentum([.9, .1])
+        array_momentum = Momentum([.9, .1])
+        random = np.random.RandomState(3)
+        for i in range(20):
+            parameter_set = ParameterSet("set_a", np.zeros((4, 5)), np.zeros((4, 5)))
+            parameter_set.delta_values[:] = random.normal(scale=1e3, size=(4, 5))
+            expected = np.reshape([scalar_momentum(p) for p in parameter_set.parameters], (4, 5))
+            np.testing.assert_array_equal(array_momentum.apply(parameter_set), expected)
+
+    def test_apply_with_mask(self):
+        scalar_momentum = Momentum([.5, .3, .2])
+        array_momentum = Momentum([.5, .3, .2])
+        random = np.random.RandomState(5)
+        for i in range(10):
+            parameter_set = ParameterSet("set_a", np.zeros(6), np.zeros(6))
+            parameter_set.delta_values[:] = random.normal(size=6)
+            parameter_set.mask = random.rand(6) > .5
+            expected = parameter_set.delta_values.copy()
+            for p in parameter_set.active_parameters:
+                expected[p.index] = scalar_momentum(p)
+            actual = array_momentum.apply(parameter_set)
+            np.testing.assert_array_equal(actual[parameter_set.mask], expected[parameter_set.mask])
+
+    def test_history_is_fixed_size(self):
+        momentum = Momentum([.9, .1])
+        parameter_set = ParameterSet("set_a", np.zeros((30, 40)), np.zeros((30, 40)))
+        for i in range(5):
+            parameter_set.delta_values[:] = i + 1
+            momentum.apply(parameter_set)
+        self.assertEqual(momentum.array_history["set_a"].values.shape, (2, 30, 40))
+
+
+class AdaptiveGradientDerivativeTest(unittest.TestCase):
+    def test_step_sizes(self):
+        step = AdaptiveGradientDerivative(total_error_getter=lambda: 1)
+        deltas = []
+        for gradient in [1, 2, 3, -1, -2]:
+            parameter_set = ParameterSet("set_a", [0, 0], [gradient, 1])
+            step([parameter_set])
+            deltas.append(parameter_set.delta_values[0])
+
+        start_step = .001 * 1.01 * 1.01 * .9
+        np.testing.assert_allclose(deltas, [.001, .0012, .00144, 0, -start_step])
+
+    def test_mask_leaves_state_unchanged(self):
+        step = AdaptiveGradientDerivative(total_error_getter=lambda: 1)
+        for gradient in [1, 2]:
+            parameter_set = ParameterSet("set_a", [0, 0], [gradient, gradient])
+            parameter_set.mask = np.array([True, gradient == 1])
+            step([parameter_set])
+        np.testing.assert_allclose(parameter_set.delta_values, [.0012, 0])
+
+        parameter_set = ParameterSet("set_a", [0, 0], [3, 2])
+        step([parameter_set])
+        np.testing.assert_allclose(parameter_set.delta_values, [.00144, .0012])
+
+
 class LargestEffectFilteringParameterUpdateStepTest(unittest.TestCase):
-    def test_filter_none(self):
-        filter_step = LargestGradientsOnly(keep_rate=1)
+    @staticmethod
+    def create_parameter_sets():
         parameter_set = ParameterSet("param_1", [[1, 1, 1], [1, 1, 1]],
                                      [[5, 10, -5], [0, 100, -50]])
-        parameters = filter_step(parameter_set.parameters)
-        for p in parameter_set.parameters:
-            self.assertIn(p, parameters)
+        parameter_set.delta_values[:] = 1
+        return [parameter_set]
+
+    def test_filter_none(self):
+        filter_step = LargestGradientsOnly(keep_rate=1)
+        parameter_sets = filter_step(self.create_parameter_sets())
+        np.testing.assert_array_equal(parameter_sets[0].delta_values, np.ones((2, 3)))
 
     def test_filter_all(self):
         filter_step = LargestGradientsOnly(keep_rate=0)
-        parameter_set = ParameterSet("param_1", [[1, 1, 1], [1, 1, 1]],
-                                     [[5, 10, -5], [0, 100, -50]])
-        parameters = filter_step(parameter_set.parameters)
-        self.assertEqual(len(parameters), 0)
+        parameter_sets = filter_step(self.create_parameter_sets())
+        np.testing.assert_array_equal(parameter_sets[0].delta_values, np.zeros((2, 3)))
 
     def test_keep_top_third(self):
         filter_step = LargestGradientsOnly(keep_rate=.33)
-        parameter_set = ParameterSet("param_1", [[1, 1, 1], [1, 1, 1]],
-                                     [[5, 10, -5], [0, 100, -50]])
-        parameters = filter_step(parameter_set.parameters)
-        self.assertEqual(len(parameters), 2)
-        self.assertEqual(parameters[0].gradient, 100)
-        self.assertEqual(parameters[1].gradient, -50)
+        parameter_sets = filter_step(self.create_parameter_sets())
+        np.testing.assert_array_equal(parameter_sets[0].delta_values, [[0, 0, 0], [0, 1, 1]])
+
+    def test_top_across_parameter_sets(self):
+        filter_step = LargestGradientsOnly(keep_rate=.5)
+        parameter_sets = [ParameterSet("param_1", [1, 1], [5, -20]),
+                          ParameterSet("param_2", [1, 1], [30, 1])]
+        for parameter_set in parameter_sets:
+            parameter_set.delta_values[:] = 1
+        filter_step(parameter_sets)
+        np.testing.assert_array_equal(parameter_sets[0].delta_values, [0, 1])
+        np.testing.assert_array_equal(parameter_sets[1].delta_values, [1, 0])
+
+    def test_sampled_threshold(self):
+        random = np.random.default_rng(7)
+        filter_step = LargestGradientsOnly(keep_rate=.1, sample_size=1000, random=random)
+        parameter_set = ParameterSet("param_1", np.zeros((200, 500)),
+                                     random.normal(size=(200, 500)))
+        parameter_set.delta_values[:] = 1
+        filter_step([parameter_set])
+
+        kept = parameter_set.delta_values != 0
+        self.assertAlmostEqual(np.mean(kept), .1, delta=.03)
+        self.assertGreaterEqual(np.min(np.abs(parameter_set.gradients[kept])),
+                                np.max(np.abs(parameter_set.gradients[~kept])))
+
+    def test_filter_restricts_later_steps(self):
+        updater = ParameterUpdater(
+            [LargestGradientsFilter(keep_rate=.5)] +
+            DeltaParameterUpdateStep.foreach(FlatGradient(), FlatLearningRate(learning_rate=.01)))
+        param_map = parameter_set_map([ParameterSet("param_1", [1, 1, 1, 1], [5, -20, 30, 1])])
+        result_map = updater.adjust([param_map])
+        np.testing.assert_allclose(result_map["param_1"].values, [1, 1.2, .7, 1])
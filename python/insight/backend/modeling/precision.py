@@ -0,0 +1,38 @@
+import numpy as np
+
+
+class DTypePolicy:
+    """
+    The floating point types a network computes and stores its parameters in. When master_dtype is
+    set, each layer also keeps master copies of its parameter values in that type. The updater
+    reads and adjusts the masters and the compute copies are rounded from them, so updates too
+    small for the compute type still accumulate.
+    """
+
+    def __init__(self, name: str, compute_dtype, master_dtype=None):
+        self.name = name
+        self.compute_dtype = np.dtype(compute_dtype)
+        self.master_dtype = None if master_dtype is None else np.dtype(master_dtype)
+
+    @property
+    def keeps_masters(self) -> bool:
+        return self.master_dtype is not None and self.master_dtype != self.compute_dtype
+
+    def __repr__(self):
+        return "DTypePolicy({0})".format(self.name)
+
+
+FLOAT64 = DTypePolicy("float64", np.float64)
+FLOAT32 = DTypePolicy("float32", np.float32)
+# float32 compute and storage with float64 master weights for the updater.
+MIXED = DTypePolicy("mixed", np.float32, np.float64)
+
+policies = {policy.name: policy for policy in (FLOAT64, FLOAT32, MIXED)}
+
+
+def get_policy(name: str) -> DTypePolicy:
+    policy = policies.get(name)
+    if policy is None:
+        raise ValueError("Unknown dtype policy {0}, expected one of {1}".format(
+            name, ", ".join(policies)))
+    return policy
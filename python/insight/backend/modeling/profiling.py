@@ -0,0 +1,157 @@
+import threading
+import time
+from typing import Callable
+
+
+class PhaseStats:
+    """
+    The calls and wall time recorded for one phase.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.total_seconds = 0.
+        self.max_seconds = 0.
+
+    @property
+    def mean_seconds(self) -> float:
+        return self.total_seconds / self.count if self.count > 0 else 0.
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "count": self.count,
+            "totalSeconds": self.total_seconds,
+            "meanSeconds": self.mean_seconds,
+            "maxSeconds": self.max_seconds
+        }
+
+
+class _Phase:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler: "Profiler", name: str):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NoPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NO_PHASE = _NoPhase()
+
+
+class Profiler:
+    """
+    Records the wall time and call count of named phases, eg. "level_0/forward". Phases are
+    timed with:
+
+        with profiler.phase("level_0", "forward"):
+            ...
+
+    The name parts are joined with "/". While the profiler is disabled, phase() returns a shared
+    context manager that does nothing, without building the phase's name. Hooks are called with
+    the name and seconds of every recorded phase.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.phases = {}
+        self.hooks = []
+        self._lock = threading.Lock()
+
+    def phase(self, *name_parts):
+        if not self.enabled:
+            return NO_PHASE
+        return _Phase(self, "/".join(map(str, name_parts)))
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            stats = self.phases.get(name)
+            if stats is None:
+                stats = self.phases[name] = PhaseStats(name)
+            stats.add(seconds)
+        for hook in self.hooks:
+            hook(name, seconds)
+
+    def add_hook(self, hook: Callable[[str, float], None]):
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook: Callable[[str, float], None]):
+        self.hooks.remove(hook)
+
+    def reset(self):
+        with self._lock:
+            self.phases = {}
+
+    def stats(self) -> dict:
+        with self._lock:
+            phases = [stats.to_dict() for stats in self.phases.values()]
+        return {
+            "enabled": self.enabled,
+            "phases": sorted(phases, key=lambda phase: phase["name"])
+        }
+
+    def __getstate__(self):
+        # Locks can't be pickled, and hooks belong to the process that added them.
+        state = self.__dict__.copy()
+        del state["_lock"]
+        state["hooks"] = []
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+class _NullProfiler(Profiler):
+    """
+    The profiler of objects that are not being profiled. It can't be enabled.
+    """
+
+    def __init__(self):
+        super().__init__(enabled=False)
+
+    @property
+    def enabled(self) -> bool:
+        return False
+
+    @enabled.setter
+    def enabled(self, enabled: bool):
+        if enabled:
+            raise ValueError("The null profiler can't be enabled; set a Profiler instead")
+
+    def record(self, name: str, seconds: float):
+        pass
+
+    def __reduce__(self):
+        return _null_profiler, ()
+
+
+NULL_PROFILER = _NullProfiler()
+
+
+def _null_profiler() -> Profiler:
+    return NULL_PROFILER
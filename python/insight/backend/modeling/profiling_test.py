@@ -0,0 +1,48 @@
+import pickle
+import unittest
+
+from modeling.profiling import Profiler, NULL_PROFILER, NO_PHASE
+
+
+class ProfilerTest(unittest.TestCase):
+    def test_phases(self):
+        profiler = Profiler()
+        calls = []
+        profiler.add_hook(lambda name, seconds: calls.append(name))
+        for _ in range(3):
+            with profiler.phase("level", 0, "forward"):
+                pass
+        profiler.record("update/Momentum", 2.)
+        profiler.record("update/Momentum", 1.)
+
+        stats = {phase["name"]: phase for phase in profiler.stats()["phases"]}
+        self.assertEqual(stats["level/0/forward"]["count"], 3)
+        self.assertEqual(stats["update/Momentum"]["totalSeconds"], 3.)
+        self.assertEqual(stats["update/Momentum"]["meanSeconds"], 1.5)
+        self.assertEqual(stats["update/Momentum"]["maxSeconds"], 2.)
+        self.assertEqual(len(calls), 5)
+
+        profiler.reset()
+        self.assertEqual(profiler.stats()["phases"], [])
+
+    def test_disabled(self):
+        profiler = Profiler(enabled=False)
+        self.assertIs(profiler.phase("forward"), NO_PHASE)
+        self.assertIs(NULL_PROFILER.phase("forward"), NO_PHASE)
+        with self.assertRaises(ValueError):
+            NULL_PROFILER.enabled = True
+
+    def test_pickle(self):
+        profiler = Profiler()
+        profiler.add_hook(lambda name, seconds: None)
+        profiler.record("forward", 1.)
+        copy = pickle.loads(pickle.dumps(profiler))
+        self.assertEqual(copy.stats(), profiler.stats())
+        self.assertEqual(copy.hooks, [])
+        with copy.phase("backward"):
+            pass
+        self.assertIs(pickle.loads(pickle.dumps(NULL_PROFILER)), NULL_PROFILER)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,236 @@
+import json
+import multiprocessing
+import os
+import queue
+import time
+from typing import List, Mapping
+
+import numpy as np
+
+from modeling.common.shared_arrays import SharedArrays
+from modeling.networks import NeuralNetwork
+from modeling.trainers import Trainer
+
+
+def _key(layer_index: int, attribute: str) -> str:
+    return str(layer_index) + "/" + attribute
+
+
+class SharedParameters:
+    """
+    The parameter values and gradients of a network, kept in one shared memory block. Binding a
+    network points its layers' parameter arrays at the block, so every network bound to it, in any
+    process, computes with the same live arrays without copying them.
+
+    Readers are not synchronized with the training process, so a reader may see parameters from
+    two consecutive updates. A layer whose dtype policy is changed after binding gets private
+    arrays again.
+    """
+
+    def __init__(self, shared: SharedArrays):
+        self.shared = shared
+
+    @staticmethod
+    def create(network: NeuralNetwork) -> "SharedParameters":
+        """
+        Moves the network's parameter arrays into a new shared memory block.
+        """
+        shapes = {}
+        dtypes = {}
+        for index, layer in enumerate(network.layers):
+            for attributes in layer.storage_attributes():
+                for attribute in attributes:
+                    array = getattr(layer, attribute)
+                    shapes[_key(index, attribute)] = array.shape
+                    dtypes[_key(index, attribute)] = array.dtype
+        parameters = SharedParameters(SharedArrays(shapes, dtypes))
+        parameters.bind(network, copy=True)
+        return parameters
+
+    @staticmethod
+    def from_descriptor(descriptor: Mapping) -> "SharedParameters":
+        """
+        Attaches to the block described by descriptor().
+        """
+        return SharedParameters(SharedArrays(descriptor["shapes"], descriptor["dtypes"],
+                                             descriptor["name"]))
+
+    def descriptor(self) -> dict:
+        return {
+            "name": self.shared.name,
+            "shapes": {key: list(shape) for key, shape in self.shared.shapes.items()},
+            "dtypes": {key: dtype.str for key, dtype in self.shared.dtypes.items()}
+        }
+
+    def bind(self, network: NeuralNetwork, copy: bool = False, writable: bool = True):
+        """
+        Points the network's parameter arrays at the shared ones. The network must have the same
+        layers as the network the block was created from.
+
+        :param copy: Copy the network's current parameters into the block first.
+        :param writable: Bind read-only views, so eg. an evaluator can't update the parameters.
+        """
+        for index, layer in enumerate(network.layers):
+            for attributes in layer.storage_attributes():
+                for attribute in attributes:
+                    key = _key(index, attribute)
+                    current = getattr(layer, attribute)
+                    if key not in self.shared or self.shared[key].shape != current.shape or \
+                            self.shared[key].dtype != current.dtype:
+                        raise ValueError(
+                            "Layer {0} {1} does not match the shared parameters".format(
+                                index, attribute))
+                    array = self.shared[key]
+                    if copy:
+                        np.copyto(array, current)
+                    if not writable:
+                        array = array.view()
+                        array.flags.writeable = False
+                    setattr(layer, attribute, array)
+
+    def close(self):
+        """
+        Detaches from the block, and unlinks it if this process created it. Networks bound to it
+        must not be used afterwards.
+        """
+        self.shared.close()
+
+
+class SharedParameterRegistry:
+    """
+    Shared parameter blocks by network id. With a directory, each block's descriptor is also
+    written to <directory>/<network id>.json, so processes that were not started by this one can
+    attach by id.
+    """
+
+    def __init__(self, directory: str = None):
+        self.directory = directory
+        self.parameters = {}
+
+    def share(self, network: NeuralNetwork) -> SharedParameters:
+        parameters = self.parameters.get(network.id)
+        if parameters is None:
+            parameters = self.parameters[network.id] = SharedParameters.create(network)
+            if self.directory is not None:
+                os.makedirs(self.directory, exist_ok=True)
+                with open(self._path(network.id), 'w') as descriptor_file:
+                    json.dump(parameters.descriptor(), descriptor_file)
+        return parameters
+
+    def get(self, network_id: str) -> SharedParameters:
+        parameters = self.parameters.get(network_id)
+        if parameters is None:
+            if self.directory is None or not os.path.exists(self._path(network_id)):
+                raise KeyError("No shared parameters registered for " + network_id)
+            with open(self._path(network_id)) as descriptor_file:
+                parameters = SharedParameters.from_descriptor(json.load(descriptor_file))
+            self.parameters[network_id] = parameters
+        return parameters
+
+    def attach(self, network_id: str, network: NeuralNetwork,
+               writable: bool = False) -> SharedParameters:
+        """
+        Binds a replica of the registered network to its shared parameters, read-only by default.
+        """
+        parameters = self.get(network_id)
+        parameters.bind(network, writable=writable)
+        return parameters
+
+    def release(self, network_id: str):
+        parameters = self.parameters.pop(network_id, None)
+        if parameters is None:
+            return
+        if parameters.shared.owner and self.directory is not None and \
+                os.path.exists(self._path(network_id)):
+            os.remove(self._path(network_id))
+        parameters.close()
+
+    def close(self):
+        for network_id in list(self.parameters):
+            self.release(network_id)
+
+    def _path(self, network_id: str) -> str:
+        return os.path.join(self.directory, network_id + '.json')
+
+
+class ContinuousValidator:
+    """
+    Validates a replica of a trainer in another process, every interval seconds, on the live
+    parameters of the trainer's network. The network must be bound to parameters, eg. by
+    SharedParameterRegistry.share, before the validator is started.
+    """
+
+    def __init__(self, trainer: Trainer, parameters: SharedParameters, interval: float = 1.,
+                 **validate_options):
+        """
+        :param validate_options: Passed to Trainer.validate. output_limit defaults to 0, so only
+            the error is measured.
+        """
+        self.trainer = trainer
+        self.parameters = parameters
+        self.interval = interval
+        self.validate_options = dict(validate_options)
+        self.validate_options.setdefault("output_limit", 0)
+        self._results = multiprocessing.Queue()
+        self._stop = multiprocessing.Event()
+        self._process = None
+
+    def start(self):
+        self._process = multiprocessing.Process(
+            target=run_validator,
+            args=(self.trainer, self.parameters.descriptor(), self.interval,
+                  self.validate_options, self._results, self._stop),
+            name="insight-validator", daemon=True)
+        self._process.start()
+
+    def results(self, timeout: float = None) -> List[dict]:
+        """
+        The validations that finished since the last call. Waits up to timeout seconds for the
+        first one when there are none yet.
+        """
+        results = []
+        try:
+            results.append(self._results.get(timeout=timeout) if timeout else
+                           self._results.get_nowait())
+            while True:
+                results.append(self._results.get_nowait())
+        except queue.Empty:
+            pass
+        return results
+
+    def close(self):
+        self._stop.set()
+        if self._process is not None:
+            self._process.join(self.interval + 5)
+            if self._process.is_alive():
+                self._process.terminate()
+            self._process = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def run_validator(trainer: Trainer, descriptor: Mapping, interval: float,
+                  validate_options: Mapping, results: "multiprocessing.Queue",
+                  stop: "multiprocessing.Event"):
+    parameters = SharedParameters.from_descriptor(descriptor)
+    parameters.bind(trainer.network, writable=False)
+    try:
+        while not stop.is_set():
+            start_time = time.time()
+            validation = trainer.validate(**validate_options)
+            results.put({
+                "time": start_time,
+                "seconds": time.time() - start_time,
+                "error": float(validation.error),
+                "avgError": float(validation.avg_error),
+                "sampleCount": validation.sample_count
+            })
+            stop.wait(interval)
+    finally:
+        # The layers still point at the block, so it is detached when the process exits.
+        results.close()
@@ -0,0 +1,111 @@
+import copy
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+from modeling.networks import FeedForward
+from modeling.parallel_test import create_trainer
+from modeling.shared_parameters import SharedParameters, SharedParameterRegistry, \
+    ContinuousValidator
+
+BACKEND_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Attaches a pickled replica of a network to its registered parameters and prints a weight, like
+# an evaluator that was not started by the training process.
+EVALUATOR = """
+import pickle, sys
+from modeling.shared_parameters import SharedParameterRegistry
+with open(sys.argv[2], 'rb') as replica_file:
+    replica = pickle.load(replica_file)
+SharedParameterRegistry(sys.argv[1]).attach(replica.id, replica)
+print(replica.layers[1].fx_weights[0, 0])
+"""
+
+
+class SharedParametersTest(unittest.TestCase):
+    def test_replica_reads_live_parameters(self):
+        trainer = create_trainer()
+        replica = copy.deepcopy(trainer.network)
+        parameters = SharedParameters.create(trainer.network)
+        try:
+            reader = SharedParameters.from_descriptor(parameters.descriptor())
+            reader.bind(replica, writable=False)
+
+            trainer.batch_train(8, 3)
+            for layer, replica_layer in zip(trainer.network.layers, replica.layers):
+                np.testing.assert_array_equal(replica_layer.weights, layer.weights)
+                np.testing.assert_array_equal(replica_layer.bias_gradients, layer.bias_gradients)
+            inputs = trainer.sample_inputs(5)
+            np.testing.assert_array_equal(replica.forward_pass(inputs),
+                                          np.copy(trainer.network.forward_pass(inputs)))
+
+            with self.assertRaises(ValueError):
+                replica.layers[0].set_parameters(trainer.network.layers[0].get_parameters())
+            with self.assertRaises(ValueError):
+                parameters.bind(FeedForward(create_trainer().network.layers[1:]))
+            reader.close()
+        finally:
+            parameters.close()
+
+    def test_registry(self):
+        with tempfile.TemporaryDirectory() as directory:
+            trainer = create_trainer()
+            registry = SharedParameterRegistry(directory)
+            parameters = registry.share(trainer.network)
+            self.assertIs(registry.share(trainer.network), parameters)
+
+            # A registry in another process only knows the descriptor file.
+            other = SharedParameterRegistry(directory)
+            replica = copy.deepcopy(trainer.network)
+            other.attach(trainer.network.id, replica)
+            trainer.network.layers[1].weights[0, 0] = 7
+            self.assertEqual(replica.layers[1].fx_weights[0, 0], 7)
+            other.close()
+
+            registry.release(trainer.network.id)
+            with self.assertRaises(KeyError):
+                SharedParameterRegistry(directory).get(trainer.network.id)
+
+    def test_registry_from_unrelated_process(self):
+        with tempfile.TemporaryDirectory() as directory:
+            trainer = create_trainer()
+            registry = SharedParameterRegistry(directory)
+            registry.share(trainer.network)
+            trainer.network.layers[1].weights[0, 0] = 7
+            replica_path = os.path.join(directory, 'replica.pickle')
+            with open(replica_path, 'wb') as replica_file:
+                pickle.dump(trainer.network, replica_file)
+
+            for _ in range(2):
+                evaluator = subprocess.run(
+                    [sys.executable, '-c', EVALUATOR, directory, replica_path],
+                    cwd=BACKEND_DIRECTORY, capture_output=True, text=True, timeout=60)
+                self.assertEqual(evaluator.returncode, 0, evaluator.stderr)
+                self.assertEqual(float(evaluator.stdout), 7)
+                self.assertNotIn("leaked", evaluator.stderr)
+
+            # The evaluators exiting must not have unlinked the block.
+            trainer.batch_train(8, 1)
+            registry.release(trainer.network.id)
+
+    def test_continuous_validation(self):
+        trainer = create_trainer()
+        parameters = SharedParameters.create(trainer.network)
+        try:
+            with ContinuousValidator(copy.deepcopy(trainer), parameters, interval=.01,
+                                     chunk_size=64) as validator:
+                first = validator.results(timeout=30)
+                self.assertGreater(len(first), 0)
+                self.assertAlmostEqual(first[0]["error"], trainer.validate().error)
+                self.assertEqual(first[0]["sampleCount"], 400)
+        finally:
+            parameters.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
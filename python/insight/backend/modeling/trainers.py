@@ -1,42 +1,89 @@
 import uuid
-import itertools
 from abc import ABCMeta, abstractmethod
-from typing import Callable, Sequence, Tuple
+from typing import Callable, Iterator, Sequence, Tuple, Union
 
 import numpy as np
 
+from modeling.common.expressions import CompiledExpression, compile_expression
 from modeling.networks import NeuralNetwork
+from modeling.profiling import Profiler, NULL_PROFILER
 
 
 class BatchStepResult:
-    def __init__(self, inputs: Sequence[float], expected: Sequence[float], network: NeuralNetwork,
-                 error: float):
+    """
+    The result of a single forward and backward pass over a (batch, input_count) matrix of inputs.
+    The pass's gradients are accumulated by the network's layers rather than copied here.
+    """
+    def __init__(self, inputs: np.ndarray, expected: np.ndarray, network: NeuralNetwork,
+                 error: float, outputs: np.ndarray = None):
+        """
+        :param outputs: The pass's outputs, when they are not the network's current outputs.
+        """
         self.inputs = inputs
         self.expected = expected
-        self.outputs = network.outputs
+        # The network reuses its output buffer on the next pass.
+        self.outputs = np.array(network.outputs if outputs is None else outputs)
         self.error = error
-        self.parameters = network.get_parameters()
 
 
 class BatchResult:
     def __init__(self, batch_number: int, network: NeuralNetwork, steps: Sequence[BatchStepResult]):
         self.batch_number = batch_number
-        self.batch_size = len(steps)
+        self.batch_size = sum(map(lambda step_result: len(step_result.inputs), steps))
         self.total_error = sum(map(lambda step_result: step_result.error, steps))
         self.avg_error = self.total_error / self.batch_size
-        self.parameters = network.adjust_parameters(
-            np.transpose([step.parameters for step in steps]))
-        self.inputs = [step.inputs for step in steps]
-        self.expected = [step.expected for step in steps]
-        self.actual = [step.outputs for step in steps]
+        self.parameters = network.adjust_parameters()
+        self.inputs = np.concatenate([step.inputs for step in steps])
+        self.expected = np.concatenate([step.expected for step in steps])
+        self.actual = np.concatenate([step.outputs for step in steps])
+
+
+# The samples Trainer.validate keeps by default.
+DEFAULT_OUTPUT_LIMIT = 10000
 
 
 class ValidationResult:
-    def __init__(self, steps: Sequence[BatchStepResult]):
-        self.inputs = [step.inputs for step in steps]
-        self.expected = [step.expected for step in steps]
-        self.actual = [step.outputs for step in steps]
-        self.error = sum(map(lambda step_result: step_result.error, steps))
+    """
+    The error accumulated over the validation batches, and the inputs, expected and actual outputs
+    of every output_stride-th sample. An output_stride of 0 keeps no samples.
+    """
+
+    def __init__(self, output_stride: int = 1):
+        self.output_stride = output_stride
+        self.error = 0.
+        self.sample_count = 0
+        self._inputs = []
+        self._expected = []
+        self._actual = []
+
+    @property
+    def avg_error(self) -> float:
+        return self.error / self.sample_count if self.sample_count > 0 else 0.
+
+    @property
+    def inputs(self) -> np.ndarray:
+        return self._concatenate(self._inputs)
+
+    @property
+    def expected(self) -> np.ndarray:
+        return self._concatenate(self._expected)
+
+    @property
+    def actual(self) -> np.ndarray:
+        return self._concatenate(self._actual)
+
+    def add(self, inputs: np.ndarray, expected: np.ndarray, actual: np.ndarray, error: float):
+        if self.output_stride > 0:
+            kept = (self.sample_count + np.arange(len(inputs))) % self.output_stride == 0
+            self._inputs.append(inputs[kept])
+            self._expected.append(expected[kept])
+            self._actual.append(actual[kept])
+        self.error += error
+        self.sample_count += len(inputs)
+
+    @staticmethod
+    def _concatenate(rows: Sequence[np.ndarray]) -> np.ndarray:
+        return np.concatenate(rows) if len(rows) > 0 else np.empty((0, 0))
 
 
 class Trainer:
@@ -48,6 +95,14 @@ class Trainer:
         self.batch_size = batch_size
         self.step_tally = 0
         self.batch_tally = 0
+        self.profiler = NULL_PROFILER
+
+    def set_profiler(self, profiler: Profiler):
+        """
+        Times the trainer's batch and validation phases, and the phases of its network.
+        """
+        self.profiler = profiler
+        self.network.set_profiler(profiler)
 
     def single_train(self) -> BatchResult:
         return self.batch_train(1, 1)
@@ -56,41 +111,123 @@ class Trainer:
         if batch_size < 1:
             batch_size = self.batch_size
         self.batch_tally += 1
-        for epoch in range(epochs):
+        with self.profiler.phase("trainer", "batch"):
+            for epoch in range(epochs):
+                self.network.reset()
+                with self.profiler.phase("trainer", "step"):
+                    step_result = self._batch_step(batch_size=batch_size)
+                self.step_tally += batch_size
+                batch_result = BatchResult(self.batch_tally, self.network, [step_result])
+            return batch_result
+
+    def validate(self, chunk_size: int = 1024, resolution: float = .1, sample_count: int = None,
+                 output_limit: int = DEFAULT_OUTPUT_LIMIT) -> ValidationResult:
+        """
+        Measures the error over the validation set in batches of at most chunk_size inputs, without
+        updating gradients.
+
+        :param resolution: The spacing of the validation grid.
+        :param sample_count: Validate on this many random inputs instead of the grid.
+        :param output_limit: Keep the inputs and outputs of at most this many evenly spaced
+            samples. None keeps all of them, which for a grid over several inputs can be more than
+            fits in memory.
+        """
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+        with self.profiler.phase("trainer", "validation"):
             self.network.reset()
-            step_results = [self._batch_step() for _ in range(batch_size)]
-            self.step_tally += batch_size
-            batch_result = BatchResult(self.batch_tally, self.network, step_results)
-        return batch_result
+            size = self._validation_size(resolution, sample_count)
+            if output_limit is None:
+                output_stride = 1
+            else:
+                output_stride = -(-size // output_limit) if output_limit > 0 else 0
+            result = ValidationResult(output_stride)
+            for inputs in self._validation_batches(chunk_size, resolution, sample_count):
+                self.network.forward_pass(inputs)
+                with self.profiler.phase("trainer", "expected_outputs"):
+                    expected = self.expected_outputs(inputs)
+                result.add(inputs, expected, self.network.outputs, self.network.error(expected))
+            return result
 
-    def validate(self) -> ValidationResult:
-        self.network.reset()
-        steps = [self._batch_step(np.array(inputs)) for inputs in self._get_validation_set()]
-        return ValidationResult(steps)
+    @abstractmethod
+    def expected_outputs(self, inputs: np.ndarray) -> np.ndarray:
+        """
+        The outputs the network should produce for a (batch, input_count) matrix of inputs.
+        """
+        pass
 
     @abstractmethod
-    def _batch_step(self, inputs=None) -> BatchStepResult: pass
+    def _batch_step(self, inputs: np.ndarray = None, batch_size: int = 1) -> BatchStepResult:
+        """
+        Runs one batched forward and backward pass. When inputs is None, batch_size inputs are
+        sampled from the training domain.
+        """
+        pass
 
     @abstractmethod
-    def _get_validation_set(self) -> Sequence[Sequence[float]]: pass
+    def _validation_size(self, resolution: float, sample_count: int = None) -> int: pass
+
+    @abstractmethod
+    def _validation_batches(self, chunk_size: int, resolution: float,
+                            sample_count: int = None) -> Iterator[np.ndarray]:
+        """
+        Yields the validation inputs as (batch, input_count) matrices of at most chunk_size rows.
+        """
+        pass
 
 
 class ClosedFormFunctionTrainer(Trainer):
+    """
+    Trains a network to fit a function over a domain. The function is either a callable that
+    takes one input vector, or an expression string that is compiled to evaluate whole batches.
+    """
+
     def __init__(self, network: NeuralNetwork,
-                 function: Callable[[Sequence[float]], Sequence[float]],
+                 function: Union[str, Callable[[Sequence[float]], Sequence[float]]],
                  domain: Tuple[float, float], batch_size: int):
         super().__init__(network, batch_size)
-        self.function = function
+        self.function = compile_expression(function) if isinstance(function, str) else function
         self.domain = domain
 
-    def _batch_step(self, inputs=None) -> BatchStepResult:
+    def expected_outputs(self, inputs: np.ndarray) -> np.ndarray:
+        if isinstance(self.function, CompiledExpression):
+            return self.function(inputs)
+        return np.reshape([self.function(x) for x in inputs], (len(inputs), -1))
+
+    def sample_inputs(self, batch_size: int) -> np.ndarray:
+        return np.random.uniform(self.domain[0], self.domain[1],
+                                 (batch_size, self.network.input_count))
+
+    def _batch_step(self, inputs: np.ndarray = None, batch_size: int = 1) -> BatchStepResult:
         if inputs is None:
-            inputs = np.random.uniform(self.domain[0], self.domain[1], self.network.input_count)
+            inputs = self.sample_inputs(batch_size)
         self.network.forward_pass(inputs)
-        expected = self.function(inputs)
+        expected = self.expected_outputs(inputs)
         error = self.network.backward_pass(expected)
         return BatchStepResult(inputs, expected, self.network, error)
 
-    def _get_validation_set(self) -> Sequence[Sequence[float]]:
-        return itertools.product(np.arange(self.domain[0], self.domain[1], .1),
-                                 repeat=self.network.input_count)
+    def _validation_axis(self, resolution: float) -> np.ndarray:
+        return np.arange(self.domain[0], self.domain[1], resolution)
+
+    def _validation_size(self, resolution: float, sample_count: int = None) -> int:
+        if sample_count is not None:
+            return sample_count
+        return len(self._validation_axis(resolution)) ** self.network.input_count
+
+    def _validation_batches(self, chunk_size: int, resolution: float,
+                            sample_count: int = None) -> Iterator[np.ndarray]:
+        input_count = self.network.input_count
+        if sample_count is not None:
+            for start in range(0, sample_count, chunk_size):
+                yield np.random.uniform(self.domain[0], self.domain[1],
+                                        (min(chunk_size, sample_count - start), input_count))
+            return
+
+        # Grid points in the same order as itertools.product over the axis, generated a chunk at
+        # a time from their flat indices.
+        axis = self._validation_axis(resolution)
+        size = self._validation_size(resolution)
+        for start in range(0, size, chunk_size):
+            indices = np.unravel_index(np.arange(start, min(start + chunk_size, size)),
+                                       (len(axis),) * input_count)
+            yield np.stack([axis[index] for index in indices], axis=1)
@@ -1,8 +1,99 @@
+import itertools
 import unittest
 
 import numpy as np
 
+from modeling.layers import LinearLayer
+from modeling.networks import FeedForward
+from modeling.parameter_generators import SequenceParameterGenerator
+from modeling.parameter_updaters import ParameterUpdater, DeltaParameterUpdateStep, FlatGradient
+from modeling.profiling import Profiler
+from modeling.trainers import ClosedFormFunctionTrainer, DEFAULT_OUTPUT_LIMIT
+
+
+def create_trainer(input_count: int) -> ClosedFormFunctionTrainer:
+    network = FeedForward([
+        LinearLayer(input_count, 3, level=1, parameter_updater=ParameterUpdater([]),
+                    parameter_generator=SequenceParameterGenerator()),
+        LinearLayer(3, 1, level=2, parameter_updater=ParameterUpdater([]),
+                    parameter_generator=SequenceParameterGenerator())
+    ])
+    return ClosedFormFunctionTrainer(network, "lambda x: x[0] * x[-1]", (-1, 1), 4)
+
 
 class ClosedFormFunctionTrainerTest(unittest.TestCase):
     def test_single_training_step(self):
-        pass
+        result = create_trainer(1).batch_train(4, 1)
+        self.assertEqual(result.batch_size, 4)
+        self.assertEqual(np.shape(result.expected), (4, 1))
+
+    def test_validation_grid_order(self):
+        trainer = create_trainer(2)
+        grid = np.concatenate(list(trainer._validation_batches(7, .5)))
+        np.testing.assert_allclose(grid, list(itertools.product(np.arange(-1, 1, .5), repeat=2)))
+
+    def test_chunked_validation(self):
+        trainer = create_trainer(3)
+        whole = trainer.validate(chunk_size=100000)
+        chunked = trainer.validate(chunk_size=37)
+        self.assertEqual(chunked.sample_count, 20 ** 3)
+        self.assertAlmostEqual(chunked.error, whole.error)
+        np.testing.assert_allclose(chunked.actual, whole.actual)
+
+    def test_validation_does_not_touch_gradients(self):
+        trainer = create_trainer(1)
+        gradients = trainer.network.layers[0].get_parameters()
+        before = {key: np.copy(value.gradients) for key, value in gradients.items()}
+        trainer.validate()
+        for key, value in trainer.network.layers[0].get_parameters().items():
+            np.testing.assert_array_equal(value.gradients, before[key])
+
+    def test_output_limit(self):
+        result = create_trainer(2).validate(chunk_size=13, output_limit=40)
+        self.assertEqual(result.sample_count, 400)
+        self.assertEqual(len(result.inputs), 40)
+        np.testing.assert_allclose(result.inputs[1], [-1, 0], atol=1e-12)
+
+        self.assertEqual(len(create_trainer(2).validate(output_limit=0).inputs), 0)
+
+    def test_default_output_limit(self):
+        result = create_trainer(4).validate(chunk_size=4096)
+        self.assertEqual(result.sample_count, 20 ** 4)
+        self.assertLessEqual(len(result.inputs), DEFAULT_OUTPUT_LIMIT)
+        self.assertEqual(len(create_trainer(4).validate(output_limit=None).inputs), 20 ** 4)
+
+    def test_random_samples(self):
+        result = create_trainer(4).validate(chunk_size=64, sample_count=1000)
+        self.assertEqual(result.sample_count, 1000)
+        self.assertEqual(np.shape(result.inputs), (1000, 4))
+        self.assertTrue(np.all(np.abs(result.inputs) <= 1))
+
+    def test_profiling(self):
+        trainer = create_trainer(2)
+        for layer in trainer.network.layers:
+            layer.parameter_updater = ParameterUpdater(DeltaParameterUpdateStep.foreach(
+                FlatGradient()))
+        trainer.batch_train(4, 1)
+        profiler = Profiler()
+        trainer.set_profiler(profiler)
+        trainer.batch_train(4, 3)
+        trainer.validate(chunk_size=100)
+
+        phases = {phase["name"]: phase for phase in profiler.stats()["phases"]}
+        self.assertEqual(phases["trainer/batch"]["count"], 1)
+        self.assertEqual(phases["trainer/step"]["count"], 3)
+        self.assertEqual(phases["trainer/validation"]["count"], 1)
+        self.assertEqual(phases["network/forward"]["count"], 3 + 4)
+        for name in ("forward", "backward", "gradients", "adjust", "update/Flat gradient",
+                     "update/To negative"):
+            self.assertEqual(phases["level_2/" + name]["count"], 7 if name == "forward" else 3)
+        self.assertLessEqual(phases["level_1/gradients"]["totalSeconds"],
+                             phases["level_1/backward"]["totalSeconds"])
+
+        profiler.enabled = False
+        trainer.batch_train(4, 1)
+        self.assertEqual(profiler.phases["trainer/batch"].count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
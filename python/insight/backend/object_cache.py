@@ -0,0 +1,298 @@
+import os
+import pickle
+import sys
+import threading
+import time
+import types
+from collections import OrderedDict
+from typing import Any, Callable, Iterable, List, Mapping
+
+import numpy as np
+
+_UNWALKED_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType,
+                   types.MethodType)
+
+
+def estimate_size(target: Any, exclude: Iterable[int] = ()) -> int:
+    """
+    Estimates the bytes reachable from target through object attributes and containers. Arrays
+    count the data they own and objects whose ids are in exclude are not walked, so objects that
+    are shared between cache entries are only counted once.
+    """
+    seen = set(exclude)
+    pending = [target]
+    size = 0
+    while len(pending) > 0:
+        value = pending.pop()
+        if id(value) in seen or isinstance(value, _UNWALKED_TYPES):
+            continue
+        seen.add(id(value))
+        size += sys.getsizeof(value)
+        if isinstance(value, np.ndarray):
+            if value.base is not None:
+                pending.append(value.base)
+            elif value.dtype != object:
+                size += value.nbytes
+            else:
+                pending.extend(value.flat)
+        elif isinstance(value, dict):
+            pending.extend(value.keys())
+            pending.extend(value.values())
+        elif isinstance(value, (list, tuple, set, frozenset)):
+            pending.extend(value)
+        elif hasattr(value, '__dict__'):
+            pending.append(value.__dict__)
+    return size
+
+
+class _Entry:
+    def __init__(self, value: Any):
+        self.value = value
+        self.size = 0
+        self.created = time.time()
+        self.accessed = self.created
+        self.hits = 0
+
+
+class ObjectCache:
+    """
+    A thread safe mapping that keeps at most max_entries objects and max_bytes of estimated memory,
+    evicting the least recently used ones first. Entries that go unused for ttl seconds expire.
+
+    With a spill_directory, evicted and expired entries are pickled there and loaded back the next
+    time they are asked for; entries that cannot be pickled are dropped. is_pinned protects
+    entries, eg. ones that are being trained, from eviction, and on_evict is called with the key
+    of every entry that is dropped for good.
+
+    references returns the keys of the other entries a value refers to, eg. a trainer's network.
+    Entries that refer to each other are evicted, spilled and reloaded together, in one pickle, so
+    a reloaded trainer still trains the network that is cached under its network's key. Such a
+    group is only evicted when none of its entries is pinned, and only expires when all of them
+    are idle.
+    """
+
+    def __init__(self, max_entries: int = None, max_bytes: int = None, ttl: float = None,
+                 spill_directory: str = None, is_pinned: Callable[[str], bool] = None,
+                 on_evict: Callable[[str], None] = None,
+                 references: Callable[[Any], Iterable[str]] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.spill_directory = spill_directory
+        self.is_pinned = is_pinned or (lambda key: False)
+        self.on_evict = on_evict or (lambda key: None)
+        self.references = references or (lambda value: ())
+        if spill_directory is not None:
+            os.makedirs(spill_directory, exist_ok=True)
+
+        self._entries = OrderedDict()
+        # The spill file of every spilled entry, named after the entry that was evicted first.
+        self._spilled = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.spills = 0
+        self.reloads = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries or key in self._spilled
+
+    def __getitem__(self, key: str) -> Any:
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is None and key in self._spilled:
+                entry = self._reload(key)
+            if entry is None:
+                self.misses += 1
+                raise KeyError("No object found with id " + key)
+
+            self.hits += 1
+            entry.hits += 1
+            entry.accessed = time.time()
+            self._entries.move_to_end(key)
+            return entry.value
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key: str, value: Any):
+        with self._lock:
+            if key in self._spilled:
+                # Bring back the entries spilled with the one being replaced.
+                self._reload(key)
+            self._entries[key] = _Entry(value)
+            self._entries.move_to_end(key)
+            self._expire()
+            self._evict(keep=key)
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            if key in self._spilled:
+                self._reload(key)
+            entry = self._entries.pop(key, None)
+            return default if entry is None else entry.value
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._expire()
+            self._measure()
+            now = time.time()
+            requests = self.hits + self.misses
+            return {
+                "entryCount": len(self._entries),
+                "spilledCount": len(self._spilled),
+                "totalBytes": sum(entry.size for entry in self._entries.values()),
+                "maxEntries": self.max_entries,
+                "maxBytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": self.hits / requests if requests > 0 else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "spills": self.spills,
+                "reloads": self.reloads,
+                "entries": [{
+                    "key": key,
+                    "type": type(entry.value).__name__,
+                    "bytes": entry.size,
+                    "hits": entry.hits,
+                    "age": now - entry.created,
+                    "idle": now - entry.accessed,
+                    "pinned": self.is_pinned(key)
+                } for key, entry in self._entries.items()]
+            }
+
+    def _measure(self):
+        """
+        Re-estimates the size of every entry. Networks grow as they train, so sizes are refreshed
+        whenever the budget is checked rather than only when entries are added.
+        """
+        ids = {id(entry.value) for entry in self._entries.values()}
+        for entry in self._entries.values():
+            entry.size = estimate_size(entry.value, ids - {id(entry.value)})
+
+    def _evict(self, keep: str = None):
+        """
+        Removes least recently used entries until the cache is within budget. The entry that was
+        just added or reloaded, and the entries it is grouped with, are kept even if they alone are
+        over budget.
+        """
+        if self.max_bytes is not None:
+            self._measure()
+        total_bytes = sum(entry.size for entry in self._entries.values())
+        if not self._over_budget(total_bytes):
+            return
+        # Removing a whole group leaves the other groups as they were, so they are found once.
+        groups = self._groups()
+        for key in list(self._entries.keys()):
+            if not self._over_budget(total_bytes):
+                return
+            if key not in self._entries:
+                # Removed with an earlier entry of its group.
+                continue
+            group = groups[key]
+            if keep not in group and not any(self.is_pinned(member) for member in group):
+                self.evictions += len(group)
+                total_bytes -= sum(self._entries[member].size for member in group)
+                self._remove(group)
+
+    def _over_budget(self, total_bytes: int) -> bool:
+        if self.max_entries is not None and len(self._entries) > self.max_entries:
+            return True
+        return self.max_bytes is not None and total_bytes > self.max_bytes
+
+    def _expire(self):
+        if self.ttl is None:
+            return
+        expired_before = time.time() - self.ttl
+        groups = None
+        for key in list(self._entries.keys()):
+            if key not in self._entries or self._entries[key].accessed >= expired_before:
+                continue
+            if groups is None:
+                groups = self._groups()
+            group = groups[key]
+            if all(self._entries[member].accessed < expired_before and
+                   not self.is_pinned(member) for member in group):
+                self.expirations += len(group)
+                self._remove(group)
+
+    def _groups(self) -> Mapping[str, List[str]]:
+        """
+        Maps the key of every cached entry to its group: the entries connected to it by
+        references, in either direction, including itself. Members of a group share one list.
+        """
+        neighbours = {key: set() for key in self._entries}
+        for key, entry in self._entries.items():
+            for referenced in self.references(entry.value):
+                if referenced in neighbours and referenced != key:
+                    neighbours[key].add(referenced)
+                    neighbours[referenced].add(key)
+        groups = {}
+        for key in self._entries:
+            if key in groups:
+                continue
+            members = [key]
+            found = {key}
+            pending = [key]
+            while len(pending) > 0:
+                for neighbour in neighbours[pending.pop()]:
+                    if neighbour not in found:
+                        found.add(neighbour)
+                        members.append(neighbour)
+                        pending.append(neighbour)
+            for member in members:
+                groups[member] = members
+        return groups
+
+    def _remove(self, group: List[str]):
+        values = {key: self._entries.pop(key).value for key in group}
+        if self.spill_directory is not None and self._spill(group[0], values):
+            return
+        for key in group:
+            self.on_evict(key)
+
+    def _spill_path(self, name: str) -> str:
+        return os.path.join(self.spill_directory, name + '.pickle')
+
+    def _spill(self, name: str, values: Mapping[str, Any]) -> bool:
+        try:
+            # One pickle, so objects the entries share are still shared when they are reloaded.
+            data = pickle.dumps(values, protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, AttributeError, TypeError):
+            return False
+        with open(self._spill_path(name), 'wb') as spill_file:
+            spill_file.write(data)
+        for key in values:
+            self._spilled[key] = name
+        self.spills += len(values)
+        return True
+
+    def _reload(self, key: str) -> _Entry:
+        """
+        Loads the spilled key back into the cache, together with the entries spilled with it.
+        """
+        name = self._spilled[key]
+        path = self._spill_path(name)
+        with open(path, 'rb') as spill_file:
+            values = pickle.load(spill_file)
+        os.remove(path)
+        for member, value in values.items():
+            del self._spilled[member]
+            self._entries[member] = _Entry(value)
+        self._entries.move_to_end(key)
+        self.reloads += len(values)
+        self._evict(keep=key)
+        return self._entries[key]
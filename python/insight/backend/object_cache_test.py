@@ -0,0 +1,120 @@
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from object_cache import ObjectCache, estimate_size
+
+
+class Holder:
+    def __init__(self, size: int):
+        self.values = np.zeros(size)
+
+
+class ObjectCacheTest(unittest.TestCase):
+    def test_lru_eviction(self):
+        evicted = []
+        cache = ObjectCache(max_entries=2, on_evict=evicted.append)
+        cache["a"] = 1
+        cache["b"] = 2
+        self.assertEqual(cache["a"], 1)
+        cache["c"] = 3
+        self.assertEqual(evicted, ["b"])
+        self.assertNotIn("b", cache)
+        self.assertIn("a", cache)
+
+    def test_memory_budget(self):
+        cache = ObjectCache(max_bytes=estimate_size(Holder(1000)) * 2)
+        cache["a"] = Holder(1000)
+        cache["b"] = Holder(1000)
+        cache["c"] = Holder(1000)
+        self.assertNotIn("a", cache)
+        self.assertEqual(cache.stats()["entryCount"], 2)
+
+    def test_pinned_entries_are_kept(self):
+        cache = ObjectCache(max_entries=1, is_pinned=lambda key: key == "a")
+        cache["a"] = 1
+        cache["b"] = 2
+        cache["c"] = 3
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+
+    def test_ttl(self):
+        cache = ObjectCache(ttl=.01)
+        cache["a"] = 1
+        time.sleep(.02)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["expirations"], 1)
+
+    def test_spill_and_reload(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ObjectCache(max_entries=1, spill_directory=directory)
+            cache["a"] = Holder(10)
+            cache["b"] = Holder(20)
+            self.assertIn("a", cache)
+            self.assertEqual(len(cache["a"].values), 10)
+            self.assertEqual(len(cache["b"].values), 20)
+            stats = cache.stats()
+            self.assertEqual((stats["spills"], stats["reloads"]), (3, 2))
+
+    def test_unpicklable_entries_are_dropped(self):
+        with tempfile.TemporaryDirectory() as directory:
+            evicted = []
+            cache = ObjectCache(max_entries=1, spill_directory=directory,
+                                on_evict=evicted.append)
+            cache["a"] = lambda: 1
+            cache["b"] = 2
+            self.assertEqual(evicted, ["a"])
+            self.assertNotIn("a", cache)
+
+    def test_referencing_entries_are_spilled_together(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ObjectCache(max_entries=2, spill_directory=directory,
+                                references=lambda value: getattr(value, "references", []))
+            network = Holder(10)
+            trainer = Holder(0)
+            trainer.network = network
+            trainer.references = ["network"]
+            cache["network"] = network
+            cache["trainer"] = trainer
+            cache["other"] = Holder(5)
+            self.assertEqual(cache.stats()["spilledCount"], 2)
+
+            reloaded_network = cache["network"]
+            self.assertIs(cache["trainer"].network, reloaded_network)
+            self.assertNotIn("other", [entry["key"] for entry in cache.stats()["entries"]])
+
+    def test_referenced_entries_of_pinned_entries_are_kept(self):
+        cache = ObjectCache(max_entries=1, is_pinned=lambda key: key == "trainer",
+                            references=lambda value: getattr(value, "references", []))
+        trainer = Holder(0)
+        trainer.references = ["network"]
+        cache["network"] = Holder(10)
+        cache["trainer"] = trainer
+        cache["other"] = 1
+        cache["newest"] = 2
+        self.assertIn("network", cache)
+        self.assertNotIn("other", cache)
+
+    def test_shared_objects_are_counted_once(self):
+        shared = Holder(1000)
+        owner = Holder(0)
+        owner.shared = shared
+        cache = ObjectCache()
+        cache["shared"] = shared
+        cache["owner"] = owner
+        sizes = {entry["key"]: entry["bytes"] for entry in cache.stats()["entries"]}
+        self.assertGreater(sizes["shared"], 8000)
+        self.assertLess(sizes["owner"], 8000)
+
+    def test_hit_rate(self):
+        cache = ObjectCache()
+        cache["a"] = 1
+        cache.get("a")
+        cache.get("b")
+        self.assertEqual(cache.stats()["hitRate"], .5)
+
+
+if __name__ == '__main__':
+    unittest.main()
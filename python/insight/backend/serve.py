@@ -0,0 +1,230 @@
+import argparse
+import http.client
+import itertools
+import json
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from typing import Optional, Sequence
+
+from flask import Flask, Response, request
+from flask_cors import CORS
+
+# Headers that describe a single connection and must not be copied between them.
+HOP_BY_HOP_HEADERS = {'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+                      'te', 'trailers', 'transfer-encoding', 'upgrade', 'host', 'content-length'}
+
+
+class Worker:
+    """
+    A process serving main.app on its own port.
+    """
+
+    def __init__(self, index: int, host: str, port: int):
+        self.index = index
+        self.host = host
+        self.port = port
+        self.process = None
+
+    def start(self):
+        self.process = multiprocessing.Process(
+            target=run_worker, args=(self.host, self.port), name="insight-worker-%d" % self.index,
+            daemon=True)
+        self.process.start()
+
+    def wait_until_ready(self, timeout: float = 30.):
+        deadline = time.time() + timeout
+        while True:
+            try:
+                socket.create_connection((self.host, self.port), timeout=1).close()
+                return
+            except OSError:
+                if time.time() > deadline or not self.process.is_alive():
+                    raise RuntimeError("Worker %d did not start" % self.index)
+                time.sleep(.1)
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+
+
+def run_worker(host: str, port: int):
+    import main
+    main.app.run(host=host, port=port, threaded=True)
+
+
+class Router:
+    """
+    Picks the worker for each request. Networks are created on the worker that owns the fewest
+    objects, and every object created from a request - network, trainer or job - is owned by the
+    worker that created it, so later requests naming its id go to the process holding it. Objects
+    a worker dropped, eg. evicted from its cache, are forgotten.
+    """
+
+    def __init__(self, worker_count: int):
+        self.worker_count = worker_count
+        self.owners = {}
+        self.owned_counts = [0] * worker_count
+        self._next = itertools.cycle(range(worker_count))
+        self._lock = threading.Lock()
+
+    def record(self, object_id: str, worker: int):
+        with self._lock:
+            if object_id not in self.owners:
+                self.owned_counts[worker] += 1
+            self.owners[object_id] = worker
+
+    def forget(self, object_ids: Sequence[str], worker: int):
+        with self._lock:
+            for object_id in object_ids:
+                if self.owners.get(object_id) == worker:
+                    del self.owners[object_id]
+                    self.owned_counts[worker] -= 1
+
+    def owner(self, object_id: str) -> int:
+        with self._lock:
+            worker = self.owners.get(object_id)
+        if worker is None:
+            raise KeyError("No worker owns " + str(object_id))
+        return worker
+
+    def least_loaded(self) -> int:
+        with self._lock:
+            return min(range(self.worker_count), key=lambda worker: self.owned_counts[worker])
+
+    def any(self) -> int:
+        with self._lock:
+            return next(self._next)
+
+    def worker_for(self, method: str, path: str, body: Optional[dict]) -> Optional[int]:
+        """
+        Returns the worker for a request, or None if the request has to go to every worker.
+        """
+        parts = path.strip('/').split('/')
+        if parts[0] == 'create_network':
+            return self.least_loaded()
+        if parts[0] == 'create_trainer':
+            return self.owner(body["networkId"])
+        if parts[0] in ('remote_command', 'profiling'):
+            return self.owner(parts[1])
+        if parts[0] == 'jobs':
+            if len(parts) > 1:
+                return self.owner(parts[1])
+            return self.owner(body["trainerId"]) if method == 'POST' else None
+        if parts[0] == 'cache':
+            return None
+        return self.any()
+
+
+def create_proxy(workers: Sequence[Worker], router: Router, object_id_header: str,
+                 dropped_ids_header: str) -> Flask:
+    proxy = Flask(__name__)
+    CORS(proxy)
+
+    def forward(worker: Worker, path: str) -> http.client.HTTPResponse:
+        """
+        Sends the request to worker. The response must be closed, which closes the connection.
+        """
+        connection = http.client.HTTPConnection(worker.host, worker.port)
+        headers = {key: value for key, value in request.headers.items()
+                   if key.lower() not in HOP_BY_HOP_HEADERS}
+        query = request.query_string.decode()
+        try:
+            connection.request(request.method, '/' + path + ('?' + query if query else ''),
+                               body=request.get_data(), headers=headers)
+            response = connection.getresponse()
+        finally:
+            # The socket stays open until the response, which reads from it, is closed as well.
+            connection.close()
+        dropped_ids = response.getheader(dropped_ids_header)
+        if dropped_ids:
+            router.forget(dropped_ids.split(','), worker.index)
+        return response
+
+    def read(response: http.client.HTTPResponse) -> bytes:
+        try:
+            return response.read()
+        finally:
+            response.close()
+
+    def relay(response: http.client.HTTPResponse) -> Response:
+        headers = [(key, value) for key, value in response.getheaders()
+                   if key.lower() not in HOP_BY_HOP_HEADERS and
+                   key.lower() != dropped_ids_header.lower()]
+        if response.getheader('Content-Type', '').startswith('text/event-stream'):
+            def stream():
+                try:
+                    while True:
+                        chunk = response.read1(65536)
+                        if not chunk:
+                            return
+                        yield chunk
+                finally:
+                    response.close()
+            return Response(stream(), status=response.status, headers=headers)
+        return Response(read(response), status=response.status, headers=headers)
+
+    def gather(path: str) -> Response:
+        results = [json.loads(read(forward(worker, path))) for worker in workers]
+        if all(isinstance(result, list) for result in results):
+            data = list(itertools.chain.from_iterable(results))
+        else:
+            data = {"workers": results}
+        return Response(json.dumps(data), status=200, mimetype='application/json')
+
+    @proxy.route('/', defaults={'path': ''}, methods=["GET", "POST"])
+    @proxy.route('/<path:path>', methods=["GET", "POST"])
+    def route(path: str):
+        try:
+            worker = router.worker_for(request.method, path, request.get_json(silent=True))
+        except KeyError as e:
+            return Response(json.dumps({"error": e.args[0]}), status=404,
+                            mimetype='application/json')
+        if worker is None:
+            return gather(path)
+
+        response = forward(workers[worker], path)
+        object_id = response.getheader(object_id_header)
+        if object_id is not None:
+            router.record(object_id, worker)
+        return relay(response)
+
+    return proxy
+
+
+def serve(worker_count: int, host: str, port: int, worker_port: int):
+    """
+    Starts worker_count processes serving the backend and a threaded proxy on host:port that
+    routes requests to them.
+    """
+    from main import OBJECT_ID_HEADER, DROPPED_IDS_HEADER
+
+    workers = [Worker(index, '127.0.0.1', worker_port + index) for index in range(worker_count)]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.wait_until_ready()
+        proxy = create_proxy(workers, Router(worker_count), OBJECT_ID_HEADER, DROPPED_IDS_HEADER)
+        proxy.run(host=host, port=port, threaded=True)
+    finally:
+        for worker in workers:
+            worker.stop()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Serve the backend from several processes.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--worker-port', type=int, default=5100,
+                        help='Port of the first worker; the others use the ports after it.')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    serve(args.workers, args.host, args.port, args.worker_port)
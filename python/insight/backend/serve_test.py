@@ -0,0 +1,52 @@
+import unittest
+
+from serve import Router
+
+
+class RouterTest(unittest.TestCase):
+    def test_networks_go_to_least_loaded_worker(self):
+        router = Router(2)
+        self.assertEqual(router.worker_for("POST", "create_network", {}), 0)
+        router.record("network_1", 0)
+        self.assertEqual(router.worker_for("POST", "create_network", {}), 1)
+
+    def test_requests_follow_owner(self):
+        router = Router(3)
+        router.record("network_1", 2)
+        router.record("trainer_1", 2)
+        router.record("job_1", 2)
+        self.assertEqual(router.worker_for("POST", "create_trainer", {"networkId": "network_1"}), 2)
+        self.assertEqual(router.worker_for("POST", "remote_command/trainer_1/batch_train", {}), 2)
+        self.assertEqual(router.worker_for("POST", "jobs", {"trainerId": "trainer_1"}), 2)
+        self.assertEqual(router.worker_for("GET", "jobs/job_1/events", None), 2)
+        self.assertEqual(router.worker_for("GET", "profiling/network_1", None), 2)
+
+    def test_dropped_objects_are_forgotten(self):
+        router = Router(2)
+        router.record("network_1", 0)
+        router.record("network_2", 0)
+        router.forget(["network_1", "network_2", "unknown"], 0)
+        self.assertEqual(router.owned_counts, [0, 0])
+        self.assertEqual(router.owners, {})
+        with self.assertRaises(KeyError):
+            router.owner("network_1")
+
+    def test_forget_ignores_other_workers(self):
+        router = Router(2)
+        router.record("network_1", 1)
+        router.forget(["network_1"], 0)
+        self.assertEqual(router.owner("network_1"), 1)
+        self.assertEqual(router.owned_counts, [0, 1])
+
+    def test_unknown_ids(self):
+        with self.assertRaises(KeyError):
+            Router(2).worker_for("POST", "remote_command/missing/batch_train", {})
+
+    def test_gathered_requests(self):
+        router = Router(2)
+        self.assertIsNone(router.worker_for("GET", "jobs", None))
+        self.assertIsNone(router.worker_for("GET", "cache/stats", None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,309 @@
+import argparse
+import functools
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import time
+from typing import Sequence, Mapping, Callable, List
+
+import h5py
+import numpy as np
+
+from experiments import Group, Dataset, ExperimentRecorder, create_network, write_validation
+from modeling.layers import LinearLayer, QuadraticLayer
+from modeling.parameter_updaters import ParameterUpdater, ParameterUpdateStep, \
+    DeltaParameterUpdateStep, FlatGradient, ClampedDelta, FlatLearningRate, LogScaledDelta, \
+    DecreasingLearningRate, Momentum, DeltaTracer
+from modeling.trainers import ClosedFormFunctionTrainer
+
+INDEX_FILE = 'index.json'
+STOP_FILE = 'STOP'
+
+layer_types = {
+    LinearLayer.__name__: LinearLayer,
+    QuadraticLayer.__name__: QuadraticLayer
+}
+
+
+def flat_steps(epochs: int, learning_rate: float,
+               epoch_getter: Callable[[], int]) -> List[ParameterUpdateStep]:
+    return DeltaParameterUpdateStep.foreach(
+        FlatGradient(),
+        ClampedDelta(),
+        FlatLearningRate(learning_rate))
+
+
+def log_scaled_steps(epochs: int, learning_rate: float,
+                     epoch_getter: Callable[[], int]) -> List[ParameterUpdateStep]:
+    return DeltaParameterUpdateStep.foreach(
+        FlatGradient(),
+        LogScaledDelta(),
+        ClampedDelta(),
+        FlatLearningRate(learning_rate))
+
+
+def momentum_steps(epochs: int, learning_rate: float,
+                   epoch_getter: Callable[[], int]) -> List[ParameterUpdateStep]:
+    return DeltaParameterUpdateStep.foreach(
+        FlatGradient(),
+        ClampedDelta(),
+        Momentum([.9, .1]),
+        FlatLearningRate(learning_rate))
+
+
+def decreasing_steps(epochs: int, learning_rate: float,
+                     epoch_getter: Callable[[], int]) -> List[ParameterUpdateStep]:
+    return DeltaParameterUpdateStep.foreach(
+        FlatGradient(),
+        ClampedDelta(),
+        DecreasingLearningRate(learning_rate, epochs, epoch_getter, degree=2))
+
+
+updater_steps = {
+    'flat': flat_steps,
+    'log_scaled': log_scaled_steps,
+    'momentum': momentum_steps,
+    'decreasing': decreasing_steps
+}
+
+
+# Compiled by the trainer, so whole batches of expected outputs are computed at once.
+TARGET_FUNCTION = "lambda x: x * math.sin(x)"
+
+
+class SweepRun:
+    """
+    The configuration of one training run in a sweep.
+    """
+
+    def __init__(self, layer: str, nodes: Sequence[int], updater: str, learning_rate: float,
+                 epochs: int, batch_size: int):
+        if layer not in layer_types:
+            raise ValueError(layer + " is not a known layer type")
+        if updater not in updater_steps:
+            raise ValueError(updater + " is not a known updater")
+        if epochs < 1:
+            raise ValueError("epochs must be at least 1")
+        self.layer = layer
+        self.nodes = list(nodes)
+        self.updater = updater
+        self.learning_rate = float(learning_rate)
+        self.epochs = int(epochs)
+        self.batch_size = int(batch_size)
+
+    @property
+    def key(self) -> str:
+        """
+        A name that is unique to this configuration, used for the run's output file.
+        """
+        digest = hashlib.sha1(json.dumps(self.to_dict(), sort_keys=True).encode()).hexdigest()
+        return self.layer + '_' + digest[:12]
+
+    def to_dict(self) -> dict:
+        return {
+            'layer': self.layer,
+            'nodes': self.nodes,
+            'updater': self.updater,
+            'learningRate': self.learning_rate,
+            'epochs': self.epochs,
+            'batchSize': self.batch_size
+        }
+
+
+class SearchSpace:
+    def __init__(self,
+                 layers: Sequence[str] = tuple(layer_types.keys()),
+                 nodes: Sequence[Sequence[int]] = ([1, 5, 5, 1],),
+                 updaters: Sequence[str] = ('flat',),
+                 learning_rates: Sequence[float] = (.001,),
+                 epochs: Sequence[int] = (100000,),
+                 batch_sizes: Sequence[int] = (2,)):
+        self.layers = layers
+        self.nodes = nodes
+        self.updaters = updaters
+        self.learning_rates = learning_rates
+        self.epochs = epochs
+        self.batch_sizes = batch_sizes
+
+    def grid(self) -> List[SweepRun]:
+        return [SweepRun(*values) for values in itertools.product(
+            self.layers, self.nodes, self.updaters, self.learning_rates, self.epochs,
+            self.batch_sizes)]
+
+    def random(self, count: int, seed: int = None) -> List[SweepRun]:
+        """
+        Samples count runs. Learning rates are drawn log-uniformly between the smallest and the
+        largest of learning_rates; every other setting is drawn from its list.
+        """
+        generator = random.Random(seed)
+        low, high = np.log(min(self.learning_rates)), np.log(max(self.learning_rates))
+        return [SweepRun(generator.choice(self.layers),
+                         generator.choice(self.nodes),
+                         generator.choice(self.updaters),
+                         float(np.exp(generator.uniform(low, high))),
+                         generator.choice(self.epochs),
+                         generator.choice(self.batch_sizes))
+                for _ in range(count)]
+
+
+def run_seed(run: SweepRun, sweep_seed: int = None) -> int:
+    """
+    The random seed of a run, derived from the sweep's seed and the run's key, so the runs of a
+    sweep draw different numbers and rerunning a run reproduces it.
+    """
+    digest = hashlib.sha1((str(sweep_seed) + '/' + run.key).encode()).digest()
+    return int.from_bytes(digest[:4], 'little')
+
+
+def run_experiment(run: SweepRun, directory: str, stride: int = 1, stop_check_interval: int = 100,
+                   seed: int = None) -> dict:
+    """
+    Trains and validates one run, writing its results to <directory>/<run.key>.h5. Training stops
+    early if the sweep's STOP file appears, in which case the run is reported as incomplete.
+    """
+    start_time = time.time()
+    np.random.seed(seed)
+    epoch = 0
+
+    def create_updater(network):
+        return ParameterUpdater(
+            updater_steps[run.updater](run.epochs, run.learning_rate, lambda: epoch),
+            tracer=DeltaTracer.off())
+
+    network = create_network(layer_types[run.layer], run.nodes, create_updater)
+    trainer = ClosedFormFunctionTrainer(network, TARGET_FUNCTION, (-5, 5), run.batch_size)
+
+    path = os.path.join(directory, run.key + '.h5')
+    file = h5py.File(path, 'w')
+    configuration = file.require_group(Group.CONFIGURATION)
+    configuration.create_dataset(Dataset.EPOCHS, data=run.epochs)
+    configuration.create_dataset(Dataset.BATCH_SIZE, data=run.batch_size)
+    configuration.create_dataset(Dataset.LAYERS, data=run.nodes)
+    configuration.attrs['run'] = json.dumps(run.to_dict())
+    if seed is not None:
+        configuration.attrs['seed'] = seed
+    recorder = ExperimentRecorder(file, run.epochs, stride=stride)
+
+    stop_path = os.path.join(directory, STOP_FILE)
+    result = None
+    for epoch in range(run.epochs):
+        result = trainer.batch_train(run.batch_size, 1)
+        recorder.record(result)
+        if epoch % stop_check_interval == 0 and os.path.exists(stop_path):
+            break
+    complete = epoch == run.epochs - 1
+
+    validation_error = None
+    if complete:
+        validation = trainer.validate()
+        write_validation(file, validation)
+        validation_error = float(validation.error)
+    recorder.close()
+
+    return {
+        'key': run.key,
+        'run': run.to_dict(),
+        'file': os.path.basename(path),
+        'complete': complete,
+        'seed': seed,
+        'epochsRun': epoch + 1,
+        'finalAvgError': None if result is None else float(result.avg_error),
+        'validationError': validation_error,
+        'seconds': time.time() - start_time
+    }
+
+
+def _run_seeded(run: SweepRun, directory: str, stride: int, sweep_seed: int) -> dict:
+    return run_experiment(run, directory, stride, seed=run_seed(run, sweep_seed))
+
+
+class Sweep:
+    """
+    Runs a set of SweepRuns across a process pool, writing one HDF5 file per run and a JSON index
+    of run summaries. Runs that completed in an earlier invocation are skipped, so a stopped sweep
+    resumes where it left off. Creating a file named STOP in the sweep directory stops the sweep.
+    Each run is seeded by run_seed, so sweeps with the same seed reproduce each other's runs.
+    """
+
+    def __init__(self, runs: Sequence[SweepRun], directory: str, processes: int = None,
+                 stride: int = 1, seed: int = None):
+        self.runs = runs
+        self.directory = directory
+        self.processes = processes or os.cpu_count()
+        self.stride = stride
+        self.seed = seed
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.directory, INDEX_FILE)
+
+    def load_index(self) -> Mapping[str, dict]:
+        if not os.path.exists(self.index_path):
+            return {}
+        with open(self.index_path) as index_file:
+            return json.load(index_file)
+
+    def pending(self, index: Mapping[str, dict]) -> List[SweepRun]:
+        runs = {run.key: run for run in self.runs}
+        return [run for key, run in runs.items()
+                if key not in index or not index[key]['complete']]
+
+    def run(self) -> Mapping[str, dict]:
+        os.makedirs(self.directory, exist_ok=True)
+        stop_path = os.path.join(self.directory, STOP_FILE)
+        if os.path.exists(stop_path):
+            os.remove(stop_path)
+
+        index = dict(self.load_index())
+        pending = self.pending(index)
+        if len(pending) == 0:
+            return index
+
+        task = functools.partial(_run_seeded, directory=self.directory, stride=self.stride,
+                                 sweep_seed=self.seed)
+        with multiprocessing.Pool(min(self.processes, len(pending))) as pool:
+            for summary in pool.imap_unordered(task, pending):
+                index[summary['key']] = summary
+                self._write_index(index)
+                print(summary['key'], 'complete' if summary['complete'] else 'stopped',
+                      summary['finalAvgError'])
+        return index
+
+    def _write_index(self, index: Mapping[str, dict]):
+        temporary_path = self.index_path + '.tmp'
+        with open(temporary_path, 'w') as index_file:
+            json.dump(index, index_file, indent=2, sort_keys=True)
+        os.replace(temporary_path, self.index_path)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run a hyperparameter sweep.')
+    parser.add_argument('--directory', default='sweep')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--layers', nargs='+', default=list(layer_types.keys()))
+    parser.add_argument('--nodes', nargs='+', default=['1,5,5,1'],
+                        help='Comma separated node counts, eg. 1,5,5,1')
+    parser.add_argument('--updaters', nargs='+', default=['flat'])
+    parser.add_argument('--learning-rates', nargs='+', type=float, default=[.001])
+    parser.add_argument('--epochs', nargs='+', type=int, default=[100000])
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=[2])
+    parser.add_argument('--random', type=int, default=None,
+                        help='Sample this many random runs instead of the full grid.')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--stride', type=int, default=1, help='Record every Nth epoch.')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    space = SearchSpace(args.layers,
+                        [[int(n) for n in nodes.split(',')] for nodes in args.nodes],
+                        args.updaters,
+                        args.learning_rates,
+                        args.epochs,
+                        args.batch_sizes)
+    runs = space.grid() if args.random is None else space.random(args.random, args.seed)
+    Sweep(runs, args.directory, args.processes, args.stride, args.seed).run()
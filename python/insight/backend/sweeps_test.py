@@ -0,0 +1,99 @@
+import json
+import os
+import tempfile
+import unittest
+
+import h5py
+
+from sweeps import SweepRun, SearchSpace, Sweep, run_experiment, run_seed, STOP_FILE
+
+
+def tiny_run(learning_rate: float = .01, epochs: int = 4) -> SweepRun:
+    return SweepRun('LinearLayer', [1, 2, 1], 'flat', learning_rate, epochs, 2)
+
+
+class SearchSpaceTest(unittest.TestCase):
+    def test_grid(self):
+        space = SearchSpace(layers=('LinearLayer', 'QuadraticLayer'), learning_rates=(.1, .01),
+                            epochs=(10,))
+        runs = space.grid()
+        self.assertEqual(len(runs), 4)
+        self.assertEqual(len({run.key for run in runs}), 4)
+
+    def test_random(self):
+        space = SearchSpace(learning_rates=(.001, .1), updaters=('flat', 'momentum'))
+        runs = space.random(20, seed=3)
+        self.assertEqual([run.to_dict() for run in runs],
+                         [run.to_dict() for run in space.random(20, seed=3)])
+        for run in runs:
+            self.assertGreaterEqual(run.learning_rate, .001)
+            self.assertLessEqual(run.learning_rate, .1)
+            self.assertIn(run.updater, ('flat', 'momentum'))
+
+
+class RunExperimentTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_seed_reproduces_run(self):
+        run = tiny_run()
+        first = run_experiment(run, self.directory.name, seed=run_seed(run, 5))
+        second = run_experiment(run, self.directory.name, seed=run_seed(run, 5))
+        self.assertTrue(first['complete'])
+        self.assertEqual(first['finalAvgError'], second['finalAvgError'])
+        self.assertEqual(first['validationError'], second['validationError'])
+
+    def test_run_seeds(self):
+        self.assertEqual(run_seed(tiny_run(), 1), run_seed(tiny_run(), 1))
+        self.assertNotEqual(run_seed(tiny_run(), 1), run_seed(tiny_run(), 2))
+        self.assertNotEqual(run_seed(tiny_run(.01), 1), run_seed(tiny_run(.02), 1))
+
+    def test_stops_on_stop_file(self):
+        open(os.path.join(self.directory.name, STOP_FILE), 'w').close()
+        summary = run_experiment(tiny_run(epochs=500), self.directory.name,
+                                 stop_check_interval=10)
+
+        self.assertFalse(summary['complete'])
+        self.assertEqual(summary['epochsRun'], 1)
+        self.assertIsNone(summary['validationError'])
+        with h5py.File(os.path.join(self.directory.name, summary['file']), 'r') as file:
+            self.assertNotIn('validation', file)
+
+
+class SweepTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_pending(self):
+        runs = [tiny_run(.01), tiny_run(.02), tiny_run(.03)]
+        sweep = Sweep(runs, self.directory.name, processes=1)
+        index = {runs[0].key: {'complete': True}, runs[1].key: {'complete': False}}
+        self.assertEqual([run.key for run in sweep.pending(index)], [runs[1].key, runs[2].key])
+
+    def test_resumes(self):
+        runs = [tiny_run(.01), tiny_run(.02)]
+        sweep = Sweep(runs[:1], self.directory.name, processes=1, seed=4)
+        sweep.run()
+
+        sweep = Sweep(runs, self.directory.name, processes=1, seed=4)
+        self.assertEqual([run.key for run in sweep.pending(sweep.load_index())], [runs[1].key])
+        index = sweep.run()
+        self.assertTrue(all(summary['complete'] for summary in index.values()))
+        with open(sweep.index_path) as index_file:
+            self.assertEqual(set(json.load(index_file)), {run.key for run in runs})
+        self.assertEqual(index[runs[0].key]['seed'], run_seed(runs[0], 4))
+
+    def test_removes_stale_stop_file(self):
+        open(os.path.join(self.directory.name, STOP_FILE), 'w').close()
+        index = Sweep([tiny_run()], self.directory.name, processes=1).run()
+        self.assertTrue(index[tiny_run().key]['complete'])
+
+
+if __name__ == '__main__':
+    unittest.main()